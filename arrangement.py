@@ -0,0 +1,252 @@
+"""
+Arrangement of the dual lines: every point where two of them cross.
+
+The dual lines of two points in the same half-plane cross at the dual of the
+primal line through both points, so the vertices of the arrangement are all
+the lines through pairs of points. A point (a, b) relative to the origin of
+its half-plane has the dual line
+
+	y = CENTER_Y - b - a*u/SCALE
+
+across the other half-plane, for u from -HALF to HALF relative to that
+half-plane's origin, and the lines of points i and j cross at
+
+	u = SCALE*(b_i - b_j)/(a_j - a_i)
+
+Coordinates are integers, so equal crossings give the same correctly rounded
+float and the sweep can order its events exactly.
+
+sweep() finds the vertices of one half-plane with a Bentley-Ottmann sweep.
+Every dual line spans the whole half-plane, so the only events are
+crossings: the lines are kept in order along the sweep and each crossing
+swaps two neighbours and checks the new neighbours. That is O((n + k) log n)
+for k vertices instead of checking all pairs. While a point is dragged,
+Arrangement.move() only recomputes the crossings of its own line, and the
+points of a live feed are patched in and out the same way.
+"""
+import heapq
+
+import numpy as np
+
+from engine import CENTER_Y, DIVIDER, LEFT_ORIGIN, RIGHT_ORIGIN
+from spatial import PairTable
+
+SCALE = 50			# A dual line falls by a/SCALE per pixel
+HALF = DIVIDER//2	# Half the width of a half-plane
+
+
+def dual_params(xy):
+	"""
+	Split points into the integer coefficients of their dual lines.
+
+	Args:
+		xy: (n, 2) array of point positions
+
+	Returns:
+		Tuple: (a, b, left) (n,) arrays; left is True for points whose dual
+		line is drawn in the right half-plane
+	"""
+	xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+	left = xy[:, 0] <= DIVIDER
+	a = xy[:, 0] - np.where(left, LEFT_ORIGIN, RIGHT_ORIGIN)
+	b = xy[:, 1] - CENTER_Y
+	return a, b, left
+
+def to_world(u, a, b, left):
+	"""
+	Place crossings on the screen.
+
+	Args:
+		u: (k,) crossing positions relative to the origin of the half-plane
+		a: a coefficient of one of the lines through each crossing, scalar or (k,)
+		b: b coefficient of the same line, scalar or (k,)
+		left: Whether the crossing lines belong to left points, scalar or (k,)
+
+	Returns:
+		ndarray: (k, 2) float64 world coordinates
+	"""
+	x = np.where(left, RIGHT_ORIGIN, LEFT_ORIGIN) + u
+	y = CENTER_Y - b - a*u/SCALE
+	return np.stack([x, y], axis=1).astype(np.float64).reshape(-1, 2)
+
+def sweep(a, b, cancelled=None):
+	"""
+	Find every crossing of the dual lines of one half-plane with a sweep
+	from u = -HALF to u = HALF, ends included.
+
+	Lines that are the same (duplicate points) or parallel never cross.
+
+	Args:
+		a: (n,) a coefficients
+		b: (n,) b coefficients
+		cancelled: Event that stops the sweep early when set
+
+	Returns:
+		Tuple: ((k, 2) int64 array of line index pairs, (k,) float64 crossing positions)
+	"""
+	a, b = np.asarray(a).tolist(), np.asarray(b).tolist()
+	n = len(a)
+	lo, hi = -HALF, HALF
+
+	# Order just before the sweep starts: by height, ties by the line that rises faster
+	order = sorted(range(n), key=lambda i: (-a[i]*lo - SCALE*b[i], a[i], i))
+	pos = [0]*n
+	for k, i in enumerate(order):
+		pos[i] = k
+
+	events = []
+	def schedule(k, u):
+		# Line i is above line j on screen and crosses it if j falls faster
+		i, j = order[k], order[k + 1]
+		if a[i] < a[j]:
+			x = SCALE*(b[i] - b[j])/(a[j] - a[i])
+			if u <= x <= hi:
+				heapq.heappush(events, (x, i, j))
+
+	for k in range(n - 1):
+		schedule(k, lo)
+
+	pairs, crossings = [], []
+	count = 0
+	while events:
+		x, i, j = heapq.heappop(events)
+		k = pos[i]
+		if k + 1 >= n or order[k + 1] != j:
+			continue  # The lines stopped being neighbours since the event was scheduled
+		order[k], order[k + 1] = j, i
+		pos[i], pos[j] = k + 1, k
+		pairs.append((i, j))
+		crossings.append(x)
+		if k > 0:
+			schedule(k - 1, x)
+		if k + 2 < n:
+			schedule(k + 1, x)
+		count += 1
+		if cancelled is not None and not count % 65536 and cancelled.is_set():
+			break
+	return np.array(pairs, dtype=np.int64).reshape(-1, 2), np.array(crossings, dtype=np.float64)
+
+def crossings_of(a, b, i):
+	"""
+	Find the crossings of one dual line with the others of its half-plane.
+
+	Args:
+		a: (n,) a coefficients
+		b: (n,) b coefficients
+		i: Index of the line
+
+	Returns:
+		Tuple: ((m,) indices of the lines crossed, (m,) crossing positions)
+	"""
+	with np.errstate(divide='ignore', invalid='ignore'):
+		u = SCALE*(b[i] - b)/(a - a[i])
+	hit = (a != a[i]) & (u >= -HALF) & (u <= HALF)
+	return np.flatnonzero(hit), u[hit]
+
+def build(ids, xy, cancelled=None):
+	"""
+	Compute the arrangement of the dual lines of some points, both
+	half-planes. Only reads its arguments, so it can run on a worker thread.
+
+	Args:
+		ids: (n,) point ids
+		xy: (n, 2) point positions
+		cancelled: Event that stops the work early when set
+
+	Returns:
+		Tuple: ((k, 2) int64 point id pairs, smaller id first, (k, 2) float64 vertex positions)
+	"""
+	ids = np.asarray(ids, dtype=np.int64)
+	a, b, left = dual_params(xy)
+	pairs, positions = [], []
+	for side in (True, False):
+		group = np.flatnonzero(left == side)
+		index, u = sweep(a[group], b[group], cancelled)
+		first = group[index[:, 0]]
+		pairs.append(np.sort(ids[group[index]], axis=1))
+		positions.append(to_world(u, a[first], b[first], side))
+	return np.concatenate(pairs), np.concatenate(positions)
+
+
+class Arrangement:
+	"""
+	Vertices of the dual line arrangement of a scene.
+
+	Attributes:
+		table (PairTable): Ids of the points whose dual lines cross, by vertex position
+		serial (int): Bumped by set(), the vertices of moved points change without it
+		version (int): Scene version the vertices were built for, None before the first build
+		moved (set): Points moved since the last build was started
+	"""
+	def __init__(self):
+		self.table = PairTable()
+		self.serial = 0
+		self.version = None
+		self.moved = set()
+
+	def __len__(self):
+		return len(self.table)
+
+	def set(self, table, version):
+		"""
+		Replace every vertex with the result of build().
+
+		Args:
+			table: PairTable of the pairs and positions from build()
+			version: Scene version the vertices were built for
+		"""
+		self.table = table
+		self.version = version
+		self.serial += 1
+
+	def move(self, scene, points):
+		"""
+		Recompute the vertices on the dual lines of some points after they
+		moved, were added or were deleted. Only the vertices on those lines
+		are touched.
+
+		Args:
+			scene: Scene the points are in
+			points: Ids of the points
+		"""
+		points = list(points)
+		self.moved.update(points)
+		alive = [p for p in points if scene.points.alive[p]]
+		groups = []
+		if alive:
+			ids = scene.points.ids()
+			a, b, left = dual_params(scene.points.xy[ids])
+			halves = [np.flatnonzero(~left), np.flatnonzero(left)]
+			for p in alive:
+				i = int(np.searchsorted(ids, p))
+				group = halves[int(left[i])]
+				index, u = crossings_of(a[group], b[group], int(np.searchsorted(group, i)))
+				groups.append((p, ids[group[index]], to_world(u, a[i], b[i], left[i])))
+		self.table.replace(points, groups)
+
+	def vertices(self, points=None, exclude=()):
+		"""
+		Args:
+			points: Only the vertices on the dual lines of these points, or None for all
+			exclude: Leave out the vertices on the dual lines of these points
+
+		Returns:
+			Tuple: (pairs, xy) (k, 2) point id pairs, smaller id first, and
+			float64 world coordinates of the vertices
+		"""
+		return self.table.get(points, exclude)
+
+	def vertex_at(self, x, y, radius):
+		"""
+		Find the vertex closest to a position within a square hit area, looking
+		only at the cells of the index around it.
+
+		Args:
+			x: World x-coordinate
+			y: World y-coordinate
+			radius: Half the side of the hit square
+
+		Returns:
+			Tuple: ((i, j), (x, y)) point id pair and position of the vertex, or None
+		"""
+		return self.table.nearest(x, y, radius)
@@ -0,0 +1,213 @@
+"""
+Benchmark suite for the duality engine and renderer.
+
+Builds synthetic scenes of points, segments and rays at several sizes and
+times the batch dual transforms, hover hit-tests, view culling, dragging a
+high-degree point, mass deletion and a full frame render. Rendering uses the
+SDL dummy video driver so the suite runs headless. Results are written as JSON:
+
+	python3 bench.py --sizes 1000 10000 100000 -o bench.json
+	python3 bench.py --compare bench.json
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse, json, platform, sys, time
+
+import numpy as np
+
+from engine import Scene, batch_point_duals, batch_segment_duals, batch_ray_duals
+
+
+def random_points(rng, n):
+	"""Random integer screen coordinates spread over both half-planes."""
+	return np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1)
+
+def build_scene(n, seed=0):
+	"""
+	Build a scene with n points, about n/2 segments and n/10 rays.
+
+	Args:
+		n: Number of points
+		seed: Seed for the random generator
+
+	Returns:
+		Scene: The synthetic scene
+	"""
+	rng = np.random.default_rng(seed)
+	scene = Scene()
+	ids = scene.add_points(random_points(rng, n))
+
+	# Pair up points within each half-plane
+	left = ids[scene.points.xy[ids, 0] <= 500]
+	right = ids[scene.points.xy[ids, 0] > 500]
+	for side in (left, right):
+		side = rng.permutation(side)
+		half = len(side)//2
+		scene.add_segments(side[:half], side[half:2*half])
+
+	origins = rng.choice(ids, max(1, n//10))
+	scene.add_rays(origins, random_points(rng, len(origins)))
+	return scene
+
+def timed(fn, repeat=3):
+	"""
+	Time a callable.
+
+	Args:
+		fn: Callable taking no arguments
+		repeat: Number of runs
+
+	Returns:
+		float: Best wall-clock time in seconds
+	"""
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+def bench_duals(n, rng):
+	"""Time the batch transforms on n points, n segments and n rays."""
+	a, b = random_points(rng, n), random_points(rng, n)
+	b[:, 0] = np.where(a[:, 0] <= 500, b[:, 0] % 500, 501 + b[:, 0] % 499)
+	return {
+		'point_duals': timed(lambda: batch_point_duals(a)),
+		'segment_duals': timed(lambda: batch_segment_duals(a, b)),
+		'ray_duals': timed(lambda: batch_ray_duals(a, b)),
+	}
+
+def bench_hit_test(scene, rng, queries=1000):
+	"""Time the three cursor queries done on every frame, per frame."""
+	cursor = random_points(rng, queries).tolist()
+	def run():
+		for mx, my in cursor:
+			scene.points_at(mx, my)
+			scene.segment_duals_at(mx, my)
+			scene.ray_duals_at(mx, my)
+	return timed(run)/queries
+
+def bench_drag(scene, rng, degree, frames=100):
+	"""Connect one point to `degree` others and time moving it, per frame."""
+	hub = int(scene.add_points([[250, 250]])[0])
+	others = scene.add_points(np.stack([rng.integers(0, 495, degree), rng.integers(0, 500, degree)], axis=1))
+	scene.add_segments(np.full(degree, hub), others)
+	seg_changed, ray_changed = scene.incident(hub)
+	path = np.stack([rng.integers(10, 490, frames), rng.integers(10, 490, frames)], axis=1).tolist()
+	def run():
+		for x, y in path:
+			scene.move_point(hub, x, y, seg_changed, ray_changed)
+	return timed(run, repeat=1)/frames
+
+def bench_delete(scene, rng, fraction=0.1):
+	"""Time deleting a random fraction of the points, per point."""
+	victims = rng.choice(scene.points.ids(), max(1, int(len(scene.points)*fraction)), replace=False).tolist()
+	start = time.perf_counter()
+	for p in victims:
+		scene.delete_point(p)
+	return (time.perf_counter() - start)/len(victims)
+
+def bench_cull(scene):
+	"""
+	Time finding what shows up in the view: at the default view, zoomed in
+	all the way on the middle of both half-planes, and zoomed in past the
+	top of every dual line, where little shows up whatever the size.
+	"""
+	from viewport import MAX_ZOOM, Culler, View
+	culler = Culler()
+	views = {'cull': View(), 'cull_zoomed': View(), 'cull_offscreen': View()}
+	for viewport in views['cull_zoomed'].halves + views['cull_offscreen'].halves:
+		viewport.zoom_at(250 + 500*viewport.half, 250, MAX_ZOOM)
+	for viewport in views['cull_offscreen'].halves:
+		viewport.pan_to(viewport.cx, -2000)
+	culler.visible(scene, views['cull'])  # Builds the segment index
+	return {name: timed(lambda: culler.visible(scene, view)) for name, view in views.items()}
+
+def bench_render(scene):
+	"""Time redrawing the whole frame from scratch with the dummy driver."""
+	import pygame
+	from render import Renderer
+	pygame.display.init()
+	screen = pygame.display.set_mode((1000, 500))
+	renderer = Renderer(screen, scene)
+	def run():
+		renderer.invalidate()
+		renderer.frame_key = None
+		renderer.draw(-100, -100)
+	return timed(run, repeat=1)
+
+def run_suite(sizes, render_max, seed=0):
+	"""
+	Run every benchmark at every size.
+
+	Args:
+		sizes: Scene sizes (number of points)
+		render_max: Largest size the full render benchmark runs at
+		seed: Seed for the random generators
+
+	Returns:
+		list: One dict per (benchmark, size)
+	"""
+	results = []
+	def record(name, n, seconds):
+		results.append({'name': name, 'n': n, 'seconds': seconds})
+		print(f'{name:>16} n={n:<8} {seconds*1e3:10.3f} ms', file=sys.stderr)
+
+	for n in sizes:
+		rng = np.random.default_rng(seed)
+		for name, seconds in bench_duals(n, rng).items():
+			record(name, n, seconds)
+
+		start = time.perf_counter()
+		scene = build_scene(n, seed)
+		record('build_scene', n, time.perf_counter() - start)
+		record('hit_test', n, bench_hit_test(scene, rng))
+		for name, seconds in bench_cull(scene).items():
+			record(name, n, seconds)
+		if n <= render_max:
+			record('render', n, bench_render(scene))
+		record('drag', n, bench_drag(scene, rng, min(n, 10000)))
+		record('delete', n, bench_delete(scene, rng))
+	return results
+
+def compare(old, new):
+	"""Print the ratio new/old for every benchmark found in both runs."""
+	before = {(r['name'], r['n']): r['seconds'] for r in old['results']}
+	for r in new['results']:
+		key = (r['name'], r['n'])
+		if key in before and before[key] > 0:
+			print(f"{r['name']:>16} n={r['n']:<8} {r['seconds']/before[key]:6.2f}x")
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+						help='scene sizes in points')
+	parser.add_argument('--render-max', type=int, default=100000,
+						help='skip the full render benchmark above this size')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('-o', '--output', help='write results to this JSON file instead of stdout')
+	parser.add_argument('--compare', metavar='JSON', help='print the ratio to an earlier run')
+	args = parser.parse_args(argv)
+
+	report = {
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'machine': platform.machine(),
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'results': run_suite(args.sizes, args.render_max, args.seed),
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1)
+	else:
+		json.dump(report, sys.stdout, indent=1)
+		print()
+	if args.compare:
+		with open(args.compare) as f:
+			compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+	main()
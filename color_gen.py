@@ -1,6 +1,16 @@
 import random
 
-def gen_color():
+def gen_color(seed=None):
+    """
+    Shuffle the palette that new primitives take their colors from.
+
+    Args:
+        seed: Seed of the shuffle, so a recorded session can be replayed
+            with the same colors; random if None
+
+    Returns:
+        list: RGB colors
+    """
     color_pallete = [
     # Red
     (255, 235, 238),  # 50
@@ -258,5 +268,5 @@ def gen_color():
     (255, 61, 0),     # A400
     (221, 44, 0),     # A700
 ]
-    random.shuffle(color_pallete)
+    random.Random(seed).shuffle(color_pallete)
     return color_pallete
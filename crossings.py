@@ -0,0 +1,351 @@
+"""
+Crossings of the primal segments: every pair of segments that intersect.
+
+Two segments of a half-plane cross at a point whose dual line passes through
+both segment duals, so every crossing in the primal is a line through two
+dual points in the dual, and the two wedges hold each other's dual point.
+
+sweep() finds the crossings of one half-plane with a Bentley-Ottmann sweep
+in O((n + k) log n) for n segments and k crossings. The sweep runs over
+x' = shear*x + y instead of x, which orders points like (x, y) and leaves no
+segment vertical, and all positions are exact fractions of the integer
+coordinates. Every event point handles the segments that start, end or pass
+through it together, so touching endpoints, several segments through one
+point and overlapping collinear segments are all reported. While a segment
+endpoint is dragged, Crossings.move() only retests the dragged segments.
+
+Segments that share an endpoint meet there by construction and are not
+reported as crossing.
+"""
+import heapq
+from fractions import Fraction
+from math import gcd
+
+import numpy as np
+
+from engine import DIVIDER
+from spatial import PairTable
+
+
+def _shear(coords):
+	"""Factor that makes x' = shear*x + y order integer points like (x, y)."""
+	return 2*int(np.abs(coords[:, [1, 3]]).max(initial=0)) + 1
+
+def sweep(coords, cancelled=None):
+	"""
+	Find every pair of intersecting segments with a sweep.
+
+	Segments of length 0 are left out.
+
+	Args:
+		coords: (n, 4) integer [x0, y0, x1, y1] segments
+		cancelled: Event that stops the sweep early when set
+
+	Returns:
+		Tuple: ((k, 2) int64 array of segment index pairs, smaller index
+		first, (k, 2) float64 array of one point both segments share)
+	"""
+	coords = np.asarray(coords, dtype=np.int64).reshape(-1, 4)
+	shear = _shear(coords)
+	start, end = [], []
+	for x0, y0, x1, y1 in coords.tolist():
+		p, q = (shear*x0 + y0, y0), (shear*x1 + y1, y1)
+		start.append(min(p, q))
+		end.append(max(p, q))
+
+	# Each event point keeps the segments that start there
+	events = {}
+	heap = []
+	def push(point, starting=None):
+		if point not in events:
+			events[point] = []
+			heapq.heappush(heap, point)
+		if starting is not None:
+			events[point].append(starting)
+
+	for i in range(len(start)):
+		if start[i] != end[i]:
+			push(start[i], i)
+			push(end[i])
+
+	def side(i, px, py, w):
+		# Sign of the height of segment i at px/w relative to py/w
+		(x0, y0), (x1, y1) = start[i], end[i]
+		v = (y0*w - py)*(x1 - x0) + (px - x0*w)*(y1 - y0)
+		return (v > 0) - (v < 0)
+
+	def slope(i):
+		(x0, y0), (x1, y1) = start[i], end[i]
+		return Fraction(y1 - y0, x1 - x0)
+
+	def check(i, j, p):
+		# Schedule the crossing of two neighbours if it is past the sweep
+		(ax, ay), (bx, by) = start[i], end[i]
+		(cx, cy), (dx, dy) = start[j], end[j]
+		rx, ry, sx, sy = bx - ax, by - ay, dx - cx, dy - cy
+		d = rx*sy - ry*sx
+		if d == 0:
+			return  # Parallel, collinear overlaps meet at an endpoint event
+		t = (cx - ax)*sy - (cy - ay)*sx
+		u = (cx - ax)*ry - (cy - ay)*rx
+		if d < 0:
+			d, t, u = -d, -t, -u
+		if 0 <= t <= d and 0 <= u <= d:
+			point = (Fraction(ax*d + t*rx, d), Fraction(ay*d + t*ry, d))
+			if point > p:
+				push(point)
+
+	status = []
+	found = {}
+	count = 0
+	while heap:
+		p = heapq.heappop(heap)
+		starting = events.pop(p)
+		# The event point as integers over a common denominator
+		px, py = p
+		w = 1
+		if type(px) is Fraction or type(py) is Fraction:
+			px, py = Fraction(px), Fraction(py)
+			w = px.denominator*py.denominator//gcd(px.denominator, py.denominator)
+			px, py = px.numerator*(w//px.denominator), py.numerator*(w//py.denominator)
+
+		# Segments through p are together in the status, between lo and hi
+		lo, hi = 0, len(status)
+		while lo < hi:
+			mid = (lo + hi)//2
+			if side(status[mid], px, py, w) < 0:
+				lo = mid + 1
+			else:
+				hi = mid
+		hi = lo
+		while hi < len(status) and side(status[hi], px, py, w) == 0:
+			hi += 1
+
+		through = status[lo:hi]
+		meeting = starting + through
+		if len(meeting) > 1:
+			point = ((px - py)/(w*shear), py/w)
+			for a in range(len(meeting)):
+				for b in range(a + 1, len(meeting)):
+					found.setdefault((min(meeting[a], meeting[b]), max(meeting[a], meeting[b])), point)
+
+		# Segments that go on past p are reinserted in their order just after it
+		going = sorted([i for i in through if end[i] != p] + starting, key=lambda i: (slope(i), i))
+		status[lo:hi] = going
+		if not going:
+			if 0 < lo < len(status):
+				check(status[lo - 1], status[lo], p)
+		else:
+			if lo > 0:
+				check(status[lo - 1], going[0], p)
+			if lo + len(going) < len(status):
+				check(going[-1], status[lo + len(going)], p)
+
+		count += 1
+		if cancelled is not None and not count % 65536 and cancelled.is_set():
+			break
+
+	pairs = np.array(list(found), dtype=np.int64).reshape(-1, 2)
+	points = np.array(list(found.values()), dtype=np.float64).reshape(-1, 2)
+	return pairs, points
+
+def _orient(ax, ay, bx, by, cx, cy):
+	return np.sign((bx - ax)*(cy - ay) - (by - ay)*(cx - ax))
+
+def crossings_of(coords, i):
+	"""
+	Find the segments that intersect one segment, testing all of them at once.
+
+	Args:
+		coords: (n, 4) integer segments
+		i: Index of the segment
+
+	Returns:
+		Tuple: ((m,) indices of the segments hit, (m, 2) float64 points shared with each)
+	"""
+	c = np.asarray(coords, dtype=np.int64).reshape(-1, 4)
+	ax, ay, bx, by = c[i].tolist()
+	cx, cy, dx, dy = c.T
+	o1, o2 = _orient(ax, ay, bx, by, cx, cy), _orient(ax, ay, bx, by, dx, dy)
+	o3, o4 = _orient(cx, cy, dx, dy, ax, ay), _orient(cx, cy, dx, dy, bx, by)
+	collinear = (o1 == 0) & (o2 == 0)
+
+	# Collinear segments meet if their boxes overlap, the others if each straddles the other
+	shear = _shear(np.concatenate([c, [[ax, ay, bx, by]]]))
+	s0, s1 = sorted([shear*ax + ay, shear*bx + by])
+	t0, t1 = np.minimum(shear*cx + cy, shear*dx + dy), np.maximum(shear*cx + cy, shear*dx + dy)
+	hit = np.where(collinear, (t0 <= s1) & (s0 <= t1), (o1*o2 <= 0) & (o3*o4 <= 0))
+	hit &= (cx != dx) | (cy != dy)
+	hit[i] = False
+	if ax == bx and ay == by:
+		hit[:] = False
+	index = np.flatnonzero(hit)
+
+	cx, cy, dx, dy, collinear = cx[index], cy[index], dx[index], dy[index], collinear[index]
+	rx, ry, sx, sy = bx - ax, by - ay, dx - cx, dy - cy
+	with np.errstate(divide='ignore', invalid='ignore'):
+		t = ((cx - ax)*sy - (cy - ay)*sx)/(rx*sy - ry*sx)
+	# Overlapping collinear segments are marked where the overlap starts
+	first = np.maximum(s0, t0[index])
+	y = _wrap(first, shear)
+	overlap = np.stack([(first - y)//shear, y], axis=1)
+	point = np.stack([ax + t*rx, ay + t*ry], axis=1)
+	return index, np.where(collinear[:, None], overlap, point)
+
+def _wrap(v, shear):
+	"""Recover y from x' = shear*x + y, |y| being at most shear//2."""
+	return (v + shear//2) % shear - shear//2
+
+def build(ids, coords, eps, cancelled=None):
+	"""
+	Compute the crossings of some segments, both half-planes. Only reads its
+	arguments, so it can run on a worker thread.
+
+	Args:
+		ids: (n,) segment ids
+		coords: (n, 4) segment coordinates
+		eps: (n, 2) endpoint ids of the segments
+		cancelled: Event that stops the work early when set
+
+	Returns:
+		Tuple: ((k, 2) int64 segment id pairs, smaller id first, (k, 2) float64 crossing positions)
+	"""
+	ids = np.asarray(ids, dtype=np.int64)
+	coords = np.asarray(coords, dtype=np.int64).reshape(-1, 4)
+	eps = np.asarray(eps, dtype=np.int64).reshape(-1, 2)
+	pairs, positions = [], []
+	for side in (False, True):
+		group = np.flatnonzero((coords[:, 0] > DIVIDER) == side)
+		index, xy = sweep(coords[group], cancelled)
+		index = group[index]
+		keep = ~_share(eps[index[:, 0]], eps[index[:, 1]])
+		pairs.append(np.sort(ids[index[keep]], axis=1))
+		positions.append(xy[keep])
+	return np.concatenate(pairs), np.concatenate(positions)
+
+def _share(eps_1, eps_2):
+	"""Whether segments share an endpoint, row by row."""
+	return (eps_1[:, :1] == eps_2).any(axis=1) | (eps_1[:, 1:] == eps_2).any(axis=1)
+
+
+class Crossings:
+	"""
+	Crossings of the segments of a scene.
+
+	Segments deleted or added after a build keep the crossings that were
+	found for their ids until the next build is set, so every lookup skips
+	the crossings of segments that are gone or no longer where they were
+	when their crossings were found.
+
+	Attributes:
+		table (PairTable): Ids of the segments that cross, by crossing position
+		coords (ndarray): (n, 4) coordinates each segment id had when its
+			crossings were found, -1 for ids without any
+		serial (int): Bumped by set(), the crossings of moved segments change without it
+		version (int): Scene version the crossings were built for, None before the first build
+		moved (set): Segments moved since the last build was started
+	"""
+	def __init__(self):
+		self.table = PairTable()
+		self.coords = np.full((0, 4), -1, dtype=np.int64)
+		self.serial = 0
+		self.version = None
+		self.moved = set()
+
+	def __len__(self):
+		return len(self.table)
+
+	def set(self, table, version, ids, coords):
+		"""
+		Replace every crossing with the result of build().
+
+		Args:
+			table: PairTable of the pairs and positions from build()
+			version: Scene version the crossings were built for
+			ids: (n,) ids of the segments build() was given
+			coords: (n, 4) their coordinates
+		"""
+		self.table = table
+		self.coords = np.full((int(ids.max(initial=-1)) + 1, 4), -1, dtype=np.int64)
+		self.coords[ids] = coords
+		self.version = version
+		self.serial += 1
+
+	def move(self, scene, segments):
+		"""
+		Recompute the crossings of some segments after an endpoint moved.
+		Only the crossings of those segments are touched.
+
+		Args:
+			scene: Scene the segments are in
+			segments: Ids of the segments
+		"""
+		segments = list(segments)
+		self.moved.update(segments)
+		if segments and max(segments) >= len(self.coords):
+			grown = np.full((max(max(segments) + 1, 2*len(self.coords)), 4), -1, dtype=np.int64)
+			grown[:len(self.coords)] = self.coords
+			self.coords = grown
+		self.coords[segments] = -1
+		alive = [s for s in segments if scene.segments.alive[s]]
+		groups = []
+		if alive:
+			ids = scene.segments.ids()
+			coords = scene.segments.coords[ids].astype(np.int64)
+			eps = scene.segments.eps[ids].astype(np.int64)
+			right = coords[:, 0] > DIVIDER
+			halves = [np.flatnonzero(~right), np.flatnonzero(right)]
+			for s in alive:
+				i = int(np.searchsorted(ids, s))
+				group = halves[int(right[i])]
+				index, xy = crossings_of(coords[group], int(np.searchsorted(group, i)))
+				index = group[index]
+				keep = ~_share(eps[index], eps[[i]])
+				groups.append((s, ids[index[keep]], xy[keep]))
+				self.coords[s] = coords[i]
+		self.table.replace(segments, groups)
+
+	def current(self, scene, pairs):
+		"""
+		Returns:
+			ndarray: (k,) bool mask of the pairs whose segments are both still
+			alive and where they were when the crossing was found
+		"""
+		segments = scene.segments
+		known = (pairs < min(len(self.coords), len(segments.alive))).all(axis=1)
+		pairs = np.where(known[:, None], pairs, 0)
+		if not known.any():
+			return known
+		return (known & segments.alive[pairs].all(axis=1)
+			& (self.coords[pairs] == segments.coords[pairs]).all(axis=(1, 2)))
+
+	def crossings(self, scene, segments=None, exclude=()):
+		"""
+		Args:
+			scene: Scene the segments are in
+			segments: Only the crossings of these segments, or None for all
+			exclude: Leave out the crossings of these segments
+
+		Returns:
+			Tuple: (pairs, xy) (k, 2) segment id pairs, smaller id first, and
+			float64 world coordinates of the crossings
+		"""
+		pairs, xy = self.table.get(segments, exclude)
+		keep = self.current(scene, pairs)
+		return pairs[keep], xy[keep]
+
+	def crossing_at(self, scene, x, y, radius):
+		"""
+		Find the crossing closest to a position within a square hit area, looking
+		only at the cells of the index around it.
+
+		Args:
+			scene: Scene the segments are in
+			x: World x-coordinate
+			y: World y-coordinate
+			radius: Half the side of the hit square
+
+		Returns:
+			Tuple: ((s, t), (x, y)) segment id pair and position of the crossing, or None
+		"""
+		return self.table.nearest(x, y, radius, lambda pairs: self.current(scene, pairs))
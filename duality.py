@@ -1,688 +1,759 @@
-import pygame, sys
+import pygame, random, sys
+import numpy as np
 from pygame.locals import *
+import settings
 from color_gen import gen_color
-
-# Initialize pygame window and clock
-screen = pygame.display.set_mode((1000, 500))
-clock = pygame.time.Clock()
-
-# Data structures for storing geometric elements
-all_points = []	   # Stores points in primal space
-point_dual = []	   # Stores dual lines for each point
-segments = []		 # Stores line segments in primal space
-segment_dual = []	 # Stores dual points for line segments
-segment_eps = []	  # Stores endpoint indices for segments
-wedges = []		   # Stores wedge regions for segment duals
-rays = []			 # Stores rays in primal space
-ray_dual = []		 # Stores dual points for rays
-ray_wedges = []	   # Stores wedge regions for ray duals
-ray_eps = []		  # Stores endpoint coordinates for rays
-color_pallete = gen_color()  # Generate color palette
-color_pt = 0		  # Current color index
-
-
-class Point(pygame.sprite.Sprite):
-	"""
-	Represents a point in the geometric space.
-	
-	Attributes:
-		x (int): X-coordinate of the point
-		y (int): Y-coordinate of the point
-		rect (Rect): Rectangular area for collision detection
-		color (tuple): RGB color value
+from arrangement import Arrangement, build
+from crossings import Crossings, build as build_crossings
+from engine import DIVIDER, POINT_RADIUS, Scene
+from feed import Feed, read_feed
+from history import History
+from hull import Hulls
+from importer import add_chunk, parse_file
+from scenefile import load_scene, save_scene
+from spatial import PairTable
+from profiler import FrameProfiler
+from replay import Recorder
+from render import Renderer
+from viewport import View
+from workers import WorkerPool
+
+CAPTION = 'Duality'
+FEED_EVENT = pygame.event.custom_type()	# Posted by the feed reader to wake an idle main loop
+
+
+def coalesce_motion(events):
 	"""
-	def __init__(self, x, y):
-		self.x = x
-		self.y = y
-		self.rect = Rect(x-5, y-5, 10, 10)  # Create collision rectangle around point
-		self.color = (255, 255, 255)		# Default color (white)
+	Collapse a burst of MOUSEMOTION events into the last one.
 
-class Line(pygame.sprite.Sprite):
-	"""
-	Represents a line in the dual space.
-	
-	Attributes:
-		startx (int): X-coordinate of start point
-		starty (int): Y-coordinate of start point
-		endx (int): X-coordinate of end point
-		endy (int): Y-coordinate of end point
-		color (tuple): RGB color value
-	"""
-	def __init__(self, px, py, sx, ex):
-		# Calculate line endpoints based on point-line duality transformation
-		self.startx = sx
-		self.starty = 250 + (((px*(5)))-py)
-		self.endx = ex
-		self.endy = 250 + ((px*-5) - py)
-		self.color = (255, 255, 255)  # Default color (white)
-
-def draw_polygon_alpha(surface, color, points):
-	"""
-	Draw a semi-transparent polygon on the given surface.
-	
 	Args:
-		surface: Pygame surface to draw on
-		color: RGB or RGBA color value
-		points: List of (x,y) tuples defining polygon vertices
-	"""
-	# Calculate bounds for the target rectangle
-	lx, ly = zip(*points)
-	min_x, min_y, max_x, max_y = min(lx), min(ly), max(lx), max(ly)
-	target_rect = pygame.Rect(min_x, min_y, max_x - min_x, max_y - min_y)
-	
-	# Create a transparent surface for the polygon
-	shape_surf = pygame.Surface(target_rect.size, pygame.SRCALPHA)
-	# Draw polygon on transparent surface, shifted to origin
-	pygame.draw.polygon(shape_surf, color, [(x - min_x, y - min_y) for x, y in points])
-	# Blit the polygon onto the main surface
-	surface.blit(shape_surf, target_rect)
-
-def get_segment_dual(e1, e2):
-	"""
-	Calculate the dual point of a line segment defined by two endpoints.
-	
-	Args:
-		e1: First endpoint coordinates [x, y]
-		e2: Second endpoint coordinates [x, y]
-		
+		events: List of pygame events in arrival order
+
 	Returns:
-		Point: Dual point representing the line segment
+		list: Every other event in order, followed by the last motion event
 	"""
-	x_0, y_0 = e1[0], e1[1]
-	x_1, y_1 = e2[0], e2[1]
-
-	# Adjust x-coordinates based on which half of the screen they're in
-	if x_0 <= 500:
-		x_0 = x_0 - 250
-		x_1 = x_1 - 250
-		x_flag = 0
-	else:
-		x_0 = x_0 - 750
-		x_1 = x_1 - 750
-		x_flag = 1
-	
-	# Adjust y-coordinates to center
-	y_0 = y_0 - 250
-	y_1 = y_1 - 250
-
-	# Prevent division by zero for vertical lines
-	if x_0 == x_1: x_1 += 1
-
-	# Calculate slope of the line
-	m = (y_1 - y_0)/(x_1 - x_0)
-	
-	# Calculate x-coordinate of dual point based on which side we're working on
-	if x_flag == 0:
-		x = int(750 + m*-50)
-	elif x_flag == 1:
-		x = int(250 + m*-50)
-	
-	# Calculate y-coordinate of dual point
-	y = 250 + int(m*x_0 - y_0)
-
-	# Handle out-of-bounds cases
-	if x_flag == 0 and x < 500:
-		x = 1500
-	elif x_flag == 1 and x > 500:
-		x = -10
-
-	return Point(x, y)
-
-def get_ray(coords):
+	kept = [event for event in events if event.type != pygame.MOUSEMOTION]
+	motion = [event for event in events if event.type == pygame.MOUSEMOTION]
+	return kept + motion[-1:]
+
+
+class App:
 	"""
-	Calculate the endpoint of a ray given its origin and direction.
-	
-	Args:
-		coords: List [ox, oy, mx, my] with ray origin (ox, oy) and mouse position (mx, my)
-		
-	Returns:
-		List: Coordinates [ox, oy, ex, ey] for ray from origin to edge of display
+	Pygame front end over a Scene: turns mouse and keyboard input into scene
+	edits and draws both half-planes.
+
+	Attributes:
+		screen (Surface): Display surface
+		clock (Clock): Frame clock
+		scene (Scene): Geometric elements on both half-planes
+		profiler (FrameProfiler): Per-frame phase timings
+		renderer (Renderer): Draws the scene with a cached background
+		view (View): Pan and zoom of both half-planes
+		pan (tuple): (half, screen x, screen y, cx, cy) where a middle-button pan started, or None
+		point_selected (int): Currently selected (dragged) point
+		seg_selected (bool): Flag for segments attached to the dragged point
+		end_point_1 (int): First point for segment creation
+		end_point_2 (int): Second point for segment creation
+		ray_drawn (bool): Flag for ray drawing mode
+		ray_selected (int): Ray currently being placed
+		ray_redrawn (bool): Flag for rays attached to the dragged point
+		seg_changed (list): [segment id, endpoint slot] pairs attached to the dragged point
+		ray_changed (list): Ray ids attached to the dragged point
+		selection (ndarray): Ids of the points picked with a box or lasso, in increasing order
+		selection_drag (tuple): (world x, world y, dx, dy, segment ids, ray ids) while the
+			selection is dragged: where the drag started, how far the points were
+			moved so far and the primitives attached to them; None otherwise
+		band (tuple): ('box' or 'lasso', half, screen positions) while a
+			selection is being drawn, or None
+		workers (WorkerPool): Background jobs, their results are applied between frames
+		arrangement (Arrangement): Dual line arrangement being shown, or None
+		arrangement_job (tuple): (scene version, Job) of the last arrangement build started, or None
+		hulls (Hulls): Convex hulls and dual envelopes being shown, or None
+		crossings (Crossings): Segment crossings being shown, or None
+		crossings_job (tuple): (scene version, Job) of the last crossings build started, or None
+		feed (Feed): Rolling window of the live feed being read, or None
+		feed_job (Job): Job reading the live feed, or None
+		history (History): Edits of the scene that can be undone
+		recorder (Recorder): Records the input of every frame for replay.py, or None
 	"""
-	ox, oy = coords[0], coords[1]  # Origin coordinates
-	mx, my = coords[2], coords[3]  # Mouse coordinates (direction)
-	
-	# Determine bounds based on which half of the screen the ray originates
-	if ox <= 500:
-		min_x = 0
-		max_x = 500
-	elif ox > 500:
-		min_x = 500
-		max_x = 1000
-
-	# Prevent division by zero for vertical rays
-	if ox == mx:
-		ox += 1
-	
-	# Calculate slope and y-intercept of ray
-	m = (my - oy)/(mx - ox)
-	b = int(my - m*mx)
-	
-	# Calculate endpoint based on ray direction
-	if mx > ox:
-		ey = int(m*max_x + b)
-		ex = max_x
-	elif mx < ox:
-		ey = int(m*min_x + b)
-		ex = min_x
-
-	return [ox, oy, ex, ey]
-
-# State variables for tracking user interaction
-point_selected = None  # Currently selected point
-seg_selected = None	# Flag for segment selection
-end_point_1 = None	 # First point for segment creation
-end_point_2 = None	 # Second point for segment creation
-ray_drawn = False	  # Flag for ray drawing mode
-ray_selected = None	# Currently selected ray
-ray_redrawn = False	# Flag for ray redrawing
-
-# Main game loop
-while True:
-	screen.fill((0,0,0))  # Clear screen (black background)
-
-	# Get current mouse position
-	mx, my = pygame.mouse.get_pos()
-	mx, my = int(mx), int(my)
-
-	# Draw grid lines and separators
-	pygame.draw.line(screen, (128, 128, 128), (500, 0), (500, 500), 7)  # Central divider
-	pygame.draw.line(screen, (64, 64, 64), (250, 0), (250, 500), 3)	 # Left quarter line
-	pygame.draw.line(screen, (64, 64, 64), (750, 0), (750, 500), 3)	 # Right quarter line
-	pygame.draw.line(screen, (64, 64, 64), (0, 250), (1000, 250), 3)	# Horizontal center line
-
-	# Event handling
-	for event in pygame.event.get():
+	def __init__(self, screen, scene=None):
+		self.screen = screen
+		self.clock = pygame.time.Clock()
+		self.scene = scene if scene is not None else Scene()
+		self.profiler = FrameProfiler()
+		self.view = View()
+		self.pan = None
+		self.workers = WorkerPool()
+		self.renderer = Renderer(screen, self.scene, self.profiler, self.view, self.workers)
+		self.arrangement = None
+		self.arrangement_job = None
+		self.hulls = None
+		self.crossings = None
+		self.crossings_job = None
+		self.feed = None
+		self.feed_job = None
+		self.history = History()
+		self.recorder = None
+		self.reset_selection()
+
+	def set_scene(self, scene):
+		"""
+		Replace the scene being edited.
+
+		Args:
+			scene: New Scene
+		"""
+		self.scene = scene
+		self.workers.cancel_all()
+		self.renderer.set_scene(scene)
+		if self.arrangement is not None:
+			# The vertices of the old scene are of no use, start over
+			self.arrangement = self.renderer.arrangement = Arrangement()
+			self.arrangement_job = None
+		if self.hulls is not None:
+			self.hulls = self.renderer.hulls = Hulls()
+		if self.crossings is not None:
+			self.crossings = self.renderer.crossings = Crossings()
+			self.crossings_job = None
+		if self.feed is not None:
+			self.feed.reset(scene)
+		self.history.reset()
+		self.reset_selection()
+
+	def open(self, path):
+		"""
+		Import a CSV or NDJSON file into the scene, or load a scene file, in
+		the background.
+
+		Args:
+			path: File to open, imported if it ends in .csv, .ndjson or .jsonl
+		"""
+		if path.endswith(('.csv', '.ndjson', '.jsonl')):
+			self.start_import(path)
+		else:
+			self.start_load(path)
+
+	def start_import(self, path):
+		"""
+		Stream a CSV or NDJSON file into the scene in the background. Chunks
+		are parsed on a worker thread and added between frames, so the partial
+		scene is shown while it loads.
+
+		Args:
+			path: File to import
+		"""
+		self.workers.submit(f'Importing {path}', lambda job: parse_file(path, progress=job.report),
+							self._import_chunk)
+
+	def _import_chunk(self, arrays):
+		# Imported primitives may take the ids of deleted ones that edits refer to
+		add_chunk(self.scene, arrays)
+		self.history.reset()
+
+	def start_load(self, path):
+		"""
+		Load a scene file in the background and switch to it once it is read.
+
+		Args:
+			path: Scene file
+		"""
+		self.workers.submit(f'Loading {path}', lambda job: [load_scene(path)], self.set_scene)
+
+	def start_feed(self, source):
+		"""
+		Stream points from standard input or a local socket into the scene,
+		keeping only the latest ones (settings.FEED_MAX_POINTS points and
+		settings.FEED_SECONDS seconds). Replaces the feed being read, if any.
+
+		Args:
+			source: '-' for standard input or 'tcp:[HOST:]PORT' to listen on
+		"""
+		if self.feed_job is not None:
+			self.feed_job.cancel()
+		self.feed = Feed(self.scene)
+		self.feed_job = self.workers.submit(f'Feed {source}', lambda job: self._read_feed(source, job),
+											self._feed_batch, dedicated=True)
+
+	@staticmethod
+	def _read_feed(source, job):
+		# Runs on the reader thread. A batch is on the result queue once the
+		# next one is asked for, so the loop woken then finds it
+		for xy in read_feed(source, job.cancelled):
+			yield xy
+			pygame.event.post(pygame.event.Event(FEED_EVENT))
+
+	def _feed_batch(self, xy):
+		version, segments = self.scene.version, len(self.scene.segments)
+		added, evicted = self.feed.add(xy)
+		self._follow_points(version, segments, np.unique(np.concatenate([added, evicted])))
+
+	def _follow_points(self, version, segments, points):
+		"""
+		Bring the selection and the analyses in step with points that were
+		added or deleted in bulk since the scene was at a version, without
+		rebuilding the analyses, so a live feed does not restart them. The
+		edits before can no longer be undone, as the feed reuses the ids of
+		deleted points.
+
+		Args:
+			version: Scene version before the points changed
+			segments: Number of segments at that version
+			points: Ids of the points added or deleted
+		"""
+		scene = self.scene
+		self.history.reset()
+		if (any(p is not None and p not in scene.points for p in (self.point_selected, self.end_point_1))
+				or (self.ray_selected is not None and self.ray_selected not in scene.rays)
+				or any(s not in scene.segments for s, slot in self.seg_changed)
+				or not scene.points.alive[self.selection].all()):
+			self.reset_selection()
+
+		arrangement = self.arrangement
+		if arrangement is not None:
+			if arrangement.version == version:
+				arrangement.move(scene, points)
+				arrangement.version = scene.version
+			elif self.arrangement_job is not None and self.arrangement_job[0] == version:
+				# The build under way is patched with these points when it is done
+				arrangement.moved.update(points.tolist())
+				self.arrangement_job = (scene.version, self.arrangement_job[1])
+
+		# Deleting points only takes segments with them if they had any
+		crossings = self.crossings
+		if crossings is not None and len(scene.segments) == segments:
+			if crossings.version == version:
+				crossings.version = scene.version
+			elif self.crossings_job is not None and self.crossings_job[0] == version:
+				self.crossings_job = (scene.version, self.crossings_job[1])
+
+	def toggle_arrangement(self):
+		"""Show or hide the vertices of the dual line arrangement."""
+		if self.arrangement is None:
+			self.arrangement = Arrangement()
+		else:
+			self.arrangement = None
+			if self.arrangement_job is not None:
+				self.arrangement_job[1].cancel()
+			self.arrangement_job = None
+		self.renderer.arrangement = self.arrangement
+
+	def toggle_hulls(self):
+		"""Show or hide the convex hulls and the envelopes of their dual lines."""
+		self.hulls = Hulls() if self.hulls is None else None
+		self.renderer.hulls = self.hulls
+
+	def update_arrangement(self):
+		"""Rebuild the arrangement in the background after the scene was edited."""
+		arrangement = self.arrangement
+		version = self.scene.version
+		if arrangement is None or arrangement.version == version:
+			return
+		if self.arrangement_job is not None:
+			if self.arrangement_job[0] == version:
+				return
+			self.arrangement_job[1].cancel()
+
+		# Points dragged while the build runs are patched in when it is done
+		ids = self.scene.points.ids()
+		xy = self.scene.points.xy[ids]
+		arrangement.moved = set()
+		def work(job):
+			# The indexes of the vertices by position and by point are sorted on the worker too
+			yield PairTable(*build(ids, xy, job.cancelled))
+		job = self.workers.submit('Arrangement', work, lambda result: self._arrangement_ready(arrangement, result))
+		self.arrangement_job = (version, job)
+
+	def _arrangement_ready(self, arrangement, result):
+		if arrangement is not self.arrangement:
+			return
+		# Points fed in during the build moved the version the build stands for
+		moved = arrangement.moved
+		arrangement.set(result, self.arrangement_job[0])
+		arrangement.move(self.scene, moved)
+
+	def toggle_crossings(self):
+		"""Show or hide the crossings of the segments."""
+		if self.crossings is None:
+			self.crossings = Crossings()
+		else:
+			self.crossings = None
+			if self.crossings_job is not None:
+				self.crossings_job[1].cancel()
+			self.crossings_job = None
+		self.renderer.crossings = self.crossings
+
+	def update_crossings(self):
+		"""Find the segment crossings again in the background after the scene was edited."""
+		crossings = self.crossings
+		version = self.scene.version
+		if crossings is None or crossings.version == version:
+			return
+		if self.crossings_job is not None:
+			if self.crossings_job[0] == version:
+				return
+			self.crossings_job[1].cancel()
+
+		# Segments dragged while the sweep runs are patched in when it is done
+		ids = self.scene.segments.ids()
+		coords = self.scene.segments.coords[ids]
+		eps = self.scene.segments.eps[ids]
+		crossings.moved = set()
+		def work(job):
+			# Crossings are only shown while their segments are where the sweep saw them
+			yield PairTable(*build_crossings(ids, coords, eps, job.cancelled)), ids, coords
+		job = self.workers.submit('Crossings', work, lambda result: self._crossings_ready(crossings, result))
+		self.crossings_job = (version, job)
+
+	def _crossings_ready(self, crossings, result):
+		if crossings is not self.crossings:
+			return
+		moved = crossings.moved
+		table, ids, coords = result
+		crossings.set(table, self.crossings_job[0], ids, coords)
+		crossings.move(self.scene, moved)
+
+	def step_jobs(self):
+		"""Apply the results of background jobs and show their progress in the caption."""
+		if self.feed is not None:
+			# Points age out of the window even while nothing comes in
+			version, segments = self.scene.version, len(self.scene.segments)
+			evicted = self.feed.evict()
+			if len(evicted):
+				self._follow_points(version, segments, evicted)
+		self.update_arrangement()
+		self.update_crossings()
+		for job in self.workers.step():
+			if job.error is not None:
+				print(f'{job.name} failed: {job.error}', file=sys.stderr)
+			if job is self.feed_job:
+				self.feed = self.feed_job = None
+
+		caption = CAPTION
+		for job in self.workers.jobs:
+			fraction = job.fraction()
+			caption += f' - {job.name}' + (f' {fraction:.0%}' if fraction is not None else '...')
+		if pygame.display.get_caption()[0] != caption:
+			pygame.display.set_caption(caption)
+
+	def reset_selection(self):
+		"""Drop the current selection and any ray being placed."""
+		self.point_selected = None
+		self.seg_selected = False
+		self.end_point_1 = None
+		self.end_point_2 = None
+		self.ray_drawn = False
+		self.ray_selected = None
+		self.ray_redrawn = False
+		self.seg_changed = []
+		self.ray_changed = []
+		self.selection = np.empty(0, dtype=np.int64)
+		self.selection_drag = None
+		self.band = None
+
+	def finish_band(self):
+		"""Select the points inside the box or lasso that was drawn."""
+		kind, half, corners = self.band
+		self.band = None
+		viewport = self.view.halves[half]
+		world = [viewport.to_world(sx, sy) for sx, sy in corners]
+		if kind == 'box':
+			self.selection = self.scene.points_in_rect(*world[0], *world[-1])
+		else:
+			self.selection = self.scene.points_in_polygon(world)
+
+	def step_history(self, redo=False):
+		"""
+		Undo the last edit, or redo the last one undone. Nothing happens while
+		an edit is under way, such as a drag.
+
+		Args:
+			redo: Redo instead of undo
+		"""
+		if (self.history.redo if redo else self.history.undo)(self.scene):
+			self.reset_selection()
+
+	def goto_history(self, at):
+		"""
+		Jump to the scene as it was with a number of edits in effect.
+
+		Args:
+			at: Number of edits in effect, 0 for the oldest state kept
+		"""
+		if self.history.pending is None:
+			self.history.goto(self.scene, at)
+			self.reset_selection()
+
+	def quit(self):
+		"""Stop the background jobs, save the recording if any and exit."""
+		self.workers.cancel_all()
+		if self.recorder is not None:
+			self.recorder.save(self.scene)
+		pygame.quit()
+		sys.exit(0)
+
+	def handle_event(self, event, mx, my):
+		"""
+		Apply one pygame event to the scene.
+
+		Args:
+			event: Pygame event
+			mx: Current mouse x-coordinate on screen
+			my: Current mouse y-coordinate on screen
+		"""
+		scene = self.scene
+		viewport = self.view.halves[self.view.half_at(mx)]
+		radius = POINT_RADIUS/viewport.zoom
+		wx, wy = self.view.to_world(mx, my)
 		if event.type == pygame.QUIT:
-			pygame.quit()
-			sys.exit(0)
+			self.quit()
 		elif event.type == pygame.KEYDOWN:
 			if event.key == pygame.K_ESCAPE:
 				# Exit on escape key
-				pygame.quit()
-				sys.exit(0)
-			elif event.key == pygame.K_BACKSPACE:
+				self.quit()
+			elif event.key in (pygame.K_BACKSPACE, pygame.K_DELETE):
 				# Delete selected point and associated segments/rays
-				if point_selected is not None:
-					p = point_selected
-					seg_pops = []
-					ray_pops = []
-					
-					# Find segments connected to this point
-					for s in range(len(segments)):
-						if p in segment_eps[s]:
-							seg_pops.append(s)
-					
-					# Find rays starting from this point
-					for r in range(len(rays)):
-						if [all_points[p][0].x, all_points[p][0].y] == ray_eps[r]:
-							ray_pops.append(r)
-					
-					# Remove segments in reverse order (to maintain indices)
-					for i in range(len(seg_pops)-1, -1, -1):
-						segments.pop(seg_pops[i])
-						segment_eps.pop(seg_pops[i])
-						segment_dual.pop(seg_pops[i])
-						wedges.pop(seg_pops[i])
-					
-					# Remove rays in reverse order
-					for j in range(len(ray_pops)-1, -1, -1):
-						rays.pop(ray_pops[j])
-						ray_eps.pop(ray_pops[j])
-						ray_dual.pop(ray_pops[j])
-						ray_wedges.pop(ray_pops[j])
-					
-					# Remove the point itself
-					all_points.pop(p)
-					point_dual.pop(p)
-					
-					# Update segment endpoint indices
-					if seg_pops:
-						all_ps = []
-						for ap in all_points:
-							all_ps.append([ap[0].x, ap[0].y])
-						for se in range(len(segment_eps)):
-							segment_eps[se] = [all_ps.index(segments[se][0]), all_ps.index(segments[se][1])]
-					
-					# Clear everything if no points remain
-					if all_points == []:
-						segments = []
-						segment_eps = []
-						wedges = []
-						segment_dual = []
-						rays = []
-						ray_eps = []
-						ray_dual = []
-						ray_wedges = []
-					
-					end_point_1 = None
-					point_selected = None
+				if len(self.selection) and self.selection_drag is None:
+					self.history.begin(scene, self.selection, *scene.incident_many(self.selection))
+					scene.delete_points(self.selection)
+					self.history.commit(scene)
+					if self.feed is not None:
+						for p in self.selection.tolist():
+							self.feed.discard(p)
+					self.selection = np.empty(0, dtype=np.int64)
+				elif self.point_selected is not None:
+					# Ends the drag of the point, which was begun when it was picked up
+					scene.delete_point(self.point_selected)
+					self.history.commit(scene)
+					if self.feed is not None:
+						self.feed.discard(self.point_selected)
+					self.end_point_1 = None
+					self.point_selected = None
 			elif event.key == pygame.K_c:
 				# Clear all objects (reset)
-				segments = []
-				all_points = []
-				point_dual = []
-				segment_dual = []
-				segment_eps = []
-				wedges = []
-				rays = []
-				ray_eps = []
-				ray_dual = []
-				ray_wedges = []
-				point_selected = None
-				seg_selected = False
-				ray_selected = None
-				ray_drawn = False
-				end_point_1 = None
-				end_point_2 = None
-				ray_redrawn = False
-				seg_changed = []
-				ray_changed = []
+				self.workers.cancel_all()
+				self.history.begin(scene, scene.points.ids(), scene.segments.ids(), scene.rays.ids())
+				scene.clear()
+				self.history.commit(scene)
+				if self.feed is not None:
+					self.feed.reset(scene)
+				self.reset_selection()
+			elif event.key == pygame.K_p:
+				# Toggle the profiler overlay
+				self.renderer.show_profile = not self.renderer.show_profile
+				self.renderer.invalidate()
+			elif event.key == pygame.K_e:
+				# Export the profiler history
+				self.profiler.export(settings.PROFILE_EXPORT)
+			elif event.key == pygame.K_s:
+				# Save the scene
+				save_scene(scene, settings.SCENE_PATH)
+			elif event.key == pygame.K_l:
+				# Load the last saved scene
+				self.start_load(settings.SCENE_PATH)
+			elif event.key == pygame.K_i:
+				# Stream settings.IMPORT_PATH into the scene
+				self.start_import(settings.IMPORT_PATH)
+			elif event.key == pygame.K_a:
+				# Show/hide the vertices of the dual line arrangement
+				self.toggle_arrangement()
+			elif event.key == pygame.K_h:
+				# Show/hide the convex hulls and the envelopes of the dual lines
+				self.toggle_hulls()
+			elif event.key == pygame.K_k:
+				# Show/hide the crossings of the segments
+				self.toggle_crossings()
+			elif event.key == pygame.K_x:
+				# Cancel background jobs
+				self.workers.cancel_all()
+			elif event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+				# Undo, or redo with Shift
+				self.step_history(redo=bool(event.mod & pygame.KMOD_SHIFT))
+			elif event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+				# Redo
+				self.step_history(redo=True)
+			elif event.key in (pygame.K_HOME, pygame.K_END) and event.mod & pygame.KMOD_CTRL:
+				# Jump to the oldest or the latest state in the history
+				self.goto_history(0 if event.key == pygame.K_HOME else len(self.history))
+			elif event.key in (pygame.K_HOME, pygame.K_0):
+				# Reset pan and zoom of both half-planes
+				self.view.reset()
+				self.pan = None
 			elif event.key == pygame.K_r:
 				# Create a ray from selected point to mouse position
-				if end_point_1 is not None and ray_selected is None:
-					# Set up coordinates based on which half of the screen we're in
-					if mx <= 500:
-						px = mx - 250
-						py = my - 250
-						sx, ex = 500, 1000
-					elif mx > 500:
-						px = mx - 750
-						py = my - 250
-						sx, ex = 0, 500
-					
-					# Assign color and increment color index
-					color_del = color_pallete[color_pt]
-					color_pt = (color_pt+1)%len(color_pallete)
-					all_points[end_point_1][1] = color_del
-					
-					# Create ray and its dual representation
-					rays.append([get_ray([all_points[end_point_1][0].x, all_points[end_point_1][0].y, mx, my]), color_del])
-					ray_eps.append([all_points[end_point_1][0].x, all_points[end_point_1][0].y])
-					ray_dual.append(get_segment_dual([rays[-1][0][0], rays[-1][0][1]], [rays[-1][0][2], rays[-1][0][3]]))
-					
-					# Calculate wedge regions for ray visualization
-					if all_points[end_point_1][0].x <= 500:
-						if mx >= all_points[end_point_1][0].x:
-							topc = (1000, 0)
-							bottomc = (500, 500)
-							raywsx, raywsy = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-							raywex, raywey = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-						else:
-							topc = (500, 0)
-							bottomc = (1000, 500)
-							raywsx, raywsy = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-							raywex, raywey = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-					else:
-						if mx >= all_points[end_point_1][0].x:
-							topc = (500, 0)
-							bottomc = (0, 500)
-							raywsx, raywsy = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-							raywex, raywey = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-						else:
-							topc = (0, 0)
-							bottomc = (500, 500)
-							raywsx, raywsy = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-							raywex, raywey = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-					
-					ray_wedges.append([ray_dual[-1], 0, 500,
-									raywsx, raywsy, raywex, raywey,
-									topc, bottomc])
-					ray_selected = -1
-					ray_drawn = True
+				if self.end_point_1 is not None and self.ray_selected is None:
+					# The edit is committed when the ray is put down
+					self.history.begin(scene, [self.end_point_1])
+					self.ray_selected = scene.add_ray(self.end_point_1, wx, wy)
+					self.ray_drawn = True
 
 		elif event.type == pygame.MOUSEBUTTONDOWN:
-			if event.button == 1:  # Left mouse button
-				# Calculate coordinates based on which half of the screen we're in
-				if mx <= 500:
-					px = mx - 250
-					py = my - 250
-					sx, ex = 500, 1000
-				elif mx > 500:
-					px = mx - 750
-					py = my - 250
-					sx, ex = 0, 500
-				
+			mods = pygame.key.get_mods()
+			if event.button == 1 and self.selection_drag is not None:
+				# Put the dragged selection down
+				self.selection_drag = None
+				self.history.commit(scene)
+			elif (event.button == 1 and mods & (pygame.KMOD_SHIFT | pygame.KMOD_CTRL) and self.point_selected is None
+					and self.end_point_1 is None and self.ray_selected is None):
+				# Start drawing a box (Shift) or lasso (Ctrl) around the points to select
+				self.band = ('lasso' if mods & pygame.KMOD_CTRL else 'box', viewport.half, [(mx, my)])
+			elif event.button == 1 and len(self.selection):
+				# Pick up the selection by one of its points, or drop it
+				p = scene.find_point(wx, wy, radius)
+				if p is not None and p in self.selection:
+					self.selection_drag = (wx, wy, 0, 0, *scene.incident_many(self.selection))
+					self.history.begin(scene, self.selection, *self.selection_drag[4:])
+				else:
+					self.selection = np.empty(0, dtype=np.int64)
+			elif event.button == 1:  # Left mouse button
 				# Reset endpoints if already in segment creation mode
-				if end_point_1 is not None:
-					end_point_1 = None
-					end_point_2 = None
-				elif point_selected is None:
+				if self.end_point_1 is not None:
+					self.end_point_1 = None
+					self.end_point_2 = None
+				elif self.point_selected is None:
 					# Check if user clicked on an existing point
-					for p in range(len(all_points)):
-						if all_points[p][0].rect.collidepoint((mx, my)):
-							point_selected = p
-							break
-					
-					if point_selected is None:
+					self.point_selected = scene.find_point(wx, wy, radius)
+
+					if self.point_selected is None:
 						# Create a new point if not clicking on existing one
-						color_del = color_pallete[color_pt]
-						color_pt = (color_pt+1)%len(color_pallete)
-						all_points.append([Point(mx, my), color_del])
-						point_dual.append(Line(px, py, sx, ex))
-					elif point_selected is not None:
+						self.history.begin(scene)
+						self.history.commit(scene, [scene.add_point(wx, wy)])
+					else:
 						# Track segments and rays connected to selected point
-						seg_changed = []
-						ray_changed = []
-						for s in range(len(segment_eps)):
-							if point_selected in segment_eps[s]:
-								seg_changed.append([s, segment_eps[s].index(point_selected)])
-								seg_selected = True
-						for r in range(len(ray_eps)):
-							if [all_points[point_selected][0].x, all_points[point_selected][0].y] == ray_eps[r]:
-								ray_changed.append(r)
-								ray_redrawn = True
-				elif point_selected is not None:
+						self.seg_changed, self.ray_changed = scene.incident(self.point_selected)
+						self.seg_selected = bool(self.seg_changed)
+						self.ray_redrawn = bool(self.ray_changed)
+						# The drag is one edit, committed when the point is put down
+						self.history.begin(scene, [self.point_selected], [s for s, slot in self.seg_changed],
+										self.ray_changed)
+				else:
 					# Deselect point
-					point_selected = None
-					seg_selected = False
-					ray_selected = None
-					end_point_1 = None
-					end_point_2 = None
-					ray_redrawn = False
-					seg_changed = []
-					ray_changed = []
+					self.history.commit(scene)
+					self.reset_selection()
 
 				# Finalize ray if one is being drawn
-				if ray_selected is not None:
-					rays[ray_selected][0] = get_ray(rays[ray_selected][0])
-					ray_eps[ray_selected] = [rays[ray_selected][0][0], rays[ray_selected][0][1]]
-					ray_dual[ray_selected] = get_segment_dual([rays[ray_selected][0][0], rays[ray_selected][0][1]], [rays[ray_selected][0][2], rays[ray_selected][0][3]])
-					ray_wedges[ray_selected] = [ray_dual[ray_selected], 0, 500,
-									ray_wedges[ray_selected][3], ray_wedges[ray_selected][4], ray_wedges[ray_selected][5], ray_wedges[ray_selected][6],
-									ray_wedges[ray_selected][7], ray_wedges[ray_selected][8]]
-
-					ray_selected = None
-					ray_drawn = False
-
-			elif event.button == 3 and point_selected is None:  # Right mouse button
+				if self.ray_selected is not None:
+					scene.finish_ray(self.ray_selected)
+					self.history.commit(scene, rays=[self.ray_selected])
+					self.ray_selected = None
+					self.ray_drawn = False
+
+			elif event.button == 3 and self.point_selected is None:  # Right mouse button
 				# First endpoint selection for segment/ray creation
-				if end_point_1 is None:
-					for p in range(len(all_points)):
-						if all_points[p][0].rect.collidepoint((mx, my)):
-							end_point_1 = p
-							break
-				elif end_point_1 is not None:
+				if self.end_point_1 is None:
+					self.end_point_1 = scene.find_point(wx, wy, radius)
+				else:
 					# Second endpoint selection for segment creation
-					flag = 0
-					for p in range(len(all_points)):
-						if all_points[p][0].rect.collidepoint((mx, my)):
-							end_point_2 = p
-							if end_point_1 == end_point_2:
-								flag = 1  # Same point - delete it
-							break
-					if end_point_2 is not None:
-						if flag == 1:
+					self.end_point_2 = scene.find_point(wx, wy, radius)
+					if self.end_point_2 is not None:
+						if self.end_point_1 == self.end_point_2:
 							# Delete point if clicked twice
-							seg_pops = []
-							ray_pops = []
-							for s in range(len(segment_eps)):
-								if p in segment_eps[s]:
-									seg_pops.append(s)
-							for r in range(len(ray_eps)):
-								if [all_points[p][0].x, all_points[p][0].y] == ray_eps[r]:
-									ray_pops.append(r)
-							for i in range(len(seg_pops)-1, -1, -1):
-								segments.pop(seg_pops[i])
-								segment_eps.pop(seg_pops[i])
-								segment_dual.pop(seg_pops[i])
-								wedges.pop(seg_pops[i])
-							for j in range(len(ray_pops)-1, -1, -1):
-								rays.pop(ray_pops[j])
-								ray_eps.pop(ray_pops[j])
-								ray_dual.pop(ray_pops[j])
-								ray_wedges.pop(ray_pops[j])
-							all_points.pop(p)
-							point_dual.pop(p)
-							if seg_pops:
-								all_ps = []
-								for ap in all_points:
-									all_ps.append([ap[0].x, ap[0].y])
-								for se in range(len(segment_eps)):
-									try:
-										segment_eps[se] = [all_ps.index(segments[se][0]), all_ps.index(segments[se][1])]
-									except:
-										print(all_ps, segment_eps, segments)
-							if all_points == []:
-								segments = []
-								segment_eps = []
-								wedges = []
-								segment_dual = []
-								rays = []
-								ray_eps = []
-								ray_dual = []
-								ray_wedges = []
+							seg_changed, ray_changed = scene.incident(self.end_point_2)
+							self.history.begin(scene, [self.end_point_2], [s for s, slot in seg_changed], ray_changed)
+							scene.delete_point(self.end_point_2)
+							self.history.commit(scene)
+							if self.feed is not None:
+								self.feed.discard(self.end_point_2)
 						else:
-							# Create segment between two points if they're on the same side
-							# and the segment doesn't already exist
-							if (((all_points[end_point_1][0].x <= 500 and all_points[end_point_2][0].x <= 500)
-								or (all_points[end_point_1][0].x > 500 and all_points[end_point_2][0].x > 500))
-								and (((end_point_1, end_point_2) not in segment_eps) and ((end_point_2, end_point_1) not in segment_eps))):
-								# Avoid horizontal lines by offsetting slightly
-								if all_points[end_point_1][0].y == all_points[end_point_2][0].y:
-									all_points[end_point_2][0].y -= 1
-								
-								# Sort endpoints by x-coordinate
-								sorted_eps = sorted([[all_points[end_point_1][0].x, all_points[end_point_1][0].y], [all_points[end_point_2][0].x, all_points[end_point_2][0].y]],
-													key=lambda point_: point_[0])
-								segments.append([sorted_eps[0], sorted_eps[1]])
-								
-								# Store endpoint indices in correct order
-								if [sorted_eps[0], sorted_eps[1]] == [[all_points[end_point_1][0].x, all_points[end_point_1][0].y],
-																	[all_points[end_point_2][0].x, all_points[end_point_2][0].y]]:
-									segment_eps.append([end_point_1, end_point_2])
-								else:
-									segment_eps.append([end_point_2, end_point_1])
-								
-								# Calculate dual point and wedge regions
-								segment_dual.append(get_segment_dual(sorted_eps[0], sorted_eps[1]))
-								p1, p2 = segment_eps[-1][0], segment_eps[-1][1]
-								
-								# Assign same color to both endpoints
-								all_points[end_point_1][1] = color_pallete[color_pt]
-								color_pt = (color_pt+1)%len(color_pallete)
-								all_points[end_point_2][1] = all_points[end_point_1][1]
-								
-								# Create wedge for visualization
-								wedges.append([[point_dual[p1].startx, point_dual[p1].starty, point_dual[p1].endx, point_dual[p1].endy],
-											  [point_dual[p2].startx, point_dual[p2].starty, point_dual[p2].endx, point_dual[p2].endy],
-											  segment_dual[-1], (*all_points[end_point_1][1], 127)])
-					end_point_1 = None
-					end_point_2 = None
-
-	# Handle point dragging
-	if point_selected is not None:
-		# Calculate new coordinates and update point
-		if mx <= 500:
-			px = mx - 250
-			py = my - 250
-			sx, ex = 500, 1000
-		elif mx > 500:
-			px = mx - 750
-			py = my - 250
-			sx, ex = 0, 500
-		
-		# Update point position and its dual line
-		all_points[point_selected][0].x, all_points[point_selected][0].y = mx, my
-		all_points[point_selected][0].rect = Rect(mx-5, my-5, 10, 10)
-		point_dual[point_selected].startx = sx
-		point_dual[point_selected].starty = 250 + (((px*(5)))-py)
-		point_dual[point_selected].endx = ex
-		point_dual[point_selected].endy = 250 + ((px*-5) - py)
-		
-		# Update connected segments when point moves
-		if seg_selected == True:
-			for sc in seg_changed:
-				# Prevent moving point across dividing line if segment connects to point on other side
-				if (segments[sc[0]][(sc[1]-1)*(-1)][0] <= 495 and all_points[point_selected][0].x > 495):
-					all_points[point_selected][0].x = 495
-					all_points[point_selected][0].rect = Rect(490, my-5, 10, 10)
-					point_dual[point_selected].startx = 500
-					point_dual[point_selected].starty = 250 + (((245*(-5)))-py)
-					point_dual[point_selected].endx = 1000
-					point_dual[point_selected].endy = 250 + ((245*5) - py)
-
-				elif (segments[sc[0]][(sc[1]-1)*(-1)][0] > 505 and all_points[point_selected][0].x <= 505):
-					all_points[point_selected][0].x = 505
-					all_points[point_selected][0].rect = Rect(500, my-5, 10, 10)
-					point_dual[point_selected].startx = 0
-					point_dual[point_selected].starty = 250 + ((((-245)*(5)))-py)
-					point_dual[point_selected].endx = 500
-					point_dual[point_selected].endy = 250 + (((-245)*-5) - py)
-
-				# Update segment endpoints and sort if needed
-				segments[sc[0]][sc[1]] = [all_points[point_selected][0].x, all_points[point_selected][0].y]
-				if segments[sc[0]][0][1] == segments[sc[0]][1][1]:
-					segments[sc[0]][1][1] -= 1  # Avoid horizontal lines
-				
-				sorted_eps = sorted([segments[sc[0]][0], segments[sc[0]][1]],
-									key=lambda point_: point_[0])
-				
-				# Swap endpoints if needed to maintain x-ordering
-				if (sorted_eps[0], sorted_eps[1]) != (segments[sc[0]][0], segments[sc[0]][1]):
-					segment_eps[sc[0]] = [segment_eps[sc[0]][1], segment_eps[sc[0]][0]]
-					segments[sc[0]] = [sorted_eps[0], sorted_eps[1]]
-					seg_changed[seg_changed.index(sc)][1] = 0 if seg_changed[seg_changed.index(sc)][1] == 1 else 1
-				
-				# Update dual point and wedge
-				segment_dual[sc[0]] = get_segment_dual(sorted_eps[0], sorted_eps[1])
-				p1, p2 = segment_eps[sc[0]][0], segment_eps[sc[0]][1]
-				wedges[sc[0]] = [[point_dual[p1].startx, point_dual[p1].starty, point_dual[p1].endx, point_dual[p1].endy],
-								[point_dual[p2].startx, point_dual[p2].starty, point_dual[p2].endx, point_dual[p2].endy],
-								segment_dual[sc[0]], wedges[sc[0]][3]]
-		
-		# Update connected rays when point moves
-		if ray_redrawn == True:
-			for rc in ray_changed:
-				# Prevent moving point across dividing line if ray exists
-				if all_points[point_selected][0].x > 495 and rays[rc][0][0] <= 495:
-					all_points[point_selected][0].x = 495
-					all_points[point_selected][0].rect = Rect(490, my-5, 10, 10)
-					point_dual[point_selected].startx = 500
-					point_dual[point_selected].starty = 250 + (((245*(5)))-py)
-					point_dual[point_selected].endx = 1000
-					point_dual[point_selected].endy = 250 + ((245*-5) - py)
-
-				elif all_points[point_selected][0].x <= 505 and rays[rc][0][0] > 505:
-					all_points[point_selected][0].x = 505
-					all_points[point_selected][0].rect = Rect(500, my-5, 10, 10)
-					point_dual[point_selected].startx = 0
-					point_dual[point_selected].starty = 250 + ((((-245)*(5)))-py)
-					point_dual[point_selected].endx = 500
-					point_dual[point_selected].endy = 250 + (((-245)*-5) - py)
-
-				# Calculate wedge regions for ray visualization
-				if all_points[point_selected][0].x <= 500:
-					if rays[rc][0][2] >= all_points[point_selected][0].x:
-						topc = (1000, 0)
-						bottomc = (500, 500)
-						raywsx, raywsy = point_dual[point_selected].startx, point_dual[point_selected].starty
-						raywex, raywey = point_dual[point_selected].endx, point_dual[point_selected].endy
-					else:
-						topc = (500, 0)
-						bottomc = (1000, 500)
-						raywsx, raywsy = point_dual[point_selected].endx, point_dual[point_selected].endy
-						raywex, raywey = point_dual[point_selected].startx, point_dual[point_selected].starty
-				else:
-					if rays[rc][0][2] >= all_points[point_selected][0].x:
-						topc = (500, 0)
-						bottomc = (0, 500)
-						raywsx, raywsy = point_dual[point_selected].startx, point_dual[point_selected].starty
-						raywex, raywey = point_dual[point_selected].endx, point_dual[point_selected].endy
-					else:
-						topc = (0, 0)
-						bottomc = (500, 500)
-						
-						raywsx, raywsy = point_dual[point_selected].endx, point_dual[point_selected].endy
-						raywex, raywey = point_dual[point_selected].startx, point_dual[point_selected].starty
-
-				rays[rc][0][0], rays[rc][0][1] = all_points[point_selected][0].x, all_points[point_selected][0].y
-				ray_eps[rc] = [all_points[point_selected][0].x, all_points[point_selected][0].y]
-				ray_dual[rc] = get_segment_dual([all_points[point_selected][0].x, all_points[point_selected][0].y], [rays[rc][0][2], rays[rc][0][3]])
-				ray_wedges[rc] = [ray_dual[rc], 0, 500,
-									raywsx, raywsy, raywex, raywey,
-									topc, bottomc]
-
-	# Draw new ray
-	if ray_drawn == True:
-		# Calculate wedge regions for ray visualization
-		if rays[ray_selected][0][0] <= 500:
-			if mx >= rays[ray_selected][0][0]:
-				topc = (1000, 0)
-				bottomc = (500, 500)
-				raywsx, raywsy = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-				raywex, raywey = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-			else:
-				topc = (500, 0)
-				bottomc = (1000, 500)
-				
-				raywsx, raywsy = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-				raywex, raywey = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-		else:
-			if mx >= rays[ray_selected][0][0]:
-				topc = (500, 0)
-				bottomc = (0, 500)
-				raywsx, raywsy = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-				raywex, raywey = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-			else:
-				topc = (0, 0)
-				bottomc = (500, 500)
-				
-				raywsx, raywsy = point_dual[end_point_1].endx, point_dual[end_point_1].endy
-				raywex, raywey = point_dual[end_point_1].startx, point_dual[end_point_1].starty
-
-		rays[ray_selected][0][2] = mx
-		rays[ray_selected][0][3] = my
-		ray_eps[ray_selected] = [rays[ray_selected][0][0], rays[ray_selected][0][1]]
-		ray_dual[ray_selected] = get_segment_dual([rays[ray_selected][0][0], rays[ray_selected][0][1]], [rays[ray_selected][0][2], rays[ray_selected][0][3]])
-		ray_wedges[ray_selected] = [ray_dual[ray_selected], 0, 500,
-							raywsx, raywsy, raywex, raywey,
-							topc, bottomc]
-
-	# Draw rays and ray duals
-	for r in range(len(rays)):
-		if ray_dual[r].rect.collidepoint((mx, my)):
-			r_col = (255,255,255)
-			thicn = 3
-		else:
-			r_col = (*rays[r][1], 127)
-			thicn = 1
-		pygame.draw.line(screen, r_col, (rays[r][0][0], rays[r][0][1]), (rays[r][0][2], rays[r][0][3]), width=thicn)
-		pygame.draw.line(screen, r_col, (ray_dual[r].x, 0), (ray_dual[r].x, 500))
-		pygame.draw.circle(screen, r_col, (ray_dual[r].x, ray_dual[r].y), 5)
-		draw_polygon_alpha(screen, r_col, ((ray_wedges[r][0].x, ray_wedges[r][0].y), (ray_wedges[r][5], ray_wedges[r][6]), ray_wedges[r][7], (ray_wedges[r][0].x, 0)))
-		draw_polygon_alpha(screen, r_col, ((ray_wedges[r][0].x, ray_wedges[r][0].y), (ray_wedges[r][3], ray_wedges[r][4]), ray_wedges[r][8], (ray_wedges[r][0].x, 500)))
-
-	#Draw line segments and segment duals
-	for s in range(len(segments)):
-		if segment_dual[s].rect.collidepoint((mx, my)):
-			segment_dual[s].color = (255, 255, 255)
-			pygame.draw.line(screen, (255, 255, 255), segments[s][0], segments[s][1], width=3)
+							self.history.begin(scene, [self.end_point_1, self.end_point_2])
+							s = scene.connect(self.end_point_1, self.end_point_2)
+							self.history.commit(scene, segments=[] if s is None else [s])
+					self.end_point_1 = None
+					self.end_point_2 = None
+
+			elif event.button == 2:  # Middle mouse button
+				# Start panning the half-plane under the cursor
+				self.pan = (viewport.half, mx, my, viewport.cx, viewport.cy)
+
+		elif event.type == pygame.MOUSEBUTTONUP:
+			if event.button == 2:
+				self.pan = None
+			elif event.button == 1 and self.band is not None:
+				self.finish_band()
+
+		elif event.type == pygame.MOUSEWHEEL:
+			# Zoom the half-plane under the cursor around the cursor
+			viewport.zoom_at(mx, my, settings.ZOOM_STEP**event.y)
+
+	def update(self, mx, my):
+		"""
+		Follow the mouse with the dragged point, the ray being placed or the
+		half-plane being panned.
+
+		Args:
+			mx: Current mouse x-coordinate on screen
+			my: Current mouse y-coordinate on screen
+		"""
+		if self.pan is not None:
+			half, sx, sy, cx, cy = self.pan
+			viewport = self.view.halves[half]
+			viewport.pan_to(cx - (mx - sx)/viewport.zoom, cy - (my - sy)/viewport.zoom)
+
+		wx, wy = self.view.to_world(mx, my)
+		if self.point_selected is not None:
+			self.scene.move_point(self.point_selected, wx, wy,
+								self.seg_changed if self.seg_selected else (),
+								self.ray_changed if self.ray_redrawn else ())
+			if self.arrangement is not None:
+				self.arrangement.move(self.scene, [self.point_selected])
+			if self.crossings is not None and self.seg_selected:
+				self.crossings.move(self.scene, [s for s, slot in self.seg_changed])
+		if self.selection_drag is not None:
+			# The whole selection follows the mouse in one vectorized move
+			x0, y0, dx, dy, segments, rays = self.selection_drag
+			step = self.scene.move_points(self.selection, wx - x0 - dx, wy - y0 - dy, segments, rays)
+			self.selection_drag = (x0, y0, dx + step[0], dy + step[1], segments, rays)
+			if step != (0, 0):
+				if self.arrangement is not None:
+					self.arrangement.move(self.scene, self.selection.tolist())
+				if self.crossings is not None and len(segments):
+					self.crossings.move(self.scene, segments.tolist())
+		if self.band is not None:
+			kind, half, corners = self.band
+			# The band stays in the half-plane it was started in
+			sx = min(max(mx, DIVIDER*half), DIVIDER*(half + 1) - 1)
+			if kind == 'box':
+				corners[1:] = [(sx, my)]
+			elif abs(sx - corners[-1][0]) + abs(my - corners[-1][1]) >= 3:
+				corners.append((sx, my))
+		if self.hulls is not None:
+			# Catches up with every edit after a version change, otherwise only checks the dragged points
+			moved = [] if self.point_selected is None else [self.point_selected]
+			if self.selection_drag is not None:
+				moved += self.selection.tolist()
+			self.hulls.sync(self.scene, moved)
+
+		if self.ray_drawn:
+			self.scene.aim_ray(self.ray_selected, wx, wy)
+
+	def draw(self, mx, my):
+		"""
+		Draw the grid and every primitive with its dual.
+
+		The dragged point, the primitives attached to it and the ray being
+		placed are kept out of the renderer's cached background.
+
+		Args:
+			mx: Current mouse x-coordinate on screen
+			my: Current mouse y-coordinate on screen
+		"""
+		active_points, active_segments, active_rays = [], [], []
+		if self.point_selected is not None:
+			active_points.append(self.point_selected)
+			active_segments += [sc[0] for sc in self.seg_changed]
+			active_rays += self.ray_changed
+		if self.ray_selected is not None:
+			active_rays.append(self.ray_selected)
+		if self.selection_drag is not None:
+			active_points += self.selection.tolist()
+			active_segments += self.selection_drag[4].tolist()
+			active_rays += self.selection_drag[5].tolist()
+		self.renderer.draw(mx, my, active_points, active_segments, active_rays, self.end_point_1,
+						self.selection, self.band)
+
+	def is_active(self):
+		"""
+		Check whether something follows the mouse and needs a high frame rate.
+
+		Returns:
+			bool: True while a point or selection is dragged, a ray is being
+			placed, a selection is drawn, a half-plane is panned or a background
+			job other than the live feed is running
+		"""
+		return (self.point_selected is not None or self.ray_drawn or self.pan is not None
+				or self.selection_drag is not None or self.band is not None
+				or any(job is not self.feed_job for job in self.workers.jobs))
+
+	def poll_events(self):
+		"""
+		Collect the input for the next frame.
+
+		Blocks until something happens while idle, and only drains the queue
+		while active. A live feed wakes the loop when a batch comes in, and
+		when its oldest points are due to age out. Motion bursts are coalesced
+		since the mouse position is read once per frame anyway.
+
+		Returns:
+			list: Events to handle this frame
+		"""
+		if self.is_active():
+			events = pygame.event.get()
 		else:
-			segment_dual[s].color = wedges[s][3]
-			pygame.draw.line(screen, wedges[s][3], segments[s][0], segments[s][1])
-		pygame.draw.circle(screen, segment_dual[s].color, (segment_dual[s].x, segment_dual[s].y), 5)
-		draw_polygon_alpha(screen, segment_dual[s].color, ((wedges[s][0][0], wedges[s][0][1]), (wedges[s][1][0], wedges[s][1][1]), (wedges[s][2].x, wedges[s][2].y)))
-		draw_polygon_alpha(screen, segment_dual[s].color, ((wedges[s][0][2], wedges[s][0][3]), (wedges[s][1][2], wedges[s][1][3]), (wedges[s][2].x, wedges[s][2].y)))
-
-	# Draw points and point duals
-	for p in range(len(all_points)):
-		if all_points[p][0].rect.collidepoint((mx, my)):
-			all_points[p][0].color = (255, 255, 255) 
-			point_dual[p].color = (255, 255, 255)
-			thiccness = 3
-		else:
-			all_points[p][0].color = all_points[p][1]
-			point_dual[p].color = all_points[p][1]
-			thiccness = 1
-		if p == end_point_1:
-			all_points[p][0].color = (255, 255, 0)
-			point_dual[p].color = (255, 255, 0)
-			thiccness = 3
-		pygame.draw.circle(screen, all_points[p][0].color, (all_points[p][0].x, all_points[p][0].y), 5)
-		pygame.draw.line(screen, point_dual[p].color, (point_dual[p].startx, point_dual[p].starty), (point_dual[p].endx, point_dual[p].endy), width=thiccness)
-
-	# Update display
-	pygame.display.update()
-
-	# FPS locked at 15 (Higher FPS not required)
-	clock.tick(15)
+			timeout = settings.IDLE_TIMEOUT_MS
+			expires = self.feed.expires() if self.feed is not None else None
+			if expires is not None:
+				expires = max(1, int(np.ceil(expires*1000)))
+				timeout = min(timeout, expires) if timeout else expires
+			first = pygame.event.wait(timeout)
+			events = [first] + pygame.event.get()
+		return coalesce_motion([event for event in events if event.type not in (pygame.NOEVENT, FEED_EVENT)])
+
+	def frame(self, events, mx, my):
+		"""
+		Run one frame of the main loop after its input was collected, timing
+		each part as a phase of the current profiler frame.
+
+		Args:
+			events: Events to handle this frame
+			mx: Current mouse x-coordinate on screen
+			my: Current mouse y-coordinate on screen
+		"""
+		profiler = self.profiler
+		with profiler.phase('events'):
+			for event in events:
+				self.handle_event(event, mx, my)
+		with profiler.phase('jobs'):
+			self.step_jobs()
+		with profiler.phase('update'):
+			self.update(mx, my)
+		with profiler.phase('draw'):
+			self.draw(mx, my)
+
+	def run(self):
+		"""Run the main loop until the window is closed."""
+		profiler = self.profiler
+		while True:
+			profiler.begin_frame()
+			with profiler.phase('wait'):
+				events = self.poll_events()
+
+			# Get current mouse position
+			mx, my = pygame.mouse.get_pos()
+			mx, my = int(mx), int(my)
+			if self.recorder is not None:
+				self.recorder.add(mx, my, pygame.key.get_mods(), events)
+
+			self.frame(events, mx, my)
+			profiler.end_frame()
+
+			# Run fast while editing, and cap hover redraws when idle
+			self.clock.tick(settings.ACTIVE_FPS if self.is_active() else settings.IDLE_FPS)
+
+def main():
+	args = sys.argv[1:]
+	options = {}
+	while len(args) > 1 and args[0] in ('--feed', '--record'):
+		options[args[0]] = args[1]
+		args = args[2:]
+
+	# Initialize pygame window
+	screen = pygame.display.set_mode((1000, 500))
+	pygame.display.set_caption(CAPTION)
+	if '--record' in options:
+		# The palette is shuffled with a known seed so the replay has the same colors
+		seed = random.randrange(1 << 32)
+		app = App(screen, Scene(gen_color(seed)))
+		app.recorder = Recorder(options['--record'], seed, args[0] if args else None)
+	else:
+		app = App(screen)
+
+	# Read the live feed given with --feed, and open the scene file given on
+	# the command line or import it if it is CSV/NDJSON
+	if '--feed' in options:
+		app.start_feed(options['--feed'])
+	if args:
+		app.open(args[0])
+	app.run()
+
+
+if __name__ == '__main__':
+	main()
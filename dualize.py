@@ -0,0 +1,159 @@
+"""
+Headless batch conversion of primitives to their duals.
+
+Reads points, segments and rays in the import format of importer.py from a
+file or stdin and writes one NDJSON object per input record, in the same
+order, to a file or stdout, without opening a window:
+
+	python3 dualize.py cloud.csv -o duals.ndjson
+	cat cloud.ndjson | python3 dualize.py - --format ndjson --workers 8 > duals.ndjson
+
+Each output object repeats the input record and adds:
+
+	point     "dual": dual line [startx, starty, endx, endy]
+	segment   "dual": dual point [x, y], "wedge": two triangles of [x, y] vertices
+	ray       "coords": [ox, oy, ex, ey] clipped to its half-plane,
+	          "dual": dual point [x, y], "wedge": two polygons of [x, y] vertices
+
+The conventions are those of the window: segment endpoints are ordered by
+x and a horizontal segment has its second endpoint moved up one pixel. A
+segment crossing the divider cannot be drawn in the window, so its dual and
+wedge are null.
+
+The input is streamed in chunks, so memory stays constant whatever the file
+size. With --workers, chunks are converted in a process pool while the main
+process reads ahead a bounded number of chunks.
+"""
+import argparse, json, os, sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import settings
+from engine import batch_point_duals, batch_segment_duals, batch_ray_duals, batch_segment_wedges, batch_ray_wedges
+from importer import file_format, parse_rows, read_lines, split_lines
+
+
+def dualize(kinds, coords):
+	"""
+	Compute the duals of a chunk of records.
+
+	Args:
+		kinds: (n,) str array of record kinds
+		coords: (n, 4) int64 array of record coordinates
+
+	Returns:
+		list: One dict per record, in order
+	"""
+	out = [None]*len(kinds)
+
+	points = np.flatnonzero(kinds == 'point')
+	for i, (x, y), dual in zip(points.tolist(), coords[points, :2].tolist(),
+								batch_point_duals(coords[points, :2]).tolist()):
+		out[i] = {'kind': 'point', 'x': x, 'y': y, 'dual': dual}
+
+	segments = np.flatnonzero(kinds == 'segment')
+	e1, e2 = coords[segments, :2], coords[segments, 2:]
+	swap = e2[:, 0] < e1[:, 0]
+	e1, e2 = np.where(swap[:, None], e2, e1), np.where(swap[:, None], e1, e2)
+	inside = (e1[:, 0] <= 500) == (e2[:, 0] <= 500)
+	ends = e2.copy()
+	ends[ends[:, 1] == e1[:, 1], 1] -= 1  # Avoid horizontal lines
+	duals = batch_segment_duals(e1, ends)
+	wedges = batch_segment_wedges(batch_point_duals(e1), batch_point_duals(ends), duals)
+	for i, (x, y, x2, y2), ok, dual, wedge in zip(segments.tolist(), coords[segments].tolist(),
+												inside.tolist(), duals.tolist(), wedges.tolist()):
+		out[i] = {'kind': 'segment', 'x': x, 'y': y, 'x2': x2, 'y2': y2,
+				'dual': dual if ok else None, 'wedge': wedge if ok else None}
+
+	rays = np.flatnonzero(kinds == 'ray')
+	ray_coords, duals = batch_ray_duals(coords[rays, :2], coords[rays, 2:])
+	wedges = batch_ray_wedges(duals, batch_point_duals(coords[rays, :2]), ray_coords[:, 0], ray_coords[:, 2])
+	for i, (x, y, x2, y2), clipped, dual, wedge in zip(rays.tolist(), coords[rays].tolist(),
+													ray_coords.tolist(), duals.tolist(), wedges.tolist()):
+		out[i] = {'kind': 'ray', 'x': x, 'y': y, 'x2': x2, 'y2': y2,
+				'coords': clipped, 'dual': dual, 'wedge': wedge}
+	return out
+
+def convert_chunk(lines, columns, first):
+	"""
+	Turn a chunk of input lines into NDJSON output. Runs in the worker processes.
+
+	Args:
+		lines: Non-blank input lines
+		columns: CSV column positions, or None for NDJSON input
+		first: Record number of the first line
+
+	Returns:
+		str: One JSON object per line
+	"""
+	kinds, coords = parse_rows(split_lines(lines, columns, first), first)
+	return ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in dualize(kinds, coords))
+
+def convert(src, dst, fmt='csv', chunk_size=None, workers=1):
+	"""
+	Stream records from one file object to another.
+
+	Args:
+		src: Input text file object
+		dst: Output text file object
+		fmt: Input format, 'csv' or 'ndjson'
+		chunk_size: Lines per chunk, settings.IMPORT_CHUNK if None
+		workers: Number of worker processes, 1 converts in this process
+
+	Returns:
+		int: Number of records converted
+
+	Raises:
+		ValueError: On a malformed record
+	"""
+	chunks = read_lines(src, chunk_size or settings.IMPORT_CHUNK, fmt)
+	total = 0
+	if workers <= 1:
+		for lines, columns in chunks:
+			dst.write(convert_chunk(lines, columns, total + 1))
+			total += len(lines)
+		return total
+
+	# Keep a bounded number of chunks in flight and write them back in order
+	with ProcessPoolExecutor(workers) as pool:
+		pending = deque()
+		for lines, columns in chunks:
+			pending.append(pool.submit(convert_chunk, lines, columns, total + 1))
+			total += len(lines)
+			if len(pending) >= 2*workers:
+				dst.write(pending.popleft().result())
+		while pending:
+			dst.write(pending.popleft().result())
+	return total
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument('input', nargs='?', default='-', help="CSV or NDJSON file, '-' for stdin")
+	parser.add_argument('-o', '--output', default='-', help="NDJSON output file, '-' for stdout")
+	parser.add_argument('--format', choices=('csv', 'ndjson'),
+						help='input format, by default from the file extension (CSV for stdin)')
+	parser.add_argument('--chunk', type=int, default=settings.IMPORT_CHUNK, help='lines per chunk')
+	parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 for one per CPU')
+	args = parser.parse_args(argv)
+
+	fmt = args.format or ('csv' if args.input == '-' else file_format(args.input))
+	workers = args.workers or os.cpu_count() or 1
+
+	src = sys.stdin if args.input == '-' else open(args.input, newline='')
+	dst = sys.stdout if args.output == '-' else open(args.output, 'w')
+	try:
+		total = convert(src, dst, fmt, args.chunk, workers)
+	except ValueError as e:
+		sys.exit(f'dualize: {args.input}: {e}')
+	finally:
+		if src is not sys.stdin:
+			src.close()
+		if dst is not sys.stdout:
+			dst.close()
+	print(f'dualize: {total} records', file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
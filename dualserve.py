@@ -0,0 +1,303 @@
+"""
+Local dual transform service.
+
+Serves the transforms of dualize.py to other programs over a Unix socket or a
+localhost TCP port, so they do not have to reimplement the math:
+
+	python3 dualserve.py --unix duality.sock
+	python3 dualserve.py --port 8765
+
+The protocol is NDJSON both ways. Each request is one line holding an id and
+a list of records in the import format, and gets one line back with the same
+id and one result per record, as written by dualize.py:
+
+	{"id": 1, "records": [{"x": 120, "y": 80}, {"kind": "segment", "x": 600, "y": 100, "x2": 700, "y2": 300}]}
+	{"id": 1, "results": [{"kind": "point", "x": 120, "y": 80, "dual": [...]}, ...]}
+
+A request that cannot be parsed gets {"id": ..., "error": "..."} instead, and
+{"id": ..., "stats": true} gets the metrics of the server. Responses on one
+connection come back in the order of the requests.
+
+Requests from every connection go into one queue. A single batcher takes
+everything waiting, up to settings.SERVER_BATCH_MAX records, and converts it
+with one call of dualize() on a worker thread. Requests that arrive while a
+batch is converted wait for the next one, so batches grow with the load and
+a lone request is not held back. Client is a small blocking client for
+scripts and tests.
+"""
+import argparse, asyncio, json, socket, sys, time
+from collections import deque
+
+import numpy as np
+
+import settings
+from dualize import dualize
+from importer import parse_rows, record_rows
+
+
+def parse_records(records):
+	"""
+	Parse the records of a request.
+
+	Args:
+		records: List of dicts in the import format
+
+	Returns:
+		Tuple: ((n,) str array of kinds, (n, 4) int64 array of coordinates)
+
+	Raises:
+		ValueError: On a malformed record, as 'record N: ...' with N counted from 1
+	"""
+	if not isinstance(records, list):
+		raise ValueError('records must be a list of objects')
+	return parse_rows(record_rows(records))
+
+
+class Metrics:
+	"""
+	Throughput and latency of a server.
+
+	Attributes:
+		started (float): Time the server started
+		requests (int): Requests answered
+		records (int): Records converted
+		batches (int): Calls of dualize()
+		errors (int): Requests answered with an error
+		latencies (deque): Seconds from arrival to answer of the latest requests
+		sizes (deque): Records per batch of the latest batches
+	"""
+	def __init__(self, history=None):
+		self.started = time.perf_counter()
+		self.requests = self.records = self.batches = self.errors = 0
+		self.latencies = deque(maxlen=history or settings.SERVER_HISTORY)
+		self.sizes = deque(maxlen=history or settings.SERVER_HISTORY)
+
+	def summary(self):
+		"""
+		Returns:
+			dict: Totals, mean throughput since the start, mean batch size
+			and latency percentiles in milliseconds over the latest requests
+		"""
+		uptime = time.perf_counter() - self.started
+		latencies = np.array(self.latencies)*1000
+		p50, p90, p99 = np.percentile(latencies, (50, 90, 99)).tolist() if len(latencies) else (0.0, 0.0, 0.0)
+		return {
+			'uptime': uptime,
+			'requests': self.requests,
+			'records': self.records,
+			'batches': self.batches,
+			'errors': self.errors,
+			'records_per_second': self.records/uptime if uptime else 0.0,
+			'requests_per_second': self.requests/uptime if uptime else 0.0,
+			'mean_batch': float(np.mean(self.sizes)) if self.sizes else 0.0,
+			'latency_ms': {'p50': p50, 'p90': p90, 'p99': p99,
+						'max': float(latencies.max()) if len(latencies) else 0.0},
+		}
+
+
+class Server:
+	"""
+	Answers dual transform requests, batching the requests of every connection.
+
+	Attributes:
+		queue (Queue): (kinds, coords, future) of the requests waiting
+		metrics (Metrics): Throughput and latency so far
+		batch_max (int): Most records converted in one batch
+	"""
+	def __init__(self, batch_max=None):
+		self.queue = asyncio.Queue()
+		self.metrics = Metrics()
+		self.batch_max = batch_max or settings.SERVER_BATCH_MAX
+
+	async def batcher(self):
+		"""Convert the waiting requests together, one batch at a time, forever."""
+		loop = asyncio.get_running_loop()
+		while True:
+			batch = [await self.queue.get()]
+			size = len(batch[0][0])
+			while not self.queue.empty() and size < self.batch_max:
+				batch.append(self.queue.get_nowait())
+				size += len(batch[-1][0])
+			kinds = np.concatenate([kinds for kinds, _, _ in batch])
+			coords = np.concatenate([coords for _, coords, _ in batch])
+			try:
+				results = await loop.run_in_executor(None, dualize, kinds, coords)
+			except Exception as e:
+				for _, _, future in batch:
+					if not future.done():
+						future.set_exception(e)
+				continue
+
+			self.metrics.batches += 1
+			self.metrics.sizes.append(size)
+			self.metrics.records += size
+			start = 0
+			for kinds, _, future in batch:
+				if not future.done():
+					future.set_result(results[start:start + len(kinds)])
+				start += len(kinds)
+
+	async def answer(self, line):
+		"""
+		Answer one request line.
+
+		Args:
+			line: Request as a JSON text
+
+		Returns:
+			dict: Response
+		"""
+		arrived = time.perf_counter()
+		request_id = None
+		try:
+			request = json.loads(line)
+			if not isinstance(request, dict):
+				raise ValueError('a request must be an object')
+			request_id = request.get('id')
+			if request.get('stats'):
+				return {'id': request_id, 'stats': self.metrics.summary()}
+			kinds, coords = parse_records(request.get('records', []))
+			if len(kinds):
+				future = asyncio.get_running_loop().create_future()
+				await self.queue.put((kinds, coords, future))
+				results = await future
+			else:
+				results = []
+		except Exception as e:
+			self.metrics.errors += 1
+			return {'id': request_id, 'error': str(e)}
+		self.metrics.requests += 1
+		self.metrics.latencies.append(time.perf_counter() - arrived)
+		return {'id': request_id, 'results': results}
+
+	async def handle(self, reader, writer):
+		"""Serve one connection until the client closes it."""
+		answers = asyncio.Queue()
+
+		async def respond():
+			# Requests are answered concurrently but written back in order
+			while (task := await answers.get()) is not None:
+				response = await task
+				writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+				await writer.drain()
+
+		responder = asyncio.create_task(respond())
+		try:
+			while line := await reader.readline():
+				if line.strip():
+					await answers.put(asyncio.create_task(self.answer(line)))
+			await answers.put(None)
+			await responder
+		except (ConnectionError, ValueError):
+			# Gone, or sent a line longer than settings.SERVER_LINE_MAX
+			responder.cancel()
+		finally:
+			writer.close()
+
+	async def serve(self, unix=None, port=None, ready=None):
+		"""
+		Listen on a Unix socket or a localhost port until cancelled.
+
+		Args:
+			unix: Path of the Unix socket
+			port: TCP port on 127.0.0.1, if no Unix socket is given
+			ready: Called with the listening asyncio Server once it accepts connections
+		"""
+		if unix is not None:
+			server = await asyncio.start_unix_server(self.handle, unix, limit=settings.SERVER_LINE_MAX)
+		else:
+			server = await asyncio.start_server(self.handle, '127.0.0.1', port, limit=settings.SERVER_LINE_MAX)
+		batcher = asyncio.create_task(self.batcher())
+		if ready is not None:
+			ready(server)
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			batcher.cancel()
+
+
+class Client:
+	"""
+	Blocking client of a dual transform server.
+
+	Attributes:
+		connection (socket): Connection to the server
+		file (file): Buffered reader over the connection
+		next_id (int): Id of the next request
+	"""
+	def __init__(self, unix=None, port=None):
+		if unix is not None:
+			self.connection = socket.socket(socket.AF_UNIX)
+			self.connection.connect(unix)
+		else:
+			self.connection = socket.create_connection(('127.0.0.1', port))
+		self.file = self.connection.makefile('rb')
+		self.next_id = 0
+
+	def close(self):
+		"""Close the connection."""
+		self.file.close()
+		self.connection.close()
+
+	def request(self, **fields):
+		"""
+		Send one request and wait for its response.
+
+		Args:
+			**fields: Fields of the request besides the id
+
+		Returns:
+			dict: Response
+		"""
+		self.next_id += 1
+		message = dict(fields, id=self.next_id)
+		self.connection.sendall(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+		return json.loads(self.file.readline())
+
+	def dualize(self, records):
+		"""
+		Convert records on the server.
+
+		Args:
+			records: List of dicts in the import format
+
+		Returns:
+			list: One result per record, as written by dualize.py
+
+		Raises:
+			ValueError: If the server rejected the request
+		"""
+		response = self.request(records=records)
+		if 'error' in response:
+			raise ValueError(response['error'])
+		return response['results']
+
+	def stats(self):
+		"""
+		Returns:
+			dict: Metrics of the server, see Metrics.summary()
+		"""
+		return self.request(stats=True)['stats']
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	where = parser.add_mutually_exclusive_group()
+	where.add_argument('--unix', help='path of the Unix socket to listen on')
+	where.add_argument('--port', type=int, default=settings.SERVER_PORT, help='port to listen on at 127.0.0.1')
+	parser.add_argument('--batch', type=int, default=settings.SERVER_BATCH_MAX, help='most records per batch')
+	args = parser.parse_args(argv)
+
+	where = args.unix or f'127.0.0.1:{args.port}'
+	server = Server(args.batch)
+	try:
+		asyncio.run(server.serve(args.unix, args.port,
+								lambda _: print(f'dualserve: listening on {where}', file=sys.stderr)))
+	except KeyboardInterrupt:
+		pass
+	print(f'dualserve: {json.dumps(server.metrics.summary())}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,1098 @@
+"""
+Headless geometry engine for the duality program.
+
+Owns the point -> line and segment/ray -> point dual transforms and the scene
+state. Nothing in here imports pygame, so the math can be reused and timed in
+batch jobs without opening a window. duality.py is a thin front end over it.
+"""
+import numpy as np
+
+from color_gen import gen_color
+from spatial import GridIndex
+from store import Adjacency, Pool
+
+# Screen layout: two 500x500 half-planes side by side
+WIDTH = 1000
+HEIGHT = 500
+DIVIDER = 500			# x-coordinate of the line between the half-planes
+LEFT_LIMIT = 495		# Rightmost x of a point on the left with a segment or ray attached
+RIGHT_LIMIT = 505		# Leftmost x of a point on the right with a segment or ray attached
+LEFT_ORIGIN = 250		# x-coordinate of the origin of the left half-plane
+RIGHT_ORIGIN = 750		# x-coordinate of the origin of the right half-plane
+CENTER_Y = 250			# y-coordinate of both origins
+POINT_RADIUS = 5		# Half the side of the square used for hit-testing
+
+
+class Point:
+	"""
+	Represents a point in the geometric space.
+
+	Attributes:
+		x (int): X-coordinate of the point
+		y (int): Y-coordinate of the point
+		color (tuple): RGB color value
+	"""
+	def __init__(self, x, y):
+		self.x = x
+		self.y = y
+		self.color = (255, 255, 255)		# Default color (white)
+
+	def collides(self, mx, my):
+		"""
+		Check whether (mx, my) lies in the 10x10 square centered on the point.
+
+		Args:
+			mx: X-coordinate to test
+			my: Y-coordinate to test
+
+		Returns:
+			bool: True if the coordinates hit the point
+		"""
+		return collides(self.x, self.y, mx, my)
+
+class Line:
+	"""
+	Represents a line in the dual space.
+
+	Attributes:
+		startx (int): X-coordinate of start point
+		starty (int): Y-coordinate of start point
+		endx (int): X-coordinate of end point
+		endy (int): Y-coordinate of end point
+		color (tuple): RGB color value
+	"""
+	def __init__(self, px, py, sx, ex):
+		# Calculate line endpoints based on point-line duality transformation
+		self.startx = sx
+		self.starty = 250 + (((px*(5)))-py)
+		self.endx = ex
+		self.endy = 250 + ((px*-5) - py)
+		self.color = (255, 255, 255)  # Default color (white)
+
+def collides(x, y, mx, my):
+	"""
+	Check whether (mx, my) lies in the 10x10 square centered on (x, y).
+
+	Args:
+		x: X-coordinate of the point
+		y: Y-coordinate of the point
+		mx: X-coordinate to test
+		my: Y-coordinate to test
+
+	Returns:
+		bool: True if the coordinates hit the point
+	"""
+	return (x - POINT_RADIUS <= mx < x + POINT_RADIUS
+			and y - POINT_RADIUS <= my < y + POINT_RADIUS)
+
+def get_local_coords(x, y):
+	"""
+	Convert screen coordinates to coordinates relative to the origin of the
+	half-plane they lie in, along with the x-extent of the opposite half-plane.
+
+	Args:
+		x: Screen x-coordinate
+		y: Screen y-coordinate
+
+	Returns:
+		Tuple: (px, py, sx, ex) local coordinates and dual line x-extent
+	"""
+	if x <= DIVIDER:
+		return x - LEFT_ORIGIN, y - CENTER_Y, DIVIDER, WIDTH
+	return x - RIGHT_ORIGIN, y - CENTER_Y, 0, DIVIDER
+
+def get_point_dual(x, y):
+	"""
+	Calculate the dual line of a point given in screen coordinates.
+
+	Args:
+		x: Screen x-coordinate of the point
+		y: Screen y-coordinate of the point
+
+	Returns:
+		Line: Dual line drawn across the opposite half-plane
+	"""
+	return Line(*get_local_coords(x, y))
+
+def get_segment_dual(e1, e2):
+	"""
+	Calculate the dual point of a line segment defined by two endpoints.
+
+	Args:
+		e1: First endpoint coordinates [x, y]
+		e2: Second endpoint coordinates [x, y]
+
+	Returns:
+		Point: Dual point representing the line segment
+	"""
+	x_0, y_0 = e1[0], e1[1]
+	x_1, y_1 = e2[0], e2[1]
+
+	# Adjust x-coordinates based on which half of the screen they're in
+	if x_0 <= 500:
+		x_0 = x_0 - 250
+		x_1 = x_1 - 250
+		x_flag = 0
+	else:
+		x_0 = x_0 - 750
+		x_1 = x_1 - 750
+		x_flag = 1
+
+	# Adjust y-coordinates to center
+	y_0 = y_0 - 250
+	y_1 = y_1 - 250
+
+	# Prevent division by zero for vertical lines
+	if x_0 == x_1: x_1 += 1
+
+	# Calculate slope of the line
+	m = (y_1 - y_0)/(x_1 - x_0)
+
+	# Calculate x-coordinate of dual point based on which side we're working on
+	if x_flag == 0:
+		x = int(750 + m*-50)
+	elif x_flag == 1:
+		x = int(250 + m*-50)
+
+	# Calculate y-coordinate of dual point
+	y = 250 + int(m*x_0 - y_0)
+
+	# Handle out-of-bounds cases
+	if x_flag == 0 and x < 500:
+		x = 1500
+	elif x_flag == 1 and x > 500:
+		x = -10
+
+	return Point(x, y)
+
+def get_ray(coords):
+	"""
+	Calculate the endpoint of a ray given its origin and direction.
+
+	Args:
+		coords: List [ox, oy, mx, my] with ray origin (ox, oy) and mouse position (mx, my)
+
+	Returns:
+		List: Coordinates [ox, oy, ex, ey] for ray from origin to edge of display
+	"""
+	ox, oy = coords[0], coords[1]  # Origin coordinates
+	mx, my = coords[2], coords[3]  # Mouse coordinates (direction)
+
+	# Determine bounds based on which half of the screen the ray originates
+	if ox <= 500:
+		min_x = 0
+		max_x = 500
+	elif ox > 500:
+		min_x = 500
+		max_x = 1000
+
+	# Prevent division by zero for vertical rays
+	if ox == mx:
+		ox += 1
+
+	# Calculate slope and y-intercept of ray
+	m = (my - oy)/(mx - ox)
+	b = int(my - m*mx)
+
+	# Calculate endpoint based on ray direction
+	if mx > ox:
+		ey = int(m*max_x + b)
+		ex = max_x
+	elif mx < ox:
+		ey = int(m*min_x + b)
+		ex = min_x
+
+	return [ox, oy, ex, ey]
+
+def get_ray_wedge(dual, line, ox, dx, top=0, bottom=HEIGHT):
+	"""
+	Calculate the wedge region of a ray dual.
+
+	Args:
+		dual: Dual point (x, y) of the ray
+		line: Dual line [startx, starty, endx, endy] of the ray origin
+		ox: X-coordinate of the ray origin
+		dx: X-coordinate of a point further along the ray
+		top: y-coordinate the wedge is cut off at above, the top of the screen by default
+		bottom: y-coordinate the wedge is cut off at below, the bottom of the screen by default
+
+	Returns:
+		Tuple: Two polygons, each closed off by a screen corner and the
+		vertical line through the dual point
+	"""
+	if ox <= 500:
+		if dx >= ox:
+			topc = (1000, top)
+			bottomc = (500, bottom)
+		else:
+			topc = (500, top)
+			bottomc = (1000, bottom)
+	else:
+		if dx >= ox:
+			topc = (500, top)
+			bottomc = (0, bottom)
+		else:
+			topc = (0, top)
+			bottomc = (500, bottom)
+
+	# The wedge opens towards the far end of the dual line
+	if dx >= ox:
+		ws, we = (line[0], line[1]), (line[2], line[3])
+	else:
+		ws, we = (line[2], line[3]), (line[0], line[1])
+
+	dual = (dual[0], dual[1])
+	return ((dual, we, topc, (dual[0], top)),
+			(dual, ws, bottomc, (dual[0], bottom)))
+
+def get_segment_wedge(line_1, line_2, dual):
+	"""
+	Calculate the wedge region of a segment dual.
+
+	Args:
+		line_1: Dual line [startx, starty, endx, endy] of the first endpoint
+		line_2: Dual line [startx, starty, endx, endy] of the second endpoint
+		dual: Dual point (x, y) of the segment
+
+	Returns:
+		Tuple: Two triangles meeting at the dual point
+	"""
+	dual = (dual[0], dual[1])
+	return (((line_1[0], line_1[1]), (line_2[0], line_2[1]), dual),
+			((line_1[2], line_1[3]), (line_2[2], line_2[3]), dual))
+
+def batch_point_duals(points):
+	"""
+	Vectorized get_point_dual for many points at once.
+
+	Args:
+		points: (n, 2) array-like of screen coordinates
+
+	Returns:
+		ndarray: (n, 4) int64 array of dual line endpoints [startx, starty, endx, endy]
+	"""
+	points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+	x, y = points[:, 0], points[:, 1]
+	left = x <= DIVIDER
+	px = x - np.where(left, LEFT_ORIGIN, RIGHT_ORIGIN)
+	py = y - CENTER_Y
+
+	lines = np.empty((len(points), 4), dtype=np.int64)
+	lines[:, 0] = np.where(left, DIVIDER, 0)
+	lines[:, 1] = 250 + px*5 - py
+	lines[:, 2] = np.where(left, WIDTH, DIVIDER)
+	lines[:, 3] = 250 + px*-5 - py
+	return lines
+
+def batch_segment_duals(e1, e2):
+	"""
+	Vectorized get_segment_dual for many segments at once.
+
+	Args:
+		e1: (n, 2) array-like of first endpoints
+		e2: (n, 2) array-like of second endpoints
+
+	Returns:
+		ndarray: (n, 2) int64 array of dual points
+	"""
+	e1 = np.asarray(e1, dtype=np.int64).reshape(-1, 2)
+	e2 = np.asarray(e2, dtype=np.int64).reshape(-1, 2)
+
+	# Both endpoints are shifted by the origin of the half-plane of the first one
+	left = e1[:, 0] <= 500
+	origin = np.where(left, 250, 750)
+	x_0, x_1 = e1[:, 0] - origin, e2[:, 0] - origin
+	y_0, y_1 = e1[:, 1] - 250, e2[:, 1] - 250
+
+	# Prevent division by zero for vertical lines
+	x_1 = np.where(x_0 == x_1, x_1 + 1, x_1)
+	m = (y_1 - y_0)/(x_1 - x_0)
+
+	duals = np.empty((len(e1), 2), dtype=np.int64)
+	duals[:, 0] = np.trunc(np.where(left, 750, 250) + m*-50)
+	duals[:, 1] = 250 + np.trunc(m*x_0 - y_0)
+
+	# Handle out-of-bounds cases
+	duals[left & (duals[:, 0] < 500), 0] = 1500
+	duals[~left & (duals[:, 0] > 500), 0] = -10
+	return duals
+
+def batch_rays(origins, directions):
+	"""
+	Vectorized get_ray for many rays at once.
+
+	Args:
+		origins: (n, 2) array-like of ray origins
+		directions: (n, 2) array-like of points further along each ray
+
+	Returns:
+		ndarray: (n, 4) int64 array of ray coordinates [ox, oy, ex, ey]
+	"""
+	origins = np.asarray(origins, dtype=np.int64).reshape(-1, 2)
+	directions = np.asarray(directions, dtype=np.int64).reshape(-1, 2)
+	ox, oy = origins[:, 0], origins[:, 1]
+	mx, my = directions[:, 0], directions[:, 1]
+	left = ox <= 500
+
+	# Prevent division by zero for vertical rays
+	ox = np.where(ox == mx, ox + 1, ox)
+
+	m = (my - oy)/(mx - ox)
+	b = np.trunc(my - m*mx)
+	ex = np.where(mx > ox, np.where(left, 500, 1000), np.where(left, 0, 500))
+
+	coords = np.empty((len(origins), 4), dtype=np.int64)
+	coords[:, 0] = ox
+	coords[:, 1] = oy
+	coords[:, 2] = ex
+	coords[:, 3] = np.trunc(m*ex + b)
+	return coords
+
+def batch_ray_duals(origins, directions):
+	"""
+	Vectorized ray construction followed by get_segment_dual on each ray.
+
+	Args:
+		origins: (n, 2) array-like of ray origins
+		directions: (n, 2) array-like of points further along each ray
+
+	Returns:
+		Tuple: ((n, 4) ray coordinates, (n, 2) dual points)
+	"""
+	coords = batch_rays(origins, directions)
+	return coords, batch_segment_duals(coords[:, :2], coords[:, 2:])
+
+
+def batch_segment_wedges(line_1, line_2, duals):
+	"""
+	Vectorized get_segment_wedge for many segments at once.
+
+	Args:
+		line_1: (n, 4) array-like of dual lines of the first endpoints
+		line_2: (n, 4) array-like of dual lines of the second endpoints
+		duals: (n, 2) array-like of segment dual points
+
+	Returns:
+		ndarray: (n, 2, 3, 2) int64 array, two triangles of three (x, y) vertices per segment
+	"""
+	line_1 = np.asarray(line_1, dtype=np.int64).reshape(-1, 4)
+	line_2 = np.asarray(line_2, dtype=np.int64).reshape(-1, 4)
+	duals = np.asarray(duals, dtype=np.int64).reshape(-1, 2)
+
+	wedges = np.empty((len(duals), 2, 3, 2), dtype=np.int64)
+	wedges[:, 0, 0] = line_1[:, :2]
+	wedges[:, 0, 1] = line_2[:, :2]
+	wedges[:, 1, 0] = line_1[:, 2:]
+	wedges[:, 1, 1] = line_2[:, 2:]
+	wedges[:, :, 2] = duals[:, None]
+	return wedges
+
+def batch_ray_wedges(duals, lines, ox, dx, top=0, bottom=HEIGHT):
+	"""
+	Vectorized get_ray_wedge for many rays at once.
+
+	Args:
+		duals: (n, 2) array-like of ray dual points
+		lines: (n, 4) array-like of dual lines of the ray origins
+		ox: (n,) array-like of ray origin x-coordinates
+		dx: (n,) array-like of x-coordinates further along each ray
+		top: y-coordinate the wedges are cut off at above, scalar or (n,)
+		bottom: y-coordinate the wedges are cut off at below, scalar or (n,)
+
+	Returns:
+		ndarray: (n, 2, 4, 2) int64 array, two polygons of four (x, y) vertices per ray
+	"""
+	duals = np.asarray(duals, dtype=np.int64).reshape(-1, 2)
+	lines = np.asarray(lines, dtype=np.int64).reshape(-1, 4)
+	ox = np.asarray(ox, dtype=np.int64).ravel()
+	dx = np.asarray(dx, dtype=np.int64).ravel()
+	left = ox <= 500
+	forward = dx >= ox
+
+	# Screen corners closing off each polygon, only their x-coordinates vary
+	top_x = np.where(left, np.where(forward, 1000, 500), np.where(forward, 500, 0))
+	bottom_x = np.where(left, np.where(forward, 500, 1000), np.where(forward, 0, 500))
+
+	wedges = np.empty((len(duals), 2, 4, 2), dtype=np.int64)
+	wedges[:, :, 0] = duals[:, None]
+	wedges[:, 0, 1] = np.where(forward[:, None], lines[:, 2:], lines[:, :2])
+	wedges[:, 1, 1] = np.where(forward[:, None], lines[:, :2], lines[:, 2:])
+	wedges[:, 0, 2, 0] = top_x
+	wedges[:, 0, 2, 1] = top
+	wedges[:, 1, 2, 0] = bottom_x
+	wedges[:, 1, 2, 1] = bottom
+	wedges[:, :, 3, 0] = duals[:, None, 0]
+	wedges[:, 0, 3, 1] = top
+	wedges[:, 1, 3, 1] = bottom
+	return wedges
+
+def inside_polygon(xy, polygon):
+	"""
+	Test many positions against a polygon with the even-odd rule.
+
+	Args:
+		xy: (n, 2) array-like of positions
+		polygon: (m, 2) array-like of vertices, the last one joined to the first
+
+	Returns:
+		ndarray: (n,) bool mask of the positions inside
+	"""
+	xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+	polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+	x, y = xy[:, 0], xy[:, 1]
+	inside = np.zeros(len(xy), dtype=bool)
+	for (x0, y0), (x1, y1) in zip(polygon.tolist(), np.roll(polygon, -1, axis=0).tolist()):
+		# Edges that straddle the horizontal through a position and pass to its right
+		straddles = (y0 > y) != (y1 > y)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			cross = x0 + (y - y0)*(x1 - x0)/(y1 - y0)
+		inside ^= straddles & (x < cross)
+	return inside
+
+class Scene:
+	"""
+	Holds every primitive on both half-planes together with its dual.
+
+	Points, segments and rays each live in a Pool and are addressed by stable
+	integer ids. Segments and rays refer to their points by id. Wedges are not
+	stored, they are derived from the dual buffers when asked for. Points and
+	dual points are also kept in grid indexes for hit-testing.
+
+	Attributes:
+		points (Pool): xy, color and dual line [startx, starty, endx, endy] per point
+		segments (Pool): eps (endpoint ids sorted by x), coords [x0, y0, x1, y1],
+			dual point and color per segment
+		rays (Pool): origin point id, coords [ox, oy, ex, ey], dual point and
+			color per ray
+		point_index (GridIndex): Hit-test index over point positions
+		segment_dual_index (GridIndex): Hit-test index over segment dual points
+		ray_dual_index (GridIndex): Hit-test index over ray dual points
+		point_segments (Adjacency): Point id -> ids of segments attached to it
+		point_rays (Adjacency): Point id -> ids of rays starting at it
+		version (int): Bumped by every edit except move_point and aim_ray, so
+			views can tell when a cached drawing of the scene is stale
+		color_pallete (list): Colors handed out to new primitives
+		color_pt (int): Index of the next color to hand out
+	"""
+	def __init__(self, color_pallete=None):
+		self.color_pallete = color_pallete if color_pallete is not None else gen_color()
+		self.color_pt = 0
+		self.version = 0
+		self.points = Pool({
+			'xy': (np.int32, (2,)),
+			'color': (np.uint8, (3,)),
+			'dual': (np.int32, (4,)),
+		})
+		self.segments = Pool({
+			'eps': (np.int32, (2,)),
+			'coords': (np.int32, (4,)),
+			'dual': (np.int32, (2,)),
+			'color': (np.uint8, (3,)),
+		})
+		self.rays = Pool({
+			'origin': (np.int32, ()),
+			'coords': (np.int32, (4,)),
+			'dual': (np.int32, (2,)),
+			'color': (np.uint8, (3,)),
+		})
+		self.point_index = GridIndex(POINT_RADIUS)
+		self.segment_dual_index = GridIndex(POINT_RADIUS)
+		self.ray_dual_index = GridIndex(POINT_RADIUS)
+		self.point_segments = Adjacency()
+		self.point_rays = Adjacency()
+
+	def clear(self):
+		"""Remove every primitive from the scene."""
+		self.version += 1
+		self.points.clear()
+		self.segments.clear()
+		self.rays.clear()
+		self.point_index.clear()
+		self.segment_dual_index.clear()
+		self.ray_dual_index.clear()
+		self.point_segments.clear()
+		self.point_rays.clear()
+
+	def rebuild_indexes(self):
+		"""Rebuild the hit-test grids and adjacency from the pools in bulk."""
+		self.point_index.clear()
+		self.segment_dual_index.clear()
+		self.ray_dual_index.clear()
+		self.point_segments.clear()
+		self.point_rays.clear()
+
+		ids = self.points.ids()
+		self.point_index.insert_many(ids, self.points.xy[ids])
+		ids = self.segments.ids()
+		self.segment_dual_index.insert_many(ids, self.segments.dual[ids])
+		eps = self.segments.eps[ids]
+		self.point_segments.add_many(eps.T.ravel(), np.concatenate([ids, ids]))
+		ids = self.rays.ids()
+		self.ray_dual_index.insert_many(ids, self.rays.dual[ids])
+		self.point_rays.add_many(self.rays.origin[ids], ids)
+
+	def next_color(self):
+		"""
+		Hand out the next color of the palette.
+
+		Returns:
+			tuple: RGB color value
+		"""
+		color = self.color_pallete[self.color_pt]
+		self.color_pt = (self.color_pt+1)%len(self.color_pallete)
+		return color
+
+	def points_at(self, mx, my, radius=None):
+		"""
+		Find every point under the given coordinates.
+
+		Args:
+			mx: X-coordinate to test
+			my: Y-coordinate to test
+			radius: Half the side of the hit square, POINT_RADIUS if None
+
+		Returns:
+			ndarray: Ids of the points hit, in increasing order
+		"""
+		return np.array(self.point_index.query(mx, my, radius), dtype=np.intp)
+
+	def segment_duals_at(self, mx, my, radius=None):
+		"""
+		Find every segment whose dual point is under the given coordinates.
+
+		Returns:
+			ndarray: Ids of the segments hit, in increasing order
+		"""
+		return np.array(self.segment_dual_index.query(mx, my, radius), dtype=np.intp)
+
+	def ray_duals_at(self, mx, my, radius=None):
+		"""
+		Find every ray whose dual point is under the given coordinates.
+
+		Returns:
+			ndarray: Ids of the rays hit, in increasing order
+		"""
+		return np.array(self.ray_dual_index.query(mx, my, radius), dtype=np.intp)
+
+	def find_point(self, mx, my, radius=None):
+		"""
+		Find the first point under the given coordinates.
+
+		Args:
+			mx: X-coordinate to test
+			my: Y-coordinate to test
+			radius: Half the side of the hit square, POINT_RADIUS if None
+
+		Returns:
+			int: Id of the point, or None if nothing was hit
+		"""
+		hits = self.points_at(mx, my, radius)
+		return int(hits[0]) if len(hits) else None
+
+	def points_in_rect(self, x0, y0, x1, y1):
+		"""
+		Find every point inside a rectangle, edges included.
+
+		Args:
+			x0: X-coordinate of one corner
+			y0: Y-coordinate of one corner
+			x1: X-coordinate of the opposite corner
+			y1: Y-coordinate of the opposite corner
+
+		Returns:
+			ndarray: Ids of the points, in increasing order
+		"""
+		x0, x1 = sorted((x0, x1))
+		y0, y1 = sorted((y0, y1))
+		return np.sort(self.point_index.query_rect(x0, y0, x1, y1))
+
+	def points_in_polygon(self, polygon):
+		"""
+		Find every point inside a polygon, such as a lasso. Only the points in
+		its bounding box are tested.
+
+		Args:
+			polygon: (m, 2) array-like of vertices
+
+		Returns:
+			ndarray: Ids of the points, in increasing order
+		"""
+		polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+		if len(polygon) < 3:
+			return np.empty(0, dtype=np.int64)
+		(x0, y0), (x1, y1) = polygon.min(axis=0), polygon.max(axis=0)
+		ids = self.points_in_rect(x0, y0, x1, y1)
+		return ids[inside_polygon(self.points.xy[ids], polygon)]
+
+	def add_point(self, x, y):
+		"""
+		Add a point and its dual line.
+
+		Args:
+			x: Screen x-coordinate
+			y: Screen y-coordinate
+
+		Returns:
+			int: Id of the new point
+		"""
+		self.version += 1
+		line = get_point_dual(x, y)
+		p = self.points.add(xy=(x, y), color=self.next_color(),
+							dual=(line.startx, line.starty, line.endx, line.endy))
+		self.point_index.insert(p, x, y)
+		return p
+
+	def next_colors(self, n):
+		"""
+		Hand out the next n colors of the palette.
+
+		Args:
+			n: Number of colors
+
+		Returns:
+			ndarray: (n, 3) uint8 array of RGB colors
+		"""
+		palette = np.asarray(self.color_pallete, dtype=np.uint8)
+		colors = palette[(self.color_pt + np.arange(n)) % len(palette)]
+		self.color_pt = (self.color_pt + n) % len(palette)
+		return colors
+
+	def add_points(self, xy):
+		"""
+		Add many points at once with batch_point_duals.
+
+		Args:
+			xy: (n, 2) array-like of screen coordinates
+
+		Returns:
+			ndarray: Ids of the new points
+		"""
+		xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+		self.version += 1
+		ids = self.points.add_many(len(xy), xy=xy, color=self.next_colors(len(xy)),
+								dual=batch_point_duals(xy))
+		self.point_index.insert_many(ids, xy)
+		return ids
+
+	def add_segments(self, p1, p2):
+		"""
+		Connect many pairs of points at once with batch_segment_duals.
+
+		Follows the rules of connect(), except that a horizontal segment is
+		offset by moving its stored second endpoint rather than the point.
+		Pairs on opposite sides of the divider, self-loops and pairs that are
+		already connected (or repeated in the batch) are skipped.
+
+		Args:
+			p1: (n,) array-like of first endpoint ids
+			p2: (n,) array-like of second endpoint ids
+
+		Returns:
+			ndarray: Ids of the new segments
+		"""
+		p1 = np.asarray(p1, dtype=np.int64).ravel()
+		p2 = np.asarray(p2, dtype=np.int64).ravel()
+		xy1 = self.points.xy[p1].astype(np.int64)
+		xy2 = self.points.xy[p2].astype(np.int64)
+		keep = ((xy1[:, 0] <= 500) == (xy2[:, 0] <= 500)) & (p1 != p2)
+		p1, p2, xy1, xy2 = p1[keep], p2[keep], xy1[keep], xy2[keep]
+
+		# Sort endpoints by x-coordinate
+		swap = xy2[:, 0] < xy1[:, 0]
+		p1, p2 = np.where(swap, p2, p1), np.where(swap, p1, p2)
+		xy1, xy2 = np.where(swap[:, None], xy2, xy1), np.where(swap[:, None], xy1, xy2)
+
+		# Drop duplicates, in the batch and against existing segments
+		key = np.minimum(p1, p2) << 32 | np.maximum(p1, p2)
+		_, first = np.unique(key, return_index=True)
+		first.sort()
+		p1, p2, key, xy1, xy2 = p1[first], p2[first], key[first], xy1[first], xy2[first]
+		# Only pairs whose endpoints both have segments can be connected already
+		adjacency = self.point_segments
+		check = np.flatnonzero((adjacency.degree(p1) > 0) & (adjacency.degree(p2) > 0))
+		if len(check):
+			near = [s for p in p1[check].tolist() for s in adjacency.get(p)]
+			old = self.segments.eps[near].astype(np.int64).reshape(-1, 2)
+			old_keys = np.minimum(old[:, 0], old[:, 1]) << 32 | np.maximum(old[:, 0], old[:, 1])
+			fresh = np.ones(len(p1), dtype=bool)
+			fresh[check] = ~np.isin(key[check], old_keys)
+			p1, p2, xy1, xy2 = p1[fresh], p2[fresh], xy1[fresh], xy2[fresh]
+		if not len(p1):
+			return np.empty(0, dtype=np.intp)
+
+		coords = np.concatenate([xy1, xy2], axis=1)
+		coords[coords[:, 1] == coords[:, 3], 3] -= 1  # Avoid horizontal lines
+		duals = batch_segment_duals(coords[:, :2], coords[:, 2:])
+
+		# Both endpoints take the color of their segment
+		self.version += 1
+		colors = self.next_colors(len(p1))
+		self.points.color[p1] = colors
+		self.points.color[p2] = colors
+
+		ids = self.segments.add_many(len(p1), eps=np.stack([p1, p2], axis=1), coords=coords,
+									dual=duals, color=colors)
+		self.segment_dual_index.insert_many(ids, duals)
+		self.point_segments.add_many(np.concatenate([p1, p2]), np.concatenate([ids, ids]))
+		return ids
+
+	def add_rays(self, origins, directions):
+		"""
+		Add many finished rays at once with batch_ray_duals.
+
+		Args:
+			origins: (n,) array-like of origin point ids
+			directions: (n, 2) array-like of points each ray passes through
+
+		Returns:
+			ndarray: Ids of the new rays
+		"""
+		origins = np.asarray(origins, dtype=np.int64).ravel()
+		coords, duals = batch_ray_duals(self.points.xy[origins], directions)
+		self.version += 1
+		colors = self.next_colors(len(origins))
+		self.points.color[origins] = colors
+		ids = self.rays.add_many(len(origins), origin=origins, coords=coords, dual=duals, color=colors)
+		self.ray_dual_index.insert_many(ids, duals)
+		self.point_rays.add_many(origins, ids)
+		return ids
+
+	def incident(self, p):
+		"""
+		Find the segments and rays attached to a point.
+
+		Args:
+			p: Id of the point
+
+		Returns:
+			Tuple: (seg_changed, ray_changed) where seg_changed holds
+			[segment id, endpoint slot] pairs and ray_changed ray ids
+		"""
+		eps = self.segments.eps
+		seg_changed = [[s, int(eps[s, 1] == p)] for s in sorted(self.point_segments.get(p))]
+		ray_changed = sorted(self.point_rays.get(p))
+		return seg_changed, ray_changed
+
+	def delete_point(self, p):
+		"""
+		Delete a point along with every segment and ray attached to it.
+
+		Args:
+			p: Id of the point
+		"""
+		self.version += 1
+		for s in self.point_segments.pop(p):
+			other = int(self.segments.eps[s, 0] if self.segments.eps[s, 1] == p else self.segments.eps[s, 1])
+			self.point_segments.discard(other, s)
+			self.segments.remove(s)
+			self.segment_dual_index.remove(s)
+		for r in self.point_rays.pop(p):
+			self.rays.remove(r)
+			self.ray_dual_index.remove(r)
+		self.points.remove(p)
+		self.point_index.remove(p)
+
+	def delete_points(self, ids):
+		"""
+		Delete many points at once along with every segment and ray attached
+		to them. Pools and grids are updated in one pass per kind; only the
+		adjacency of the points that had something attached is edited one
+		point at a time.
+
+		Args:
+			ids: (n,) array of distinct live point ids
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		if not len(ids):
+			return
+		self.version += 1
+		segments, rays = self.incident_many(ids)
+		if len(segments):
+			# Segments going to points that stay are detached from them
+			eps = self.segments.eps[segments].astype(np.int64)
+			stays = ~np.isin(eps, ids)
+			for s, p in zip(np.broadcast_to(segments[:, None], eps.shape)[stays].tolist(), eps[stays].tolist()):
+				self.point_segments.discard(p, s)
+			self.segments.remove_many(segments)
+			self.segment_dual_index.remove_many(segments)
+		if len(rays):
+			self.rays.remove_many(rays)
+			self.ray_dual_index.remove_many(rays)
+		attached = (self.point_segments.degree(ids) + self.point_rays.degree(ids)) > 0
+		for p in ids[attached].tolist():
+			self.point_segments.pop(p)
+			self.point_rays.pop(p)
+		self.points.remove_many(ids)
+		self.point_index.remove_many(ids)
+
+	def incident_many(self, ids):
+		"""
+		Find the segments and rays attached to any of many points.
+
+		Args:
+			ids: (n,) array of point ids
+
+		Returns:
+			Tuple: (segment ids, ray ids) sorted arrays
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		attached = ids[(self.point_segments.degree(ids) + self.point_rays.degree(ids)) > 0]
+		segments, rays = set(), set()
+		for p in attached.tolist():
+			segments |= self.point_segments.get(p)
+			rays |= self.point_rays.get(p)
+		return (np.array(sorted(segments), dtype=np.int64), np.array(sorted(rays), dtype=np.int64))
+
+	def move_points(self, ids, dx, dy, segments=None, rays=None):
+		"""
+		Move many points by the same offset and update the duals of the
+		points and of every segment and ray attached to them in one pass.
+
+		Points with a segment or ray attached are kept at LEFT_LIMIT or
+		RIGHT_LIMIT from the divider, like move_point does, by shortening the
+		offset, so the points keep their shape.
+		Like move_point, this leaves the version alone.
+
+		Args:
+			ids: (n,) array of distinct point ids
+			dx: Offset along x
+			dy: Offset along y
+			segments: Segments attached to the points from incident_many(),
+				looked up if None
+			rays: Rays attached to the points from incident_many(), looked
+				up if None
+
+		Returns:
+			Tuple: (dx, dy) offset the points were moved by
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		if segments is None or rays is None:
+			segments, rays = self.incident_many(ids)
+		xy = self.points.xy[ids].astype(np.int64)
+		dx, dy = int(round(dx)), int(round(dy))
+		attached = (self.point_segments.degree(ids) + self.point_rays.degree(ids)) > 0
+		x = xy[attached, 0]
+		left = x <= DIVIDER
+		# Points already past the limits are not pushed back, only kept from going further
+		dx = min(dx, max(0, LEFT_LIMIT - int(x[left].max(initial=-WIDTH))))
+		dx = max(dx, min(0, RIGHT_LIMIT - int(x[~left].min(initial=2*WIDTH))))
+		if not len(ids) or dx == dy == 0:
+			return 0, 0
+
+		xy += (dx, dy)
+		self.points.xy[ids] = xy
+		self.points.dual[ids] = batch_point_duals(xy)
+		self.point_index.remove_many(ids)
+		self.point_index.insert_many(ids, xy)
+
+		if len(segments):
+			eps = self.segments.eps[segments].astype(np.int64)
+			e1, e2 = self.points.xy[eps[:, 0]].astype(np.int64), self.points.xy[eps[:, 1]].astype(np.int64)
+			# Keep the endpoints sorted by x-coordinate
+			swap = e2[:, 0] < e1[:, 0]
+			self.segments.eps[segments] = np.where(swap[:, None], eps[:, ::-1], eps)
+			coords = np.where(swap[:, None], np.concatenate([e2, e1], axis=1), np.concatenate([e1, e2], axis=1))
+			coords[coords[:, 1] == coords[:, 3], 3] -= 1  # Avoid horizontal lines
+			duals = batch_segment_duals(coords[:, :2], coords[:, 2:])
+			self.segments.coords[segments] = coords
+			self.segments.dual[segments] = duals
+			self.segment_dual_index.remove_many(segments)
+			self.segment_dual_index.insert_many(segments, duals)
+
+		if len(rays):
+			coords = self.rays.coords[rays].astype(np.int64)
+			coords[:, :2] = self.points.xy[self.rays.origin[rays]]
+			duals = batch_segment_duals(coords[:, :2], coords[:, 2:])
+			self.rays.coords[rays] = coords
+			self.rays.dual[rays] = duals
+			self.ray_dual_index.remove_many(rays)
+			self.ray_dual_index.insert_many(rays, duals)
+		return dx, dy
+
+	def connect(self, p1, p2):
+		"""
+		Create a segment between two points if they're on the same side and
+		the segment doesn't already exist.
+
+		Args:
+			p1: Id of the first point
+			p2: Id of the second point
+
+		Returns:
+			int: Id of the new segment, or None if none was created
+		"""
+		xy = self.points.xy
+		if (xy[p1, 0] <= 500) != (xy[p2, 0] <= 500):
+			return None
+		if not self.point_segments.get(p1).isdisjoint(self.point_segments.get(p2)):
+			return None
+
+		self.version += 1
+
+		# Avoid horizontal lines by offsetting slightly
+		if xy[p1, 1] == xy[p2, 1]:
+			self._place_point(p2, int(xy[p2, 0]), int(xy[p2, 1]) - 1)
+
+		# Sort endpoints by x-coordinate and store endpoint ids in the same order
+		if xy[p2, 0] < xy[p1, 0]:
+			p1, p2 = p2, p1
+		a, b = xy[p1].tolist(), xy[p2].tolist()
+		dual = get_segment_dual(a, b)
+
+		# Assign same color to both endpoints
+		color = self.next_color()
+		self.points.color[p1] = color
+		self.points.color[p2] = color
+
+		s = self.segments.add(eps=(p1, p2), coords=(*a, *b), color=color)
+		self._set_segment_dual(s, dual)
+		self.point_segments.add(p1, s)
+		self.point_segments.add(p2, s)
+		return s
+
+	def add_ray(self, p, mx, my):
+		"""
+		Start a ray from a point towards the given coordinates.
+
+		Args:
+			p: Id of the origin point
+			mx: X-coordinate the ray points towards
+			my: Y-coordinate the ray points towards
+
+		Returns:
+			int: Id of the new ray
+		"""
+		self.version += 1
+		color = self.next_color()
+		self.points.color[p] = color
+		coords = get_ray([*self.points.xy[p].tolist(), mx, my])
+		r = self.rays.add(origin=p, coords=coords, color=color)
+		self._set_ray_dual(r, get_segment_dual(coords[:2], coords[2:]))
+		self.point_rays.add(p, r)
+		return r
+
+	def aim_ray(self, r, mx, my):
+		"""
+		Point a ray that is being placed towards the given coordinates.
+
+		Args:
+			r: Id of the ray
+			mx: X-coordinate the ray points towards
+			my: Y-coordinate the ray points towards
+		"""
+		coords = self.rays.coords[r]
+		coords[2:] = mx, my
+		self._set_ray_dual(r, get_segment_dual(coords[:2].tolist(), coords[2:].tolist()))
+
+	def finish_ray(self, r):
+		"""
+		Extend a ray that is being placed to the edge of its half-plane.
+
+		Args:
+			r: Id of the ray
+		"""
+		self.version += 1
+		coords = get_ray(self.rays.coords[r].tolist())
+		self.rays.coords[r] = coords
+		self._set_ray_dual(r, get_segment_dual(coords[:2], coords[2:]))
+
+	def segment_wedge(self, s):
+		"""
+		Calculate the wedge region of a segment dual.
+
+		Args:
+			s: Id of the segment
+
+		Returns:
+			Tuple: Two triangles, see get_segment_wedge
+		"""
+		p1, p2 = self.segments.eps[s].tolist()
+		return get_segment_wedge(self.points.dual[p1].tolist(), self.points.dual[p2].tolist(),
+								self.segments.dual[s].tolist())
+
+	def ray_wedge(self, r, top=0, bottom=HEIGHT):
+		"""
+		Calculate the wedge region of a ray dual.
+
+		Args:
+			r: Id of the ray
+			top: y-coordinate the wedge is cut off at above
+			bottom: y-coordinate the wedge is cut off at below
+
+		Returns:
+			Tuple: Two polygons, see get_ray_wedge
+		"""
+		coords = self.rays.coords[r].tolist()
+		return get_ray_wedge(self.rays.dual[r].tolist(), self.points.dual[self.rays.origin[r]].tolist(),
+							coords[0], coords[2], top, bottom)
+
+	def _place_point(self, p, x, y):
+		"""Move a point and its dual line without touching attached primitives."""
+		line = get_point_dual(x, y)
+		self.points.xy[p] = x, y
+		self.points.dual[p] = line.startx, line.starty, line.endx, line.endy
+		self.point_index.move(p, x, y)
+
+	def _set_segment_dual(self, s, dual):
+		"""Store the dual Point of a segment and re-index it."""
+		self.segments.dual[s] = dual.x, dual.y
+		self.segment_dual_index.move(s, dual.x, dual.y)
+
+	def _set_ray_dual(self, r, dual):
+		"""Store the dual Point of a ray and re-index it."""
+		self.rays.dual[r] = dual.x, dual.y
+		self.ray_dual_index.move(r, dual.x, dual.y)
+
+	def move_point(self, p, x, y, seg_changed=(), ray_changed=()):
+		"""
+		Move a point and update the segments and rays attached to it.
+
+		A point with a segment or ray attached is kept on its own side of the
+		divider, up to LEFT_LIMIT or RIGHT_LIMIT.
+
+		Args:
+			p: Id of the point
+			x: New screen x-coordinate
+			y: New screen y-coordinate
+			seg_changed: [segment id, endpoint slot] pairs from incident();
+				slots are flipped in place when a segment's endpoints swap order
+			ray_changed: Ray ids from incident()
+		"""
+		xy = self.points.xy
+		self._place_point(p, x, y)
+
+		for sc in seg_changed:
+			s, slot = sc
+			coords = self.segments.coords[s]
+			# Prevent moving point across dividing line if segment connects to point on other side
+			other_x = coords[2*(1 - slot)]
+			if other_x <= LEFT_LIMIT and xy[p, 0] > LEFT_LIMIT:
+				self._place_point(p, LEFT_LIMIT, y)
+			elif other_x > RIGHT_LIMIT and xy[p, 0] <= RIGHT_LIMIT:
+				self._place_point(p, RIGHT_LIMIT, y)
+
+			# Update segment endpoints and sort if needed
+			coords[2*slot:2*slot + 2] = xy[p]
+			if coords[1] == coords[3]:
+				coords[3] -= 1  # Avoid horizontal lines
+
+			# Swap endpoints if needed to maintain x-ordering
+			if coords[2] < coords[0]:
+				coords[:] = coords[[2, 3, 0, 1]]
+				self.segments.eps[s] = self.segments.eps[s, ::-1].copy()
+				sc[1] = 1 - slot
+
+			# Update dual point
+			self._set_segment_dual(s, get_segment_dual(coords[:2].tolist(), coords[2:].tolist()))
+
+		for r in ray_changed:
+			coords = self.rays.coords[r]
+			# Prevent moving point across dividing line if ray exists
+			if xy[p, 0] > LEFT_LIMIT and coords[0] <= LEFT_LIMIT:
+				self._place_point(p, LEFT_LIMIT, y)
+			elif xy[p, 0] <= RIGHT_LIMIT and coords[0] > RIGHT_LIMIT:
+				self._place_point(p, RIGHT_LIMIT, y)
+
+			coords[:2] = xy[p]
+			self._set_ray_dual(r, get_segment_dual(coords[:2].tolist(), coords[2:].tolist()))
+
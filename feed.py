@@ -0,0 +1,296 @@
+"""
+Live point feeds: points streamed in over a pipe or a local socket, of which
+only a rolling window stays in the scene.
+
+The reading and parsing runs on a thread of its own with read_feed(), which
+collects the lines that come in during settings.FEED_BATCH_MS into one batch
+and parses it with the import pipeline. Every line is a point, either as
+plain CSV values or as an NDJSON object:
+
+	120,80
+	{"x": 120, "y": 80}
+
+Feed.add() then puts each batch in the scene on the main loop with the batch
+dual transforms and evicts the points that fell out of the window, the
+oldest first. The window is a queue of batches with a read position into the
+oldest one, so every point is queued and evicted once and the whole window
+costs O(1) amortized per point. Evicted ids are freed for the next batches.
+Each id records the serial of the batch it belongs to, so a point the user
+deleted is not evicted again with its old batch once a later batch took its id.
+
+Every batch starts the undo history over, as it reuses the ids of deleted
+points, so edits cannot be undone while a feed is running.
+
+Sources:
+
+	-                  standard input, e.g. `producer | python3 duality.py --feed -`
+	tcp:PORT           listen on localhost, any number of clients at a time
+	tcp:HOST:PORT      listen on another interface
+"""
+import os, selectors, socket, sys, time
+from collections import deque
+
+import numpy as np
+
+import settings
+from importer import csv_columns, split_lines, to_arrays
+
+CSV_COLUMNS = csv_columns('x,y')	# Columns of the plain CSV lines of a feed
+
+
+def parse_lines(lines, first=1):
+	"""
+	Parse a batch of feed lines.
+
+	Args:
+		lines: List of non-blank lines, CSV values or NDJSON objects
+		first: Record number of the first line, used in error messages
+
+	Returns:
+		ndarray: (n, 2) int64 array of point positions
+
+	Raises:
+		ValueError: On a malformed line or a record that is not a point
+	"""
+	ndjson = [line for line in lines if line.lstrip().startswith('{')]
+	csv = [line for line in lines if not line.lstrip().startswith('{')]
+	xy = []
+	for group, columns in ((csv, CSV_COLUMNS), (ndjson, None)):
+		if group:
+			arrays = to_arrays(split_lines(group, columns, first), first)
+			if len(arrays['segment']) or len(arrays['ray']):
+				raise ValueError(f'records {first}-{first + len(lines) - 1}: a feed only takes points')
+			xy.append(arrays['point'][:, :2])
+	return np.concatenate(xy) if xy else np.empty((0, 2), dtype=np.int64)
+
+def _listen(source):
+	"""Open the socket or file descriptor of a feed source."""
+	if source == '-':
+		return sys.stdin.fileno()
+	kind, _, address = source.partition(':')
+	if kind != 'tcp' or not address:
+		raise ValueError(f'unknown feed source {source!r}, expected - or tcp:[HOST:]PORT')
+	host, _, port = address.rpartition(':')
+	server = socket.create_server((host or 'localhost', int(port)))
+	server.setblocking(False)
+	return server
+
+def read_feed(source, cancelled, batch_ms=None):
+	"""
+	Read a feed until it ends or is cancelled, without touching any scene,
+	so it can run on a thread of its own.
+
+	Standard input ends at end of file; a socket keeps accepting clients
+	until cancelled. Lines split over several reads are put back together.
+	A batch with a malformed line is reported on stderr and dropped, so one
+	bad client does not end the feed.
+
+	Args:
+		source: '-' or 'tcp:[HOST:]PORT'
+		cancelled: Event that stops the feed when set
+		batch_ms: Time over which lines are collected into one batch,
+			settings.FEED_BATCH_MS if None
+
+	Yields:
+		ndarray: (n, 2) int64 array of the points of each batch
+
+	Raises:
+		ValueError: If the source is not understood
+		OSError: If the socket cannot be opened
+	"""
+	batch = (batch_ms if batch_ms is not None else settings.FEED_BATCH_MS)/1000
+	listener = _listen(source)
+	selector = selectors.DefaultSelector()
+	selector.register(listener, selectors.EVENT_READ)
+	pending = {}	# Connection -> bytes of its unfinished last line
+	lines = []
+	first = 1
+	start = time.perf_counter()
+	try:
+		while not cancelled.is_set() and selector.get_map():
+			for key, _ in selector.select(min(batch, 0.05)):
+				connection = key.fileobj
+				if connection is listener and isinstance(listener, socket.socket):
+					client, _ = listener.accept()
+					client.setblocking(False)
+					selector.register(client, selectors.EVENT_READ)
+					continue
+				data = _receive(connection)
+				if data is None:
+					continue
+				buffered = pending.pop(connection, b'') + data
+				if data:
+					complete, _, pending[connection] = buffered.rpartition(b'\n')
+				else:
+					# End of the stream, its last line may lack a newline
+					selector.unregister(connection)
+					if isinstance(connection, socket.socket):
+						connection.close()
+					complete = buffered
+				lines += [line for line in complete.decode(errors='replace').splitlines() if line.strip()]
+
+			if not lines:
+				start = time.perf_counter()
+			elif time.perf_counter() - start >= batch:
+				xy = _parse(source, lines, first)
+				if xy is not None:
+					yield xy
+				first += len(lines)
+				lines = []
+				start = time.perf_counter()
+		if lines and not cancelled.is_set():
+			xy = _parse(source, lines, first)
+			if xy is not None:
+				yield xy
+	finally:
+		for key in list(selector.get_map().values()):
+			if isinstance(key.fileobj, socket.socket):
+				key.fileobj.close()
+		selector.close()
+
+def _receive(connection):
+	"""Read what a connection has: b'' at its end, None if it had nothing after all."""
+	try:
+		if isinstance(connection, socket.socket):
+			return connection.recv(1 << 16)
+		return os.read(connection, 1 << 16)
+	except (BlockingIOError, InterruptedError):
+		return None
+	except ConnectionError:
+		return b''
+
+def _parse(source, lines, first):
+	"""Parse a batch with parse_lines(), reporting and dropping it if it is malformed."""
+	try:
+		return parse_lines(lines, first)
+	except ValueError as e:
+		print(f'Feed {source}: {e}', file=sys.stderr)
+		return None
+
+
+class Feed:
+	"""
+	Rolling window over the points of a live feed.
+
+	Attributes:
+		scene (Scene): Scene the points are added to
+		max_points (int): Most points kept, 0 for no limit
+		seconds (float): Longest time a point is kept, 0 for no limit
+		batches (deque): [arrival time, ids, read position, serial] of every
+			batch in the window, oldest first; ids before the read position are gone
+		count (int): Number of points in the window
+		owner (ndarray): Serial of the batch each point id belongs to, -1 for
+			none, so points the user deleted in the meantime are not evicted
+			again, even once a later batch reused their ids
+		serial (int): Serial of the next batch
+	"""
+	def __init__(self, scene, max_points=None, seconds=None):
+		self.max_points = settings.FEED_MAX_POINTS if max_points is None else max_points
+		self.seconds = settings.FEED_SECONDS if seconds is None else seconds
+		self.reset(scene)
+
+	def __len__(self):
+		return self.count
+
+	def reset(self, scene):
+		"""
+		Forget the window and start over on a scene, leaving the points in it.
+
+		Args:
+			scene: Scene to add to from now on
+		"""
+		self.scene = scene
+		self.batches = deque()
+		self.count = 0
+		self.owner = np.zeros(0, dtype=np.int64)
+		self.serial = 0
+
+	def discard(self, p):
+		"""
+		Take a point out of the window after it was deleted some other way.
+
+		Args:
+			p: Id of the point
+		"""
+		if p < len(self.owner) and self.owner[p] >= 0:
+			self.owner[p] = -1
+			self.count -= 1
+
+	def add(self, xy, now=None):
+		"""
+		Add a batch of points and evict the points that fell out of the window.
+
+		Args:
+			xy: (n, 2) positions of the new points
+			now: Arrival time in seconds, time.monotonic() if None
+
+		Returns:
+			Tuple: (ids of the points added, ids of the points evicted)
+		"""
+		now = time.monotonic() if now is None else now
+		ids = self.scene.add_points(xy) if len(xy) else np.empty(0, dtype=np.int64)
+		if len(ids):
+			if int(ids.max()) >= len(self.owner):
+				owner = np.full(max(int(ids.max()) + 1, 2*len(self.owner)), -1, dtype=np.int64)
+				owner[:len(self.owner)] = self.owner
+				self.owner = owner
+			self.owner[ids] = self.serial
+			self.batches.append([now, ids, 0, self.serial])
+			self.serial += 1
+			self.count += len(ids)
+		return ids, self.evict(now)
+
+	def expires(self, now=None):
+		"""
+		Get the time left until the oldest points age out of the window.
+
+		Args:
+			now: Current time in seconds, time.monotonic() if None
+
+		Returns:
+			float: Seconds until the next eviction by age, or None if no point ages out
+		"""
+		if not self.seconds or not self.batches:
+			return None
+		now = time.monotonic() if now is None else now
+		return max(0.0, self.batches[0][0] + self.seconds - now)
+
+	def evict(self, now=None):
+		"""
+		Delete the oldest points until the window fits its limits.
+
+		Args:
+			now: Current time in seconds, time.monotonic() if None
+
+		Returns:
+			ndarray: Ids of the points evicted
+		"""
+		now = time.monotonic() if now is None else now
+		evicted = []
+		while self.batches:
+			batch = self.batches[0]
+			arrived, ids, at, serial = batch
+			if self.seconds and now - arrived > self.seconds:
+				end = len(ids)
+			elif self.max_points and self.count > self.max_points:
+				# Count the points still owned as they are evicted, the user may have deleted some
+				end = at
+				excess = self.count - self.max_points
+				while end < len(ids) and excess:
+					step = min(excess, len(ids) - end)
+					excess -= int((self.owner[ids[end:end + step]] == serial).sum())
+					end += step
+			else:
+				break
+			gone = ids[at:end]
+			gone = gone[self.owner[gone] == serial]
+			self.owner[gone] = -1
+			self.count -= len(gone)
+			evicted.append(gone)
+			if end == len(ids):
+				self.batches.popleft()
+			else:
+				batch[2] = end
+		evicted = np.concatenate(evicted) if evicted else np.empty(0, dtype=np.int64)
+		self.scene.delete_points(evicted)
+		return evicted
@@ -0,0 +1,221 @@
+"""
+Density heatmaps, the level-of-detail mode of the renderer.
+
+Past a few thousand duals a half-plane is a solid smear of lines that costs a
+lot to draw and shows nothing. Instead, the duals drawn into the half-plane
+are accumulated into a grid of counts, one cell per settings.HEATMAP_CELL
+screen pixels, and shown as a single image:
+
+	points      add one to their cell
+	lines       add one to every cell they cross, sampled along their major axis
+	polygons    add one to every cell whose center is inside, filled column by column
+
+Nothing in here imports pygame or touches a scene after gather_duals(), so
+dual_density() can run on a worker thread.
+"""
+import numpy as np
+
+import settings
+from engine import DIVIDER, HEIGHT, batch_ray_wedges, batch_segment_wedges
+
+CHUNK = 1 << 21		# Samples computed at a time, bounds the temporary arrays
+
+# Colors of increasing density, interpolated into a 256 entry lookup table.
+# Entry 0 is black so empty cells can be made transparent with a colorkey.
+STOPS = np.array([(40, 0, 90), (150, 20, 130), (240, 90, 50), (255, 230, 120), (255, 255, 255)])
+LUT = np.zeros((256, 3), dtype=np.uint8)
+LUT[1:] = np.stack([np.interp(np.linspace(0, 1, 255), np.linspace(0, 1, len(STOPS)), STOPS[:, c])
+					for c in range(3)], axis=1)
+
+
+def add_points(grid, xy):
+	"""
+	Add one to the cell of every point.
+
+	Args:
+		grid: (w, h) float64 array of counts, updated in place
+		xy: (n, 2) array of grid coordinates
+	"""
+	w, h = grid.shape
+	cells = np.floor(np.asarray(xy, dtype=np.float64)).astype(np.int64)
+	inside = (cells[:, 0] >= 0) & (cells[:, 0] < w) & (cells[:, 1] >= 0) & (cells[:, 1] < h)
+	cells = cells[inside]
+	grid += np.bincount(cells[:, 0]*h + cells[:, 1], minlength=w*h).reshape(w, h)
+
+def clip_lines(lines, w, h):
+	"""
+	Clip line segments to the rectangle [0, w] x [0, h] (Liang-Barsky).
+
+	Args:
+		lines: (n, 4) array of [x0, y0, x1, y1] grid coordinates
+		w: Width of the rectangle
+		h: Height of the rectangle
+
+	Returns:
+		ndarray: (m, 4) float64 array of the parts inside, lines that miss
+		the rectangle are dropped
+	"""
+	lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+	x0, y0, x1, y1 = lines.T
+	dx, dy = x1 - x0, y1 - y0
+	t0, t1 = np.zeros(len(lines)), np.ones(len(lines))
+	keep = np.ones(len(lines), dtype=bool)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		for p, q in ((-dx, x0), (dx, w - x0), (-dy, y0), (dy, h - y0)):
+			r = q/p
+			t0 = np.where(p < 0, np.maximum(t0, r), t0)
+			t1 = np.where(p > 0, np.minimum(t1, r), t1)
+			keep &= (p != 0) | (q >= 0)
+	keep &= t0 <= t1
+	x0, y0, dx, dy, t0, t1 = (a[keep] for a in (x0, y0, dx, dy, t0, t1))
+	return np.stack([x0 + t0*dx, y0 + t0*dy, x0 + t1*dx, y0 + t1*dy], axis=1)
+
+def add_lines(grid, lines, cancelled=None):
+	"""
+	Add one to every cell crossed by a line segment, one sample per cell
+	along the major axis of each segment.
+
+	Args:
+		grid: (w, h) float64 array of counts, updated in place
+		lines: (n, 4) array of [x0, y0, x1, y1] grid coordinates
+		cancelled: Event that stops the work early when set
+	"""
+	w, h = grid.shape
+	lines = clip_lines(lines, w, h)
+	start, delta = lines[:, :2], lines[:, 2:] - lines[:, :2]
+	counts = np.ceil(np.abs(delta).max(axis=1)).astype(np.int64) + 1
+	step = max(1, CHUNK//(max(w, h) + 2))
+	for i in range(0, len(lines), step):
+		if cancelled is not None and cancelled.is_set():
+			return
+		n = counts[i:i + step]
+		k = np.arange(n.max(initial=1))
+		t = k/np.maximum(n - 1, 1)[:, None]
+		mask = k < n[:, None]
+		x = start[i:i + step, 0, None] + t*delta[i:i + step, 0, None]
+		y = start[i:i + step, 1, None] + t*delta[i:i + step, 1, None]
+		add_points(grid, np.stack([x[mask], y[mask]], axis=1))
+
+def add_polygons(grid, polygons, cancelled=None):
+	"""
+	Add one to every cell whose center lies inside a polygon. Each column is
+	filled between the lowest and highest crossing of the polygon's edges,
+	which is exact for convex polygons.
+
+	Args:
+		grid: (w, h) float64 array of counts, updated in place
+		polygons: (n, k, 2) array of grid coordinates
+		cancelled: Event that stops the work early when set
+	"""
+	w, h = grid.shape
+	polygons = np.asarray(polygons, dtype=np.float64)
+	n, k = polygons.shape[:2]
+	columns = np.arange(w) + 0.5
+	step = max(1, CHUNK//(w*k))
+	diff = np.zeros(w*(h + 1))
+	for i in range(0, n, step):
+		if cancelled is not None and cancelled.is_set():
+			return
+		chunk = polygons[i:i + step]
+		lo = np.full((len(chunk), w), np.inf)
+		hi = np.full((len(chunk), w), -np.inf)
+		for e in range(k):
+			p, q = chunk[:, e], chunk[:, (e + 1) % k]
+			x0, x1 = np.minimum(p[:, 0], q[:, 0]), np.maximum(p[:, 0], q[:, 0])
+			crosses = (columns >= x0[:, None]) & (columns <= x1[:, None]) & (x1 > x0)[:, None]
+			with np.errstate(divide='ignore', invalid='ignore'):
+				slope = (q[:, 1] - p[:, 1])/(q[:, 0] - p[:, 0])
+				y = p[:, 1, None] + (columns - p[:, 0, None])*slope[:, None]
+			lo = np.where(crosses, np.minimum(lo, y), lo)
+			hi = np.where(crosses, np.maximum(hi, y), hi)
+
+		# Rows whose centers are in [lo, hi], as +1/-1 steps down each column
+		with np.errstate(invalid='ignore'):
+			first = np.clip(np.ceil(lo - 0.5), 0, h)
+			stop = np.clip(np.floor(hi - 0.5) + 1, 0, h)
+		filled = first < stop
+		col = np.broadcast_to(np.arange(w), filled.shape)[filled]
+		diff += np.bincount(col*(h + 1) + first[filled].astype(np.int64), minlength=len(diff))
+		diff -= np.bincount(col*(h + 1) + stop[filled].astype(np.int64), minlength=len(diff))
+	grid += np.cumsum(diff.reshape(w, h + 1), axis=1)[:, :h]
+
+def gather_duals(scene, points, segments, rays):
+	"""
+	Copy the dual geometry of some primitives out of a scene. Runs on the
+	main thread; the copies can then be handed to a worker.
+
+	Args:
+		scene: Scene to read
+		points: Ids of points whose dual lines are drawn
+		segments: Ids of segments whose dual points and wedges are drawn
+		rays: Ids of rays whose dual points, dual lines and wedges are drawn
+
+	Returns:
+		dict: Arrays in world coordinates
+	"""
+	eps = scene.segments.eps[segments]
+	return {
+		'point_lines': scene.points.dual[points],
+		'segment_duals': scene.segments.dual[segments],
+		'segment_lines': (scene.points.dual[eps[:, 0]], scene.points.dual[eps[:, 1]]),
+		'ray_duals': scene.rays.dual[rays],
+		'ray_lines': scene.points.dual[scene.rays.origin[rays]],
+		'ray_coords': scene.rays.coords[rays],
+	}
+
+def dual_density(view, half, duals, cell=None, cancelled=None):
+	"""
+	Accumulate the duals drawn into one half-plane into a density grid.
+
+	Args:
+		view: View the half-plane is drawn with; it is only read
+		half: Half-plane the duals are drawn into
+		duals: Arrays returned by gather_duals()
+		cell: Screen pixels per grid cell, settings.HEATMAP_CELL if None
+		cancelled: Event that stops the work early when set
+
+	Returns:
+		ndarray: (w, h) float64 array of counts, indexed [x, y] like a Surface
+	"""
+	cell = cell or settings.HEATMAP_CELL
+	grid = np.zeros((-(-DIVIDER // cell), -(-HEIGHT // cell)))
+	_, top, _, bottom = view.halves[half].bounds()
+	top, bottom = int(np.floor(top)), int(np.ceil(bottom))
+
+	def to_grid(xy):
+		screen = view.to_screen(xy, half).astype(np.float64)
+		screen[..., 0] -= DIVIDER*half
+		return screen/cell
+
+	ray_duals, ray_coords = duals['ray_duals'], duals['ray_coords']
+	verticals = np.stack([ray_duals[:, 0], np.full(len(ray_duals), top),
+						ray_duals[:, 0], np.full(len(ray_duals), bottom)], axis=1)
+	lines = np.concatenate([duals['point_lines'], verticals])
+	add_lines(grid, to_grid(lines.reshape(-1, 2, 2)).reshape(-1, 4), cancelled)
+
+	add_points(grid, to_grid(np.concatenate([duals['segment_duals'], ray_duals])))
+
+	wedges = batch_segment_wedges(*duals['segment_lines'], duals['segment_duals'])
+	add_polygons(grid, to_grid(wedges.reshape(-1, 3, 2)), cancelled)
+	wedges = batch_ray_wedges(ray_duals, duals['ray_lines'], ray_coords[:, 0], ray_coords[:, 2], top, bottom)
+	add_polygons(grid, to_grid(wedges.reshape(-1, 4, 2)), cancelled)
+	return grid
+
+def colorize(grid):
+	"""
+	Map a density grid to colors by rank, so the lookup table is spread
+	evenly over the cells that are not empty whatever the range of counts.
+
+	Args:
+		grid: (w, h) array of counts
+
+	Returns:
+		ndarray: (w, h, 3) uint8 array, black exactly where the count is 0
+	"""
+	filled = grid > 0.5
+	levels = np.unique(grid[filled])
+	index = np.zeros(grid.shape, dtype=np.intp)
+	if len(levels):
+		rank = np.searchsorted(levels, grid[filled])
+		index[filled] = 1 + rank*254//max(len(levels) - 1, 1)
+	return LUT[index]
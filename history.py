@@ -0,0 +1,343 @@
+"""
+Undo and redo of scene edits.
+
+Every edit is recorded as the rows of the primitives it touched, before and
+after, copied out of the scene's pools: a point that was dragged, the
+segments and rays that followed it, a segment that was connected, everything
+a deletion took with it. Undoing or redoing an edit puts one set of rows back
+under the same ids and re-indexes only those primitives, so it costs
+O(primitives touched) whatever the size of the scene, and later edits in the
+log still find the ids they refer to.
+
+Every settings.HISTORY_SNAPSHOT_EVERY edits the whole scene is also copied
+into a compact snapshot (the rows of the live ids only). Jumping far through
+the history restores the nearest snapshot before the target and replays the
+few edits after it, so any point of a long session is reached in bounded
+time. The oldest edits are dropped past settings.HISTORY_LIMIT, a snapshot
+interval at a time.
+
+Edits are recorded in two steps, so one edit can span several frames like a
+drag: begin() copies the rows about to change, and commit() copies them
+again afterwards together with the primitives the edit created.
+"""
+import numpy as np
+
+import settings
+
+POOLS = ('points', 'segments', 'rays')
+
+
+def capture(scene, points=(), segments=(), rays=()):
+	"""
+	Copy the rows of some primitives, whether they are alive or not.
+
+	Args:
+		scene: Scene to copy from
+		points: Point ids
+		segments: Segment ids
+		rays: Ray ids
+
+	Returns:
+		dict: For each pool, (ids, alive mask, field -> rows of the live
+		ids); and the palette position under 'color_pt'
+	"""
+	rows = {'color_pt': scene.color_pt}
+	for kind, ids in zip(POOLS, (points, segments, rays)):
+		pool = getattr(scene, kind)
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		alive = np.zeros(len(ids), dtype=bool)
+		inside = ids < pool.size
+		alive[inside] = pool.alive[ids[inside]]
+		live = ids[alive]
+		rows[kind] = (ids, alive, {name: getattr(pool, name)[live].copy() for name in pool.fields})
+	return rows
+
+def restore(scene, rows):
+	"""
+	Put rows copied with capture() back into a scene, deleting the
+	primitives that were not alive then and bringing back the ones that
+	were, under the same ids. Indexes and adjacency are only updated for
+	those primitives.
+
+	Args:
+		scene: Scene the rows were copied from
+		rows: Rows from capture()
+	"""
+	scene.version += 1
+	for kind in POOLS:
+		ids = rows[kind][0]
+		pool = getattr(scene, kind)
+		alive = np.zeros(len(ids), dtype=bool)
+		inside = ids < pool.size
+		alive[inside] = pool.alive[ids[inside]]
+		_unplace(scene, kind, ids[alive])
+	for kind in POOLS:
+		ids, alive, fields = rows[kind]
+		_place(scene, kind, ids[alive], fields)
+	scene.color_pt = rows['color_pt']
+
+def _unplace(scene, kind, ids):
+	"""Delete live primitives of one pool, leaving the rest of the scene as it is."""
+	if not len(ids):
+		return
+	if kind == 'points':
+		scene.points.remove_many(ids)
+		scene.point_index.remove_many(ids)
+	elif kind == 'segments':
+		for s, (p1, p2) in zip(ids.tolist(), scene.segments.eps[ids].tolist()):
+			scene.point_segments.discard(p1, s)
+			scene.point_segments.discard(p2, s)
+		scene.segments.remove_many(ids)
+		scene.segment_dual_index.remove_many(ids)
+	else:
+		for r, p in zip(ids.tolist(), scene.rays.origin[ids].tolist()):
+			scene.point_rays.discard(p, r)
+		scene.rays.remove_many(ids)
+		scene.ray_dual_index.remove_many(ids)
+
+def _place(scene, kind, ids, fields):
+	"""Store primitives of one pool under the given ids and index them."""
+	if not len(ids):
+		return
+	getattr(scene, kind).put_many(ids, **fields)
+	if kind == 'points':
+		scene.point_index.insert_many(ids, fields['xy'])
+	elif kind == 'segments':
+		scene.segment_dual_index.insert_many(ids, fields['dual'])
+		for s, (p1, p2) in zip(ids.tolist(), fields['eps'].tolist()):
+			scene.point_segments.add(p1, s)
+			scene.point_segments.add(p2, s)
+	else:
+		scene.ray_dual_index.insert_many(ids, fields['dual'])
+		for r, p in zip(ids.tolist(), fields['origin'].tolist()):
+			scene.point_rays.add(p, r)
+
+def _same(before, after):
+	"""Check whether two captures of the same ids hold the same rows."""
+	if before['color_pt'] != after['color_pt']:
+		return False
+	for kind in POOLS:
+		_, alive, fields = before[kind]
+		_, alive_after, fields_after = after[kind]
+		if not np.array_equal(alive, alive_after):
+			return False
+		if any(not np.array_equal(fields[name], fields_after[name]) for name in fields):
+			return False
+	return True
+
+def snapshot(scene):
+	"""
+	Copy a whole scene compactly, keeping only the rows of the live ids.
+
+	Args:
+		scene: Scene to copy
+
+	Returns:
+		dict: For each pool, (high-water mark, live ids, field -> rows); and
+		the palette position under 'color_pt'
+	"""
+	copy = {'color_pt': scene.color_pt}
+	for kind in POOLS:
+		pool = getattr(scene, kind)
+		ids = pool.ids()
+		copy[kind] = (pool.size, ids, {name: getattr(pool, name)[ids].copy() for name in pool.fields})
+	return copy
+
+def restore_snapshot(scene, copy):
+	"""
+	Put a scene back as it was when a snapshot was taken, rebuilding its
+	indexes in bulk.
+
+	Args:
+		scene: Scene the snapshot was taken of
+		copy: Snapshot from snapshot()
+	"""
+	scene.version += 1
+	for kind in POOLS:
+		pool = getattr(scene, kind)
+		size, ids, fields = copy[kind]
+		alive = np.zeros(size, dtype=bool)
+		alive[ids] = True
+		arrays = {}
+		for name, (dtype, shape) in pool.fields.items():
+			arrays[name] = np.zeros((size, *shape), dtype=dtype)
+			arrays[name][ids] = fields[name]
+		pool.load(alive, **arrays)
+	scene.color_pt = copy['color_pt']
+	scene.rebuild_indexes()
+
+
+class History:
+	"""
+	Log of the edits of one scene, with a position in it.
+
+	Attributes:
+		edits (list): (rows before, rows after) of every edit kept, oldest first
+		at (int): Number of edits in effect; edits[at:] were undone and can be redone
+		snapshots (dict): Number of edits in effect -> snapshot() of the scene then
+		pending (list): Rows copied by begin() for the edit under way, or None
+		every (int): Edits between snapshots
+		limit (int): Most edits kept
+	"""
+	def __init__(self, every=None, limit=None):
+		self.every = every or settings.HISTORY_SNAPSHOT_EVERY
+		self.limit = max(limit or settings.HISTORY_LIMIT, self.every)
+		self.reset()
+
+	def __len__(self):
+		return len(self.edits)
+
+	def reset(self):
+		"""Forget every edit, e.g. after the scene was replaced or filled in some other way."""
+		self.edits = []
+		self.at = 0
+		self.snapshots = {}
+		self.pending = None
+
+	def begin(self, scene, points=(), segments=(), rays=()):
+		"""
+		Start an edit, or widen the one under way, by copying the rows of
+		the primitives it is about to change.
+
+		Args:
+			scene: Scene about to be edited
+			points: Ids of the points the edit changes or deletes
+			segments: Ids of the segments the edit changes or deletes
+			rays: Ids of the rays the edit changes or deletes
+		"""
+		if not self.edits and 0 not in self.snapshots:
+			# Only taken once something is edited, so resets stay cheap
+			self.snapshots[0] = snapshot(scene)
+		rows = capture(scene, points, segments, rays)
+		if self.pending is None:
+			self.pending = [rows]
+		else:
+			self.pending.append(rows)
+
+	def commit(self, scene, points=(), segments=(), rays=()):
+		"""
+		Finish the edit under way and add it to the log, dropping the edits
+		that were undone. An edit that changed nothing is left out.
+
+		Args:
+			scene: Scene that was edited
+			points: Ids of the points the edit created
+			segments: Ids of the segments the edit created
+			rays: Ids of the rays the edit created
+
+		Returns:
+			bool: True if an edit was added
+		"""
+		if self.pending is None:
+			self.begin(scene)
+		pending, self.pending = self.pending, None
+		created = {kind: np.asarray(ids, dtype=np.int64).ravel() for kind, ids in zip(POOLS, (points, segments, rays))}
+
+		# The first copy of every id holds its rows from before the edit
+		before = {'color_pt': pending[0]['color_pt']}
+		for kind in POOLS:
+			ids = np.concatenate([rows[kind][0] for rows in pending])
+			alive = np.concatenate([rows[kind][1] for rows in pending])
+			fields = {name: np.concatenate([rows[kind][2][name] for rows in pending]) for name in pending[0][kind][2]}
+			unique, first = np.unique(ids, return_index=True)
+			new = created[kind][~np.isin(created[kind], unique)]
+			# Rows are only kept for the live ids, find the copies that were alive
+			rank = np.cumsum(alive) - 1
+			keep = first[alive[first]]
+			before[kind] = (np.concatenate([ids[first], new]), np.concatenate([alive[first], np.zeros(len(new), dtype=bool)]),
+							{name: rows[rank[keep]] for name, rows in fields.items()})
+		after = capture(scene, *(before[kind][0] for kind in POOLS))
+		if _same(before, after):
+			return False
+
+		del self.edits[self.at:]
+		for at in [at for at in self.snapshots if at > self.at]:
+			del self.snapshots[at]
+		self.edits.append((before, after))
+		self.at += 1
+		if self.at % self.every == 0:
+			self.snapshots[self.at] = snapshot(scene)
+		if len(self.edits) > self.limit:
+			self._trim()
+		return True
+
+	def _trim(self):
+		"""Drop the oldest edits up to the second snapshot, which becomes the first."""
+		start = min((at for at in self.snapshots if at > 0), default=0)
+		if not start or start > self.at:
+			return
+		del self.edits[:start]
+		self.snapshots = {at - start: copy for at, copy in self.snapshots.items() if at >= start}
+		self.at -= start
+
+	def can_undo(self):
+		"""
+		Returns:
+			bool: True if there is an edit to undo and no edit under way
+		"""
+		return self.pending is None and self.at > 0
+
+	def can_redo(self):
+		"""
+		Returns:
+			bool: True if there is an undone edit to redo and no edit under way
+		"""
+		return self.pending is None and self.at < len(self.edits)
+
+	def undo(self, scene):
+		"""
+		Undo the last edit in effect.
+
+		Args:
+			scene: Scene the history was recorded on
+
+		Returns:
+			bool: True if an edit was undone
+		"""
+		if not self.can_undo():
+			return False
+		self.at -= 1
+		restore(scene, self.edits[self.at][0])
+		return True
+
+	def redo(self, scene):
+		"""
+		Redo the first edit that was undone.
+
+		Args:
+			scene: Scene the history was recorded on
+
+		Returns:
+			bool: True if an edit was redone
+		"""
+		if not self.can_redo():
+			return False
+		restore(scene, self.edits[self.at][1])
+		self.at += 1
+		return True
+
+	def goto(self, scene, at):
+		"""
+		Put the scene in the state it had with a given number of edits in
+		effect. Far jumps start from the nearest snapshot before the target,
+		so at most settings.HISTORY_SNAPSHOT_EVERY edits are replayed.
+
+		Args:
+			scene: Scene the history was recorded on
+			at: Number of edits to have in effect, clamped to the history
+
+		Returns:
+			int: Number of edits in effect now
+		"""
+		if self.pending is not None:
+			return self.at
+		at = min(max(at, 0), len(self.edits))
+		start = max((s for s in self.snapshots if s <= at), default=None)
+		if start is not None and at - start < abs(at - self.at):
+			restore_snapshot(scene, self.snapshots[start])
+			self.at = start
+		while self.at < at:
+			self.redo(scene)
+		while self.at > at:
+			self.undo(scene)
+		return self.at
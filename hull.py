@@ -0,0 +1,252 @@
+"""
+Convex hulls of the points of each half-plane and the envelopes of their dual lines.
+
+The dual line of a point (a, b), relative to the origin of its half-plane, is
+y = CENTER_Y - b - a*u/SCALE. At every u the highest dual line on screen
+belongs to a vertex of the bottom chain of the primal hull, and the lowest
+one to a vertex of the top chain, so the two envelopes of the dual lines are
+the two chains of the hull seen through the duality. Consecutive chain
+vertices hand the envelope over at u = SCALE*(slope of the edge between them).
+
+Hulls keeps the hull of each half-plane up to date with the scene without
+recomputing it: sync() finds the points that were added, removed or moved
+since the last call. Points outside the hull are merged with its vertices.
+When a hull vertex goes away, only the points beyond the chords left behind
+can become vertices. A point dragged around inside the hull costs nothing,
+and one dragged around on the hull costs one vectorized pass over its
+half-plane.
+"""
+import numpy as np
+
+from arrangement import HALF, SCALE, dual_params
+from engine import CENTER_Y, DIVIDER, LEFT_ORIGIN, RIGHT_ORIGIN
+
+PREFILTER_MIN = 64		# Inputs at least this big are thinned out before the monotone chain
+
+
+def _cross(o, a, b):
+	return (a[0] - o[0])*(b[1] - o[1]) - (a[1] - o[1])*(b[0] - o[0])
+
+def _chain(xy, order, sign):
+	"""Monotone chain over points sorted by x: the min-y chain for sign 1, the max-y chain for -1."""
+	chain = []
+	for i in order:
+		while len(chain) >= 2 and sign*_cross(xy[chain[-2]], xy[chain[-1]], xy[i]) <= 0:
+			chain.pop()
+		chain.append(i)
+	return chain
+
+def _outside(xy, p, q):
+	"""Mask of the points strictly on the outer side of the edge p -> q of a hull."""
+	return (q[0] - p[0])*(xy[:, 1] - p[1]) - (q[1] - p[1])*(xy[:, 0] - p[0]) < 0
+
+def convex_hull(xy):
+	"""
+	Compute the convex hull of a set of points (Andrew's monotone chain).
+
+	Big inputs are first thinned out by dropping the points inside the
+	polygon of their extreme points (Akl-Toussaint).
+
+	Args:
+		xy: (n, 2) integer array of positions
+
+	Returns:
+		ndarray: Indices of the hull vertices, starting at the leftmost point
+		and going along the min-y chain first. Collinear points are left out.
+	"""
+	xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+	index = np.arange(len(xy))
+	if len(xy) >= PREFILTER_MIN:
+		x, y = xy[:, 0], xy[:, 1]
+		# Extreme points in eight directions, in the same order around the hull as the output
+		keys = (x, x + y, y, y - x)
+		corners = [int(k.argmin()) for k in keys] + [int(k.argmax()) for k in keys]
+		polygon = [tuple(xy[k].tolist()) for k in corners]
+		inside = np.ones(len(xy), dtype=bool)
+		for p, q in zip(polygon, polygon[1:] + polygon[:1]):
+			if p != q:
+				inside &= (q[0] - p[0])*(xy[:, 1] - p[1]) - (q[1] - p[1])*(xy[:, 0] - p[0]) > 0
+		index = np.flatnonzero(~inside)
+
+	sub = xy[index]
+	order = np.lexsort((sub[:, 1], sub[:, 0])).tolist()
+	points = sub.tolist()
+	low = _chain(points, order, 1)
+	high = _chain(points, order, -1)
+	return index[low + high[::-1][1:-1]]
+
+def chains(xy):
+	"""
+	Split a convex hull into its top and bottom chains on screen.
+
+	Args:
+		xy: (h, 2) positions of the hull vertices
+
+	Returns:
+		Tuple: (top, bottom) (m, 2) arrays of positions, both from left to right
+	"""
+	xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+	order = np.lexsort((xy[:, 1], xy[:, 0])).tolist()
+	points = xy.tolist()
+	return xy[_chain(points, order, 1)], xy[_chain(points, order, -1)]
+
+def envelope(chain, sign):
+	"""
+	Trace the envelope of the dual lines of a hull chain across the other half-plane.
+
+	Args:
+		chain: (m, 2) positions of the chain from left to right, all in one half-plane
+		sign: 1 for the bottom chain, whose dual lines form the top envelope;
+			-1 for the top chain and the bottom envelope
+
+	Returns:
+		ndarray: (k, 2) float64 world coordinates of the envelope polyline
+	"""
+	a, b, left = dual_params(chain)
+	if sign < 0:
+		a, b = -a[::-1], -b[::-1]
+	# Among lines of the same slope only the outermost one counts
+	keep = np.ones(len(a), dtype=bool)
+	keep[:-1] &= ~((a[:-1] == a[1:]) & (b[:-1] <= b[1:]))
+	keep[1:] &= ~((a[1:] == a[:-1]) & (b[1:] <= b[:-1]))
+	a, b = a[keep], b[keep]
+
+	# The line of vertex k is outermost between breakpoints t[k - 1] and t[k]
+	t = -(b[1:] - b[:-1])/(a[1:] - a[:-1])
+	t0, t1 = -HALF/SCALE, HALF/SCALE
+	k0, k1 = np.searchsorted(t, t0, 'right'), np.searchsorted(t, t1, 'left')
+	ts = np.concatenate([[t0], t[k0:k1], [t1]])
+	ks = np.concatenate([[k0], np.arange(k0, k1), [k1]])
+	value = b[ks] + a[ks]*ts
+	x = (RIGHT_ORIGIN if left[0] else LEFT_ORIGIN) + ts*SCALE
+	return np.stack([x, CENTER_Y - sign*value], axis=1)
+
+
+class Hulls:
+	"""
+	Convex hulls of the points of both half-planes, kept in step with a scene.
+
+	Attributes:
+		known (ndarray): Whether each point id is in the hulls' point set
+		xy (ndarray): Position of each known point at the last sync
+		hulls (list): Ids of the hull vertices of each half-plane, in hull order
+		version (int): Scene version of the last sync, None before the first one
+		serial (int): Bumped whenever a hull changes
+	"""
+	def __init__(self):
+		self.known = np.zeros(0, dtype=bool)
+		self.xy = np.zeros((0, 2), dtype=np.int64)
+		self.hulls = [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)]
+		self.version = None
+		self.serial = 0
+
+	def _halves(self, ids):
+		return (self.xy[ids, 0] > DIVIDER).astype(np.intp)
+
+	def _points(self, half):
+		"""Ids of the known points of a half-plane."""
+		return np.flatnonzero(self.known & ((self.xy[:, 0] > DIVIDER) == bool(half)))
+
+	def sync(self, scene, moved=()):
+		"""
+		Bring the hulls up to date with a scene.
+
+		Every point is compared when the scene version changed since the last
+		sync; otherwise only the points given as moved are.
+
+		Args:
+			scene: Scene to follow
+			moved: Ids of points that may have moved since the last sync
+
+		Returns:
+			bool: True if a hull changed
+		"""
+		pool = scene.points
+		size = pool.size
+		if len(self.known) < size:
+			known = np.zeros(size, dtype=bool)
+			known[:len(self.known)] = self.known
+			xy = np.zeros((size, 2), dtype=np.int64)
+			xy[:len(self.xy)] = self.xy
+			self.known, self.xy = known, xy
+
+		if scene.version != self.version:
+			# Ids past the end of the pool were cleared away
+			known = self.known
+			alive = np.zeros(len(known), dtype=bool)
+			alive[:size] = pool.alive[:size]
+			xy = self.xy.copy()
+			xy[:size] = pool.xy[:size]
+			shifted = (xy != self.xy).any(axis=1)
+			removed = np.flatnonzero(known & (~alive | shifted))
+			added = np.flatnonzero(alive & (~known | shifted))
+		else:
+			check = np.asarray(list(moved), dtype=np.int64)
+			known = self.known[check]
+			alive = pool.alive[check]
+			xy = pool.xy[check]
+			shifted = (xy != self.xy[check]).any(axis=1)
+			removed = check[known & (~alive | shifted)]
+			added = check[alive & (~known | shifted)]
+		self.version = scene.version
+		if not len(removed) and not len(added):
+			return False
+
+		halves = self._halves(removed)
+		self.known[removed] = False
+		for half in range(2):
+			hull = self.hulls[half]
+			gone = np.isin(hull, removed[halves == half])
+			if gone.any():
+				self.hulls[half] = self._repair(half, hull, gone)
+
+		self.xy[added] = pool.xy[added]
+		self.known[added] = True
+		halves = self._halves(added)
+		for half in range(2):
+			new = added[halves == half]
+			if len(new):
+				ids = np.concatenate([self.hulls[half], new])
+				self.hulls[half] = ids[convex_hull(self.xy[ids])]
+		self.serial += 1
+		return True
+
+	def _repair(self, half, hull, gone):
+		"""
+		Recompute a hull after some of its vertices went away.
+
+		Every remaining point is inside the old hull, so a new vertex has to
+		lie beyond one of the chords that close the gaps between the vertices
+		that are left.
+		"""
+		rest = hull[~gone]
+		points = self._points(half)
+		if len(rest) < 3:
+			return points[convex_hull(self.xy[points])]
+		xy = self.xy[points]
+		beyond = np.zeros(len(points), dtype=bool)
+		ring = np.flatnonzero(~gone)
+		for k, i in enumerate(ring.tolist()):
+			j = ring[(k + 1) % len(ring)]
+			if (j - i) % len(hull) != 1:
+				beyond |= _outside(xy, self.xy[hull[i]].tolist(), self.xy[hull[j]].tolist())
+		ids = np.concatenate([rest, points[beyond]])
+		return ids[convex_hull(self.xy[ids])]
+
+	def envelopes(self, half):
+		"""
+		Get the chains of the hull of one half-plane and the envelopes they
+		become in the other one.
+
+		Args:
+			half: Half-plane of the hull
+
+		Returns:
+			list: [(top chain, bottom envelope), (bottom chain, top envelope)]
+			pairs of world coordinate polylines, empty without points
+		"""
+		hull = self.hulls[half]
+		if not len(hull):
+			return []
+		top, bottom = chains(self.xy[hull])
+		return [(top, envelope(top, -1)), (bottom, envelope(bottom, 1))]
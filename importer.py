@@ -0,0 +1,321 @@
+"""
+Streaming import of points, segments and rays from CSV or NDJSON files.
+
+Files are read lazily through a pipeline of generators:
+
+	read_lines -> split_lines -> to_arrays -> add_chunk
+
+so only one chunk of lines is in memory at a time. Every chunk is parsed with
+NumPy and goes through the batch dual transforms of the engine in one call,
+and import_file yields after each chunk so a caller can redraw and show
+partial results. parse_file does the reading and parsing without a scene, so
+it can run on a worker thread while add_chunk is applied on the main loop.
+
+Every record has a kind and up to four coordinates, in screen pixels:
+
+	point     x, y
+	segment   x, y, x2, y2     both endpoints become new points
+	ray       x, y, x2, y2     origin becomes a new point, the ray passes
+	                           through (x2, y2)
+
+Coordinates must be finite and at most COORD_LIMIT in size. Positions put in
+a scene are kept within the x-range of the screen, as clicked points are;
+the second point of a ray only gives its direction and is left as it is.
+
+CSV files need a header row naming the columns kind, x, y, x2 and y2; the
+kind column may be left out for plain point clouds. NDJSON files hold one
+object per line with the same keys, e.g. {"kind": "point", "x": 10, "y": 20}.
+"""
+import json, os
+from itertools import islice
+
+import numpy as np
+
+import settings
+from engine import WIDTH
+
+KINDS = ('point', 'segment', 'ray')
+COLUMNS = ('kind', 'x', 'y', 'x2', 'y2')
+COORD_LIMIT = 10**6		# Largest coordinate accepted, so duals and drawing stay far from overflowing
+
+
+def chunked(records, size):
+	"""
+	Group an iterable into lists of at most size items.
+
+	Args:
+		records: Any iterable
+		size: Chunk size
+
+	Yields:
+		list: Next chunk
+	"""
+	records = iter(records)
+	while chunk := list(islice(records, size)):
+		yield chunk
+
+def file_format(path):
+	"""
+	Pick the format of a file from its extension.
+
+	Returns:
+		str: 'ndjson' for .ndjson/.jsonl files and 'csv' otherwise
+	"""
+	return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def csv_columns(header):
+	"""
+	Map the columns of COLUMNS to positions in a CSV header line.
+
+	Args:
+		header: First line of a CSV file
+
+	Returns:
+		list: Field index of each column; a missing column gets the index one
+		past the last field, which split_lines() fills with ''
+
+	Raises:
+		ValueError: If the header has no x and y columns
+	"""
+	names = [name.strip().strip('"') for name in header.split(',')]
+	if 'x' not in names or 'y' not in names:
+		raise ValueError('the header must name the x and y columns')
+	return [names.index(key) if key in names else len(names) for key in COLUMNS]
+
+def record_rows(records, first=1):
+	"""
+	Put the fields of decoded NDJSON records in rows, checking that every
+	record is an object and every field a single value.
+
+	Args:
+		records: List of decoded records
+		first: Record number of the first record, used in error messages
+
+	Returns:
+		ndarray: (n, 5) str array with the columns of COLUMNS, '' where a
+		field is missing
+
+	Raises:
+		ValueError: On a record that is not an object or a field that is not a string or number
+	"""
+	rows = []
+	for k, record in enumerate(records):
+		if not isinstance(record, dict):
+			raise ValueError(f'record {first + k}: must be an object')
+		row = [record.get(key, '') for key in COLUMNS]
+		for key, value in zip(COLUMNS, row):
+			if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+				raise ValueError(f'record {first + k}: {key} must be a string or a number')
+		rows.append(row)
+	return np.array(rows, dtype=str).reshape(-1, len(COLUMNS))
+
+def split_lines(lines, columns=None, first=1):
+	"""
+	Split lines into fields without parsing the values.
+
+	Args:
+		lines: List of non-blank lines
+		columns: CSV column positions from csv_columns(), or None for NDJSON lines
+		first: Record number of the first line, used in error messages
+
+	Returns:
+		ndarray: (n, 5) str array with the columns of COLUMNS, '' where a
+		field is missing
+
+	Raises:
+		ValueError: If a line cannot be split
+	"""
+	try:
+		if columns is None:
+			records = [json.loads(line) for line in lines]
+		else:
+			fields = np.loadtxt(lines, dtype=str, delimiter=',', comments=None, quotechar='"', ndmin=2)
+	except ValueError as e:
+		raise ValueError(f'records {first}-{first + len(lines) - 1}: {e}') from None
+	if columns is None:
+		return record_rows(records, first)
+	fields = np.concatenate([fields, np.full((len(fields), 1), '')], axis=1)
+	return fields[:, columns]
+
+def read_lines(f, size, fmt='csv'):
+	"""
+	Read an open CSV or NDJSON file a chunk of lines at a time, skipping
+	blank lines and the CSV header.
+
+	Args:
+		f: Text file object
+		size: Lines per chunk
+		fmt: 'csv' or 'ndjson'
+
+	Yields:
+		Tuple: (lines, columns) with columns as for split_lines()
+
+	Raises:
+		ValueError: If the CSV header has no x and y columns
+	"""
+	columns = csv_columns(f.readline()) if fmt == 'csv' else None
+	for lines in chunked(f, size):
+		lines = [line for line in lines if line.strip()]
+		if lines:
+			yield lines, columns
+
+def read_chunks(path, size, progress=None):
+	"""
+	Read a CSV or NDJSON file a chunk of lines at a time and split the lines
+	into fields. The format is picked with file_format().
+
+	Args:
+		path: Input file path
+		size: Lines per chunk
+		progress: Called as progress(bytes read, file size) after each chunk
+
+	Yields:
+		ndarray: (n, 5) str array as returned by split_lines()
+
+	Raises:
+		ValueError: If the CSV header has no x and y columns or a line cannot be split
+	"""
+	total = os.path.getsize(path)
+	with open(path, newline='') as f:
+		first = 1
+		for lines, columns in read_lines(f, size, file_format(path)):
+			yield split_lines(lines, columns, first)
+			first += len(lines)
+			if progress is not None:
+				progress(f.buffer.tell(), total)
+
+def parse_rows(rows, first=1):
+	"""
+	Parse the values of a chunk of rows.
+
+	Args:
+		rows: (n, 5) str array as returned by split_lines()
+		first: Record number of the first row, used in error messages
+
+	Returns:
+		Tuple: ((n,) str array of kinds, (n, 4) int64 array of coordinates),
+		x2 and y2 are 0 for points
+
+	Raises:
+		ValueError: On a row with an unknown kind or missing or invalid coordinates
+	"""
+	kinds = np.where(rows[:, 0] == '', 'point', rows[:, 0])
+	bad = np.flatnonzero(~np.isin(kinds, KINDS))
+	if len(bad):
+		raise ValueError(f'record {first + bad[0]}: unknown kind {str(kinds[bad[0]])!r}')
+
+	# Points only need x and y
+	values = rows[:, 1:]
+	empty = values == ''
+	needed = np.where(kinds == 'point', 2, 4)
+	bad = np.flatnonzero((empty & (np.arange(4) < needed[:, None])).any(axis=1))
+	if len(bad):
+		kind = str(kinds[bad[0]])
+		raise ValueError(f'record {first + bad[0]}: {kind} needs {", ".join(COLUMNS[1:needed[bad[0]] + 1])}')
+	try:
+		coords = np.where(empty, '0', values).astype(np.float64)
+	except ValueError:
+		raise ValueError(f'records {first}-{first + len(rows) - 1}: invalid coordinate') from None
+	bad = np.flatnonzero(~(np.isfinite(coords) & (np.abs(coords) <= COORD_LIMIT)).all(axis=1))
+	if len(bad):
+		raise ValueError(f'record {first + bad[0]}: invalid coordinate, must be finite and at most {COORD_LIMIT}')
+	return kinds, coords.astype(np.int64)
+
+def to_arrays(rows, first=1):
+	"""
+	Parse a chunk of rows for a scene and split it by kind. The x of every
+	position is clamped to the screen, like that of a clicked point.
+
+	Args:
+		rows: (n, 5) str array as returned by split_lines()
+		first: Record number of the first row, used in error messages
+
+	Returns:
+		dict: Kind -> (n, 4) int64 array of coordinates, x2 and y2 are 0 for points
+
+	Raises:
+		ValueError: As parse_rows()
+	"""
+	kinds, coords = parse_rows(rows, first)
+	coords[:, 0] = np.clip(coords[:, 0], 0, WIDTH - 1)
+	# Rays only take their direction from (x2, y2)
+	segments = kinds == 'segment'
+	coords[segments, 2] = np.clip(coords[segments, 2], 0, WIDTH - 1)
+	return {kind: coords[kinds == kind] for kind in KINDS}
+
+def add_chunk(scene, arrays):
+	"""
+	Add one chunk of records to a scene with the batch methods.
+
+	Args:
+		scene: Scene to add to
+		arrays: Kind -> (n, 4) coordinate array, as returned by to_arrays()
+
+	Returns:
+		int: Number of records added
+	"""
+	points, segments, rays = (arrays[kind] for kind in KINDS)
+	if len(points):
+		scene.add_points(points[:, :2])
+	if len(segments):
+		ends = scene.add_points(np.concatenate([segments[:, :2], segments[:, 2:]]))
+		scene.add_segments(ends[:len(segments)], ends[len(segments):])
+	if len(rays):
+		origins = scene.add_points(rays[:, :2])
+		scene.add_rays(origins, rays[:, 2:])
+	return len(points) + len(segments) + len(rays)
+
+def parse_file(path, chunk_size=None, progress=None):
+	"""
+	Read and parse a file chunk by chunk without touching any scene, so it
+	can run on a worker thread; add_chunk() adds the results to a scene.
+
+	Args:
+		path: CSV or NDJSON file path
+		chunk_size: Records per chunk, settings.IMPORT_CHUNK if None
+		progress: Called as progress(bytes read, file size) after each chunk
+
+	Yields:
+		dict: Kind -> coordinate array for each chunk, as returned by to_arrays()
+
+	Raises:
+		ValueError: On a malformed record
+	"""
+	first = 1
+	chunks = read_chunks(path, chunk_size or settings.IMPORT_CHUNK, progress)
+	while True:
+		try:
+			rows = next(chunks, None)
+			if rows is None:
+				return
+			arrays = to_arrays(rows, first)
+		except ValueError as e:
+			raise ValueError(f'{path}: {e}') from None
+		first += len(rows)
+		yield arrays
+
+def import_file(scene, path, chunk_size=None):
+	"""
+	Stream a file into a scene chunk by chunk.
+
+	Nothing is read until the generator is advanced, and each step adds one
+	chunk, so the caller decides when the next chunk is loaded:
+
+		for n in import_file(scene, 'cloud.csv'):
+			redraw()
+
+	Args:
+		scene: Scene to add to
+		path: CSV or NDJSON file path
+		chunk_size: Records per chunk, settings.IMPORT_CHUNK if None
+
+	Yields:
+		int: Total number of records imported so far
+
+	Raises:
+		ValueError: On a malformed record; the chunks before it stay imported
+	"""
+	total = 0
+	for arrays in parse_file(path, chunk_size):
+		total += add_chunk(scene, arrays)
+		yield total
@@ -0,0 +1,113 @@
+"""
+Per-frame phase profiler for the main loop.
+
+Each frame records the wall-clock time spent in named phases and a few
+counters (primitives drawn, Surfaces allocated, ...). The last frames are
+kept in a ring buffer that the on-screen overlay reads from and that can be
+exported to CSV or JSON for offline analysis.
+"""
+import csv, json, time
+from collections import deque
+from contextlib import contextmanager
+
+import settings
+
+
+class FrameProfiler:
+	"""
+	Records phase timings and counters for each frame.
+
+	Phase names with a dot (e.g. 'draw.points') are sub-phases of the part
+	before the dot; their time is also included in the parent.
+
+	Attributes:
+		frames (deque): Finished frames, oldest first; each is a dict with the
+			frame start time, a phases dict (name -> seconds) and a counts dict
+		current (dict): Frame being recorded, or None between frames
+	"""
+	def __init__(self, history=None):
+		self.frames = deque(maxlen=history or settings.PROFILE_HISTORY)
+		self.current = None
+
+	def begin_frame(self):
+		"""Start recording a new frame."""
+		self.current = {'start': time.perf_counter(), 'phases': {}, 'counts': {}}
+
+	def end_frame(self):
+		"""Finish the current frame and push it to the history."""
+		if self.current is not None:
+			self.frames.append(self.current)
+			self.current = None
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		Time the body of a with-block as the named phase of the current frame.
+		Entering the same phase several times in a frame adds up.
+
+		Args:
+			name: Phase name
+		"""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			if self.current is not None:
+				phases = self.current['phases']
+				phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+	def count(self, name, n=1):
+		"""
+		Add to a counter of the current frame.
+
+		Args:
+			name: Counter name
+			n: Amount to add
+		"""
+		if self.current is not None:
+			counts = self.current['counts']
+			counts[name] = counts.get(name, 0) + n
+
+	def summary(self, frames=30):
+		"""
+		Average the most recent frames.
+
+		Args:
+			frames: Number of frames to average over
+
+		Returns:
+			Tuple: (phases, counts) dicts of mean seconds and mean counts
+		"""
+		recent = list(self.frames)[-frames:]
+		phases, counts = {}, {}
+		for frame in recent:
+			for name, seconds in frame['phases'].items():
+				phases[name] = phases.get(name, 0.0) + seconds
+			for name, n in frame['counts'].items():
+				counts[name] = counts.get(name, 0) + n
+		n = max(1, len(recent))
+		return ({name: seconds/n for name, seconds in phases.items()},
+				{name: total/n for name, total in counts.items()})
+
+	def export(self, path):
+		"""
+		Write the history to a file, as CSV if the path ends in .csv and as
+		JSON otherwise.
+
+		Args:
+			path: Output file path
+		"""
+		frames = list(self.frames)
+		if path.endswith('.csv'):
+			phases = sorted({name for frame in frames for name in frame['phases']})
+			counts = sorted({name for frame in frames for name in frame['counts']})
+			with open(path, 'w', newline='') as f:
+				writer = csv.writer(f)
+				writer.writerow(['frame', 'start'] + phases + counts)
+				for i, frame in enumerate(frames):
+					writer.writerow([i, frame['start']]
+									+ [frame['phases'].get(name, 0.0) for name in phases]
+									+ [frame['counts'].get(name, 0) for name in counts])
+		else:
+			with open(path, 'w') as f:
+				json.dump(frames, f, indent=1)
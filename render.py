@@ -0,0 +1,795 @@
+"""
+Retained-mode renderer for the duality program.
+
+Everything that is not being edited is drawn once into a cached background
+layer. Each frame only the dragged point, the primitives attached to it, the
+ray being placed and hover highlights are drawn on top, and only the screen
+areas they touched are pushed to the display.
+
+Primitives are stored in world coordinates and drawn through the View of
+each half-plane. Only primitives that show up in the view are drawn, so the
+cost of a redraw follows what is on screen rather than the size of the scene.
+When more than settings.LOD_THRESHOLD duals show up in a half-plane, they
+are drawn there as a density heatmap instead, see heatmap.py.
+"""
+import copy
+
+import numpy as np
+import pygame
+
+import settings
+from arrangement import HALF, to_world
+from engine import (CENTER_Y, DIVIDER, LEFT_ORIGIN, POINT_RADIUS, RIGHT_ORIGIN, batch_ray_wedges,
+					batch_segment_wedges)
+from heatmap import colorize, dual_density, gather_duals
+from profiler import FrameProfiler
+from stabbing import Stabbing
+from viewport import Culler, View
+
+VERTEX_COLOR = (255, 255, 255)	# Color of the arrangement vertices
+SELECT_COLOR = (255, 255, 0)	# Selected points and the box or lasso selecting them
+STAB_COLOR = (0, 255, 140)		# Primitives in the wedge of a hovered dual
+CROSSING_COLOR = (255, 60, 60)	# Segment crossings and the duals of the segments that cross
+HULL_COLORS = ((0, 200, 255), (255, 170, 0))	# Top hull chain and bottom envelope, bottom chain and top envelope
+
+
+def clip_polygon(points, x0, y0, x1, y1):
+	"""
+	Clip a convex or concave polygon to a rectangle (Sutherland-Hodgman).
+
+	pygame fills a polygon row by row over its whole extent, so polygons that
+	reach far off screen when zoomed in are cut down first.
+
+	Args:
+		points: List of (x, y) vertices
+		x0: Left edge
+		y0: Top edge
+		x1: Right edge
+		y1: Bottom edge
+
+	Returns:
+		list: Vertices of the clipped polygon, fewer than 3 if nothing is left
+	"""
+	for axis, edge, keep in ((0, x0, 1), (0, x1, -1), (1, y0, 1), (1, y1, -1)):
+		if not points:
+			break
+		out = []
+		prev = points[-1]
+		prev_in = (prev[axis] - edge)*keep >= 0
+		for point in points:
+			inside = (point[axis] - edge)*keep >= 0
+			if inside != prev_in:
+				t = (edge - prev[axis])/(point[axis] - prev[axis])
+				cut = [prev[0] + t*(point[0] - prev[0]), prev[1] + t*(point[1] - prev[1])]
+				cut[axis] = edge
+				out.append(tuple(cut))
+			if inside:
+				out.append(point)
+			prev, prev_in = point, inside
+		points = out
+	return points
+
+
+class WedgeOverlay:
+	"""
+	Reusable transparent layers that every wedge polygon of a frame is drawn into.
+
+	There is one SRCALPHA surface per half-plane. Each polygon is rasterized
+	into a scratch surface and blended into its layer, and both layers are
+	blitted onto the screen once, so a frame allocates no Surfaces however many
+	wedges there are. Only the area touched in the previous frame is cleared
+	and composited.
+
+	The layers hold premultiplied colors and are blended with
+	BLEND_PREMULTIPLIED, which composites exactly like blitting every polygon
+	onto the screen in turn: overlapping translucent wedges stack up.
+
+	Attributes:
+		layers (list): One 500x500 SRCALPHA surface per half-plane
+		scratch (Surface): 500x500 SRCALPHA surface each polygon is drawn into first
+		dirty (list): Area of each layer drawn on since the last clear, or None
+	"""
+	def __init__(self):
+		self.layers = [pygame.Surface((500, 500), pygame.SRCALPHA) for _ in range(2)]
+		self.scratch = pygame.Surface((500, 500), pygame.SRCALPHA)
+		self.dirty = [None, None]
+
+	def clear(self):
+		"""Erase whatever was drawn in the previous frame."""
+		for half in range(2):
+			if self.dirty[half] is not None:
+				self.layers[half].fill((0, 0, 0, 0), self.dirty[half])
+				self.dirty[half] = None
+
+	def add(self, half, color, points):
+		"""
+		Rasterize a polygon into the layer of one half-plane.
+
+		Args:
+			half: 0 for the left half-plane, 1 for the right one
+			color: RGB or RGBA color value
+			points: List of (x,y) screen coordinates defining polygon vertices
+		"""
+		offset = 500*half
+		points = [(x - offset, y) for x, y in points]
+		xs, ys = [x for x, y in points], [y for x, y in points]
+		if min(xs) < -1 or max(xs) > 501 or min(ys) < -1 or max(ys) > 501:
+			points = clip_polygon(points, -1, -1, 501, 501)
+			if len(points) < 3:
+				return
+		r, g, b, a = color if len(color) == 4 else (*color, 255)
+		rect = pygame.draw.polygon(self.scratch, (r*a//255, g*a//255, b*a//255, a), points)
+		rect = rect.clip(self.scratch.get_rect())
+		if rect.width and rect.height:
+			self.layers[half].blit(self.scratch, rect, rect, special_flags=pygame.BLEND_PREMULTIPLIED)
+			self.scratch.fill((0, 0, 0, 0), rect)
+			self.dirty[half] = rect if self.dirty[half] is None else self.dirty[half].union(rect)
+
+	def blit(self, surface):
+		"""
+		Composite both layers onto a surface.
+
+		Args:
+			surface: Pygame surface to draw on
+
+		Returns:
+			list: Screen rects that were drawn on
+		"""
+		rects = []
+		for half in range(2):
+			if self.dirty[half] is not None:
+				rects.append(surface.blit(self.layers[half], self.dirty[half].move(500*half, 0), self.dirty[half],
+										special_flags=pygame.BLEND_PREMULTIPLIED))
+		return rects
+
+
+class Renderer:
+	"""
+	Draws a Scene with a cached static layer and dirty-rectangle updates.
+
+	The background holds the grid and every primitive outside the active set.
+	It is redrawn only when the scene changes structurally (Scene.version) or
+	the active set changes. Active primitives and hover highlights are drawn
+	over it each frame; the areas they covered in the previous frame are
+	restored from the background first.
+
+	Attributes:
+		screen (Surface): Display surface
+		scene (Scene): Scene being drawn
+		view (View): World-to-screen transform of both half-planes
+		background (Surface): Cached grid and static primitives
+		overlay (WedgeOverlay): Layers the wedges are drawn into
+		profiler (FrameProfiler): Receives draw timings and counters
+		show_profile (bool): Whether the profiler overlay is drawn
+		font (Font): Font of the profiler overlay, created on first use
+		workers (WorkerPool): Rebuilds heatmaps in the background, or None to build them in place
+		arrangement (Arrangement): Dual line arrangement whose vertices are drawn, or None
+		crossings (Crossings): Segment crossings that are marked, or None
+		hulls (Hulls): Convex hulls drawn with the envelopes of their dual lines, or None
+		stabbing (Stabbing): Finds what the wedge of a hovered segment or ray dual holds
+		culler (Culler): Finds the primitives that show up in the view
+		heatmaps (list): (static key, Surface) of the last heatmap of each half-plane, or None
+		heatmap_jobs (list): (static key, Job) of the heatmap being built for each half-plane, or None
+		static_key (tuple): Scene version, view and active set the background was drawn for
+		frame_key (tuple): Everything the last frame depended on
+		last_rects (list): Screen areas covered by dynamic content last frame
+	"""
+	def __init__(self, screen, scene, profiler=None, view=None, workers=None):
+		self.screen = screen
+		self.scene = scene
+		self.view = view if view is not None else View()
+		self.workers = workers
+		self.arrangement = None
+		self.crossings = None
+		self.hulls = None
+		self.stabbing = Stabbing()
+		self.culler = Culler()
+		self.heatmaps = [None, None]
+		self.heatmap_jobs = [None, None]
+		self.profiler = profiler if profiler is not None else FrameProfiler()
+		self.show_profile = False
+		self.font = None
+		self.background = pygame.Surface(screen.get_size())
+		self.overlay = WedgeOverlay()
+		self.static_key = None
+		self.frame_key = None
+		self.last_rects = []
+
+	def set_scene(self, scene):
+		"""
+		Draw another scene from the next frame on.
+
+		Args:
+			scene: New Scene
+		"""
+		self.scene = scene
+		self.stabbing = Stabbing()
+		self.culler = Culler()
+		for job in self.heatmap_jobs:
+			if job is not None:
+				job[1].cancel()
+		self.heatmaps = [None, None]
+		self.heatmap_jobs = [None, None]
+		self.invalidate()
+
+	def invalidate(self):
+		"""Force the background to be redrawn on the next frame."""
+		self.static_key = None
+		self.frame_key = None
+
+	def draw(self, mx, my, active_points=(), active_segments=(), active_rays=(), selected=None, marked=(),
+			band=None):
+		"""
+		Draw one frame and push the changed areas to the display.
+
+		Args:
+			mx: Current mouse x-coordinate on screen
+			my: Current mouse y-coordinate on screen
+			active_points: Ids of points that may move this frame
+			active_segments: Ids of segments that may move this frame
+			active_rays: Ids of rays that may move this frame
+			selected: Id of the point highlighted as selected, or None
+			marked: Ids of the points picked with a box or lasso
+			band: ('box' or 'lasso', half, screen positions) of a selection being drawn, or None
+
+		Returns:
+			list: Screen rects that were updated
+		"""
+		scene = self.scene
+		active = (frozenset(active_points), frozenset(active_segments), frozenset(active_rays))
+		if selected is not None:
+			active = (active[0] | {selected}, active[1], active[2])
+		if any(active):
+			# Drags are put down without a new scene version, the wedge queries have to know
+			self.stabbing.mark_moved(active)
+
+		wx, wy = self.view.to_world(mx, my)
+		radius = POINT_RADIUS/self.view.halves[self.view.half_at(mx)].zoom
+		hovered_points = scene.points_at(wx, wy, radius).tolist()
+		hovered_segments = scene.segment_duals_at(wx, wy, radius).tolist()
+		hovered_rays = scene.ray_duals_at(wx, wy, radius).tolist()
+
+		# A hovered segment or ray dual highlights everything its wedge holds,
+		# queried once the frame is known to have changed
+		wedge = hovered_segments[:1], hovered_rays[:1]
+
+		# A hovered arrangement vertex highlights the two points whose dual lines cross there
+		arrangement = self.arrangement
+		vertex = None
+		if arrangement is not None:
+			hit = arrangement.vertex_at(wx, wy, radius)
+			if hit is not None:
+				vertex = hit[0]
+				hovered_points = sorted(set(hovered_points) | set(vertex))
+
+		# A hovered crossing highlights the two segments that cross there
+		crossings = self.crossings
+		crossing = None
+		if crossings is not None:
+			crossing = crossings.crossing_at(scene, wx, wy, radius)
+			if crossing is not None:
+				hovered_segments = sorted(set(hovered_segments) | set(crossing[0]))
+		hovered = (frozenset(hovered_points), frozenset(hovered_segments), frozenset(hovered_rays))
+
+		static_key = (scene.version, self.view.key(), active, arrangement.serial if arrangement is not None else None,
+					crossings.serial if crossings is not None else None)
+		moving = any(active)
+		hulls = self.hulls.serial if self.hulls is not None else None
+		marked = np.asarray(marked, dtype=np.int64)
+		frame_key = (static_key, hovered, vertex, crossing, selected, (mx, my) if moving else None, hulls,
+					marked.tobytes(), band and (band[0], tuple(band[2])), self.show_profile)
+		if frame_key == self.frame_key and not self.show_profile:
+			return []
+		self.frame_key = frame_key
+
+		profiler = self.profiler
+		stabbed = ((), (), ())
+		if wedge[0] or wedge[1]:
+			with profiler.phase('draw.stabbing'):
+				if wedge[0]:
+					stabbed = self.stabbing.stabbed(scene, segment=wedge[0][0], active=active)
+				else:
+					stabbed = self.stabbing.stabbed(scene, ray=wedge[1][0], active=active)
+
+		full = static_key != self.static_key
+		if full:
+			with profiler.phase('draw.background'):
+				self._draw_background(static_key, active)
+			profiler.count('rebuilds')
+			self.static_key = static_key
+			self.screen.blit(self.background, (0, 0))
+		else:
+			for rect in self.last_rects:
+				self.screen.blit(self.background, rect, rect)
+
+		# Active primitives and anything under the cursor are drawn on top
+		points = sorted(active[0] | hovered[0])
+		segments = sorted(active[1] | hovered[1])
+		rays = sorted(active[2] | hovered[2])
+		rects = self._draw_primitives(self.screen, points, segments, rays, hovered, selected)
+		if any(len(ids) for ids in stabbed):
+			with profiler.phase('draw.stabbed'):
+				rects += self._draw_stabbed(self.screen, *(ids.tolist() for ids in stabbed))
+		if arrangement is not None:
+			with profiler.phase('draw.vertices'):
+				if active[0]:
+					rects += self._draw_vertices(self.screen, arrangement.vertices(active[0])[1])
+				if vertex is not None:
+					rects += self._draw_vertex_pair(self.screen, vertex)
+		if crossings is not None:
+			with profiler.phase('draw.crossings'):
+				if active[1]:
+					rects += self._draw_crossings(self.screen, *crossings.crossings(scene, active[1]))
+				if crossing is not None:
+					rects += self._draw_crossing_dual(self.screen, crossing[1])
+		if self.hulls is not None:
+			with profiler.phase('draw.hulls'):
+				rects += self._draw_hulls(self.screen)
+		if len(marked) or band is not None:
+			with profiler.phase('draw.selection'):
+				rects += self._draw_selection(self.screen, marked.tolist(), band)
+		if self.show_profile:
+			rects.append(self._draw_profile(self.screen))
+
+		with profiler.phase('draw.present'):
+			if full:
+				pygame.display.update()
+				dirty = [self.screen.get_rect()]
+			else:
+				dirty = self.last_rects + rects
+				if dirty:
+					pygame.display.update(dirty)
+		profiler.count('dirty_rects', len(dirty))
+		self.last_rects = rects
+		return dirty
+
+	def _draw_profile(self, surface):
+		"""
+		Draw the profiler overlay: mean phase times and counters of the
+		recent frames.
+
+		Returns:
+			Rect: Area covered by the overlay
+		"""
+		if self.font is None:
+			pygame.font.init()
+			self.font = pygame.font.Font(None, 18)
+		phases, counts = self.profiler.summary()
+		work = sum(seconds for name, seconds in phases.items() if '.' not in name and name != 'wait')
+		lines = [f'frame {work*1e3:6.2f} ms']
+		lines += [f'{name:<16}{seconds*1e3:7.2f} ms' for name, seconds in sorted(phases.items())]
+		lines += [f'{name:<16}{n:7.1f}' for name, n in sorted(counts.items())]
+
+		rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+		self.profiler.count('surfaces', len(rendered))
+		height = sum(text.get_height() for text in rendered)
+		rect = pygame.Rect(5, 5, max(text.get_width() for text in rendered) + 10, height + 10)
+		surface.fill((0, 0, 0), rect)
+		y = rect.y + 5
+		for text in rendered:
+			surface.blit(text, (rect.x + 5, y))
+			y += text.get_height()
+		return rect
+
+	def _draw_background(self, key, active):
+		"""Redraw the grid and every visible primitive outside the active set."""
+		scene = self.scene
+		surface = self.background
+		surface.fill((0,0,0))  # Clear screen (black background)
+
+		# Draw grid lines and separators, the axes follow the view
+		pygame.draw.line(surface, (128, 128, 128), (500, 0), (500, 500), 7)  # Central divider
+		for viewport in self.view.halves:
+			surface.set_clip(viewport.screen_rect())
+			origin = viewport.to_screen([250 + 500*viewport.half, 250]).tolist()
+			pygame.draw.line(surface, (64, 64, 64), (origin[0], 0), (origin[0], 500), 3)	 # Quarter line
+			pygame.draw.line(surface, (64, 64, 64), (500*viewport.half, origin[1]), (500*viewport.half + 500, origin[1]), 3)	# Horizontal center line
+		surface.set_clip(None)
+
+		with self.profiler.phase('draw.cull'):
+			points, segments, rays = self.culler.visible(scene, self.view, active)
+		points = points[~np.isin(points, list(active[0]))]
+		segments = segments[~np.isin(segments, list(active[1]))]
+		rays = rays[~np.isin(rays, list(active[2]))]
+
+		# Duals are drawn in the half-plane opposite to their primitive
+		halves = (self._halves(scene.points.xy[points, 0]), self._halves(scene.segments.coords[segments, 0]),
+				self._halves(scene.rays.coords[rays, 0]))
+		lod = [False, False]
+		for half in range(2):
+			duals = [ids[h != half] for ids, h in zip((points, segments, rays), halves)]
+			if sum(len(ids) for ids in duals) > settings.LOD_THRESHOLD:
+				lod[half] = True
+				with self.profiler.phase('draw.heatmap'):
+					self._draw_heatmap(surface, half, key, *duals)
+		self._draw_primitives(surface, points.tolist(), segments.tolist(), rays.tolist(), lod=lod)
+		if self.arrangement is not None:
+			with self.profiler.phase('draw.vertices'):
+				self._draw_vertices(surface, self.arrangement.vertices(exclude=active[0])[1])
+		if self.crossings is not None:
+			with self.profiler.phase('draw.crossings'):
+				self._draw_crossings(surface, *self.crossings.crossings(self.scene, exclude=active[1]))
+
+	def _draw_vertices(self, surface, xy):
+		"""
+		Draw arrangement vertices as 2x2 dots, written straight into the pixels.
+
+		Args:
+			surface: Pygame surface to draw on
+			xy: (k, 2) world coordinates of the vertices to draw
+
+		Returns:
+			list: Rect that was drawn on, if any
+		"""
+		half = self._halves(xy[:, 0])
+		screen = self.view.to_screen(xy, half)
+		x, y = screen[:, 0], screen[:, 1]
+		inside = (x >= 500*half) & (x < 500*half + 499) & (y >= 0) & (y < 499)
+		x, y = x[inside], y[inside]
+		self.profiler.count('vertices', len(x))
+		if not len(x):
+			return []
+		pixels = pygame.surfarray.pixels3d(surface)
+		for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+			pixels[x + dx, y + dy] = VERTEX_COLOR
+		del pixels
+		x0, y0 = int(x.min()), int(y.min())
+		return [pygame.Rect(x0, y0, int(x.max()) - x0 + 2, int(y.max()) - y0 + 2)]
+
+	def _draw_crossings(self, surface, pairs, xy):
+		"""
+		Draw segment crossings as dots, and ring the duals of the segments that cross.
+
+		Args:
+			surface: Pygame surface to draw on
+			pairs: (k, 2) ids of the segments that cross
+			xy: (k, 2) world coordinates of the crossings
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		half = self._halves(xy[:, 0])
+		screen = self.view.to_screen(xy, half)
+		x, y = screen[:, 0], screen[:, 1]
+		inside = (x >= 500*half) & (x < 500*half + 500) & (y >= 0) & (y < 500)
+		self.profiler.count('crossings', int(inside.sum()))
+		rects = []
+		for h, center in zip(half[inside].tolist(), screen[inside].tolist()):
+			self._clip(surface, h)
+			rects.append(pygame.draw.circle(surface, CROSSING_COLOR, center, 3))
+
+		segments = np.unique(pairs)
+		half = 1 - self._halves(self.scene.segments.coords[segments, 0])
+		screen = self.view.to_screen(self.scene.segments.dual[segments], half)
+		for h, dual in zip(half.tolist(), screen.tolist()):
+			self._clip(surface, h)
+			rects.append(pygame.draw.circle(surface, CROSSING_COLOR, dual, 8, 1))
+		surface.set_clip(None)
+		return rects
+
+	def _draw_crossing_dual(self, surface, xy):
+		"""
+		Draw the dual line of a hovered crossing, which passes through the
+		duals of both segments.
+
+		Args:
+			surface: Pygame surface to draw on
+			xy: World coordinates of the crossing
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		x, y = xy
+		left = x <= DIVIDER
+		line = to_world(np.array([-HALF, HALF]), x - (LEFT_ORIGIN if left else RIGHT_ORIGIN), y - CENTER_Y, left)
+		half = int(left)
+		self._clip(surface, half)
+		rect = pygame.draw.line(surface, CROSSING_COLOR, *self.view.to_screen(line, half).tolist())
+		surface.set_clip(None)
+		return [rect]
+
+	def _draw_vertex_pair(self, surface, pair):
+		"""
+		Draw the primal line through the two points of a hovered arrangement vertex.
+
+		Args:
+			surface: Pygame surface to draw on
+			pair: Ids of the two points
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		xy = self.scene.points.xy[list(pair)]
+		half = int(self._halves(xy[0, 0]))
+		(px, py), (qx, qy) = self.view.to_screen(xy, half).tolist()
+		reach = 2000/max(abs(qx - px), abs(qy - py), 1)
+		self._clip(surface, half)
+		rect = pygame.draw.line(surface, VERTEX_COLOR, (px - (qx - px)*reach, py - (qy - py)*reach),
+								(px + (qx - px)*reach, py + (qy - py)*reach))
+		surface.set_clip(None)
+		return [rect]
+
+	def _draw_stabbed(self, surface, points, segments, rays):
+		"""
+		Highlight primitives found in the wedge of a hovered dual, without their own wedges.
+
+		Args:
+			surface: Pygame surface to draw on
+			points: Ids of points whose dual lines cross the hovered primitive
+			segments: Ids of segments whose supporting lines cross it
+			rays: Ids of rays whose supporting lines cross it
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		lod = (False, False)
+		rects = self._draw_rays(surface, rays, set(rays), lod, STAB_COLOR)
+		rects += self._draw_segments(surface, segments, set(segments), lod, STAB_COLOR)
+		rects += self._draw_points(surface, points, set(points), None, lod, STAB_COLOR)
+		surface.set_clip(None)
+		return [rect for rect in rects if rect.width and rect.height]
+
+	def _draw_selection(self, surface, marked, band):
+		"""
+		Highlight the selected points, and the box or lasso being drawn.
+
+		Args:
+			surface: Pygame surface to draw on
+			marked: Ids of the selected points
+			band: ('box' or 'lasso', half, screen positions), or None
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		rects = self._draw_points(surface, marked, set(marked), None, (False, False), SELECT_COLOR)
+		if band is not None:
+			kind, half, corners = band
+			self._clip(surface, half)
+			if kind == 'box' and len(corners) > 1:
+				(x0, y0), (x1, y1) = corners[0], corners[-1]
+				rect = pygame.Rect(min(x0, x1), min(y0, y1), abs(x1 - x0) + 1, abs(y1 - y0) + 1)
+				rects.append(pygame.draw.rect(surface, SELECT_COLOR, rect, 1))
+			elif kind == 'lasso' and len(corners) > 1:
+				rects.append(pygame.draw.lines(surface, SELECT_COLOR, True, corners))
+		surface.set_clip(None)
+		return [rect for rect in rects if rect.width and rect.height]
+
+	def _draw_hulls(self, surface):
+		"""
+		Draw the convex hull of each half-plane, and the envelopes of its dual
+		lines in the other one in the color of the hull chain they come from.
+		Hulls change while points are dragged, so they are drawn every frame.
+
+		Args:
+			surface: Pygame surface to draw on
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		rects = []
+		for half in range(2):
+			for color, (chain, envelope) in zip(HULL_COLORS, self.hulls.envelopes(half)):
+				for xy, side in ((chain, half), (envelope, 1 - half)):
+					if len(xy) < 2:
+						continue
+					self._clip(surface, side)
+					rects.append(pygame.draw.lines(surface, color, False, self.view.to_screen(xy, side).tolist(), 2))
+		surface.set_clip(None)
+		return rects
+
+	def _draw_heatmap(self, surface, half, key, points, segments, rays):
+		"""
+		Draw the duals in one half-plane as a density heatmap. The heatmap is
+		rebuilt in the background when the static key changes, and the last
+		one is shown until the new one is ready. A build under way is left
+		to finish before the next one starts, so a scene that keeps changing,
+		like one following a live feed, still gets new heatmaps.
+
+		Args:
+			surface: Pygame surface to draw on
+			half: Half-plane the duals are drawn into
+			key: Static key the heatmap is for
+			points: Ids of points whose dual lines are drawn
+			segments: Ids of segments whose duals and wedges are drawn
+			rays: Ids of rays whose duals and wedges are drawn
+		"""
+		cached = self.heatmaps[half]
+		pending = self.heatmap_jobs[half]
+		if (cached is None or cached[0] != key) and (pending is None or pending[1].finished
+													or pending[1].cancelled.is_set()):
+			self._build_heatmap(half, key, gather_duals(self.scene, points, segments, rays))
+		if self.heatmaps[half] is not None:
+			surface.set_clip(self.view.halves[half].screen_rect())
+			surface.blit(self.heatmaps[half][1], (500*half, 0))
+			surface.set_clip(None)
+
+	def _build_heatmap(self, half, key, duals):
+		"""Start building the heatmap of one half-plane, or build it now without workers."""
+		self.profiler.count('heatmaps')
+		if self.workers is None:
+			self.heatmaps[half] = (key, self._heatmap_surface(dual_density(self.view, half, duals)))
+			return
+		if self.heatmap_jobs[half] is not None:
+			self.heatmap_jobs[half][1].cancel()
+		view = copy.deepcopy(self.view)
+		job = self.workers.submit('Heatmap', lambda job: [dual_density(view, half, duals, cancelled=job.cancelled)],
+								lambda grid: self._heatmap_ready(half, key, grid))
+		self.heatmap_jobs[half] = (key, job)
+
+	def _heatmap_ready(self, half, key, grid):
+		"""Keep a heatmap built in the background and redraw with it."""
+		self.heatmaps[half] = (key, self._heatmap_surface(grid))
+		self.heatmap_jobs[half] = None
+		self.invalidate()
+
+	def _heatmap_surface(self, grid):
+		"""Turn a density grid into a half-plane sized Surface, transparent where it is empty."""
+		image = pygame.surfarray.make_surface(colorize(grid))
+		image = pygame.transform.scale(image, (500, 500))
+		image.set_colorkey((0, 0, 0))
+		return image
+
+	def _draw_primitives(self, surface, points, segments, rays, hovered=(), selected=None, lod=(False, False)):
+		"""
+		Draw points, segments and rays with their duals and wedges.
+
+		Args:
+			surface: Pygame surface to draw on
+			points: Ids of points to draw
+			segments: Ids of segments to draw
+			rays: Ids of rays to draw
+			hovered: (point ids, segment ids, ray ids) to highlight
+			selected: Id of the point highlighted as selected, or None
+			lod: Whether each half-plane shows its duals as a heatmap, which
+				leaves them out here
+
+		Returns:
+			list: Rects that were drawn on
+		"""
+		profiler = self.profiler
+		hovered_points, hovered_segments, hovered_rays = hovered or ((), (), ())
+		profiler.count('points', len(points))
+		profiler.count('segments', len(segments))
+		profiler.count('rays', len(rays))
+		profiler.count('wedges', 2*(len(segments) + len(rays)))
+
+		rects = []
+		with profiler.phase('draw.wedges'):
+			rects += self._draw_wedges(surface, segments, rays, hovered_segments, hovered_rays, lod)
+		with profiler.phase('draw.rays'):
+			rects += self._draw_rays(surface, rays, hovered_rays, lod)
+		with profiler.phase('draw.segments'):
+			rects += self._draw_segments(surface, segments, hovered_segments, lod)
+		with profiler.phase('draw.points'):
+			rects += self._draw_points(surface, points, hovered_points, selected, lod)
+		surface.set_clip(None)
+		return [rect for rect in rects if rect.width and rect.height]
+
+	def _clip(self, surface, half):
+		"""Restrict drawing to the screen area of one half-plane."""
+		surface.set_clip(self.view.halves[half].screen_rect())
+
+	def _halves(self, x):
+		"""Half-plane of each x-coordinate, as an int array."""
+		return (np.asarray(x) > 500).astype(np.intp)
+
+	def _view_edges(self):
+		"""World y-coordinates of the top and bottom of each half-plane's view, rounded outwards."""
+		bounds = [viewport.bounds() for viewport in self.view.halves]
+		top = np.array([int(np.floor(b[1])) for b in bounds])
+		bottom = np.array([int(np.ceil(b[3])) for b in bounds])
+		return top, bottom
+
+	def _draw_wedges(self, surface, segments, rays, hovered_segments, hovered_rays, lod):
+		"""Draw ray and segment wedges into the overlay and composite it once."""
+		scene = self.scene
+		view = self.view
+		overlay = self.overlay
+		overlay.clear()
+		segments = [s for s, h in zip(segments, self._halves(scene.segments.coords[segments, 0]).tolist()) if not lod[1 - h]]
+		rays = [r for r, h in zip(rays, self._halves(scene.rays.coords[rays, 0]).tolist()) if not lod[1 - h]]
+
+		# Wedges are drawn in the half-plane opposite to their primitive
+		if rays:
+			coords = scene.rays.coords[rays]
+			half = 1 - self._halves(coords[:, 0])
+			top, bottom = self._view_edges()
+			wedges = batch_ray_wedges(scene.rays.dual[rays], scene.points.dual[scene.rays.origin[rays]],
+									coords[:, 0], coords[:, 2], top[half], bottom[half])
+			wedges = view.to_screen(wedges, half[:, None, None]).tolist()
+			for r, h, polygons in zip(rays, half.tolist(), wedges):
+				r_col = (255,255,255) if r in hovered_rays else (*scene.rays.color[r].tolist(), 127)
+				for polygon in polygons:
+					overlay.add(h, r_col, polygon)
+		if segments:
+			eps = scene.segments.eps[segments]
+			half = 1 - self._halves(scene.segments.coords[segments, 0])
+			wedges = batch_segment_wedges(scene.points.dual[eps[:, 0]], scene.points.dual[eps[:, 1]],
+										scene.segments.dual[segments])
+			wedges = view.to_screen(wedges, half[:, None, None]).tolist()
+			for s, h, polygons in zip(segments, half.tolist(), wedges):
+				s_col = (255, 255, 255) if s in hovered_segments else (*scene.segments.color[s].tolist(), 127)
+				for polygon in polygons:
+					overlay.add(h, s_col, polygon)
+		return overlay.blit(surface)
+
+	def _draw_rays(self, surface, rays, hovered_rays, lod, highlight=(255, 255, 255)):
+		"""Draw rays and ray duals, the hovered ones in the highlight color."""
+		if not rays:
+			return []
+		scene = self.scene
+		view = self.view
+		coords = scene.rays.coords[rays]
+		half = self._halves(coords[:, 0])
+		screen_coords = view.to_screen(coords.reshape(-1, 2, 2), half[:, None]).reshape(-1, 4).tolist()
+		screen_dual = view.to_screen(scene.rays.dual[rays], 1 - half).tolist()
+		rects = []
+		for r, h, coords, dual in zip(rays, half.tolist(), screen_coords, screen_dual):
+			if r in hovered_rays:
+				r_col = highlight
+				thicn = 3
+			else:
+				r_col = (*scene.rays.color[r].tolist(), 127)
+				thicn = 1
+			self._clip(surface, h)
+			rects.append(pygame.draw.line(surface, r_col, coords[:2], coords[2:], width=thicn))
+			if lod[1 - h]:
+				continue
+			self._clip(surface, 1 - h)
+			rects.append(pygame.draw.line(surface, r_col, (dual[0], 0), (dual[0], 500)))
+			rects.append(pygame.draw.circle(surface, r_col, dual, 5))
+		return rects
+
+	def _draw_segments(self, surface, segments, hovered_segments, lod, highlight=(255, 255, 255)):
+		"""Draw line segments and segment duals, the hovered ones in the highlight color."""
+		if not segments:
+			return []
+		scene = self.scene
+		view = self.view
+		coords = scene.segments.coords[segments]
+		half = self._halves(coords[:, 0])
+		screen_coords = view.to_screen(coords.reshape(-1, 2, 2), half[:, None]).reshape(-1, 4).tolist()
+		screen_dual = view.to_screen(scene.segments.dual[segments], 1 - half).tolist()
+		rects = []
+		for s, h, coords, dual in zip(segments, half.tolist(), screen_coords, screen_dual):
+			self._clip(surface, h)
+			if s in hovered_segments:
+				s_col = highlight
+				rects.append(pygame.draw.line(surface, s_col, coords[:2], coords[2:], width=3))
+			else:
+				s_col = (*scene.segments.color[s].tolist(), 127)
+				rects.append(pygame.draw.line(surface, s_col, coords[:2], coords[2:]))
+			if lod[1 - h]:
+				continue
+			self._clip(surface, 1 - h)
+			rects.append(pygame.draw.circle(surface, s_col, dual, 5))
+		return rects
+
+	def _draw_points(self, surface, points, hovered_points, selected, lod, highlight=(255, 255, 255)):
+		"""Draw points and point duals, the hovered ones in the highlight color."""
+		if not points:
+			return []
+		scene = self.scene
+		view = self.view
+		xy = scene.points.xy[points]
+		half = self._halves(xy[:, 0])
+		screen_xy = view.to_screen(xy, half).tolist()
+		screen_dual = view.to_screen(scene.points.dual[points].reshape(-1, 2, 2), 1 - half[:, None]).reshape(-1, 4).tolist()
+		rects = []
+		for p, h, xy, line in zip(points, half.tolist(), screen_xy, screen_dual):
+			if p == selected:
+				p_col = SELECT_COLOR
+				thiccness = 3
+			elif p in hovered_points:
+				p_col = highlight
+				thiccness = 3
+			else:
+				p_col = scene.points.color[p].tolist()
+				thiccness = 1
+			self._clip(surface, h)
+			rects.append(pygame.draw.circle(surface, p_col, xy, 5))
+			if lod[1 - h]:
+				continue
+			self._clip(surface, 1 - h)
+			rects.append(pygame.draw.line(surface, p_col, line[:2], line[2:], width=thiccness))
+		return rects
@@ -0,0 +1,258 @@
+"""
+Input recording and headless replay, to turn an editing session into a
+repeatable load test.
+
+A session is recorded from the window with --record. Every frame of the main
+loop stores the mouse position, the modifier keys and the events it handled,
+and the palette is shuffled with a seed kept in the recording, so replaying
+it gives the same scene with the same colors:
+
+	python3 duality.py --record drag.rec [scene.dual]
+	python3 replay.py drag.rec -o after.json --frames frames.csv
+	python3 replay.py drag.rec -o after.json --compare before.json
+
+The replay runs the frames back to back under the SDL dummy driver, through
+the same App.frame() as the window, and reports the time of every frame and
+of each of its phases. Background jobs (loads, imports, analyses) are waited
+for between frames, outside the timings, so each frame sees the same scene
+however fast the machine is. A digest of the final scene is compared with
+the one taken when the recording ended, to show that the replay did the same
+edits. Live feeds are not recorded.
+
+A recording is a compressed NumPy archive: a JSON header and two structured
+arrays, one row per frame and one per event.
+"""
+import argparse, hashlib, json, os, sys, time
+
+import numpy as np
+import pygame
+
+VERSION = 1
+FRAME = np.dtype([('mx', np.int16), ('my', np.int16), ('mods', np.uint16), ('events', np.uint16)])
+EVENT = np.dtype([('type', np.uint32), ('key', np.int32), ('mod', np.uint16), ('button', np.uint8), ('y', np.int16)])
+RECORDED = (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEWHEEL)
+
+
+def scene_digest(scene):
+	"""
+	Hash the live primitives of a scene, with their ids.
+
+	Args:
+		scene: Scene to hash
+
+	Returns:
+		str: Hex SHA-1 digest
+	"""
+	digest = hashlib.sha1()
+	for kind in ('points', 'segments', 'rays'):
+		pool = getattr(scene, kind)
+		ids = pool.ids()
+		digest.update(ids.astype(np.int64).tobytes())
+		for name in pool.fields:
+			digest.update(np.ascontiguousarray(getattr(pool, name)[ids]).tobytes())
+	return digest.hexdigest()
+
+
+class Recorder:
+	"""
+	Records the input of every frame of the main loop.
+
+	Attributes:
+		path (str): File the recording is saved to
+		seed (int): Seed the palette of the scene was shuffled with
+		opened (str): File opened on startup, or None
+		frames (list): (mx, my, mods, number of events) of every frame
+		events (list): (type, key, mod, button, y) of every event handled, in order
+	"""
+	def __init__(self, path, seed, opened=None):
+		self.path = path
+		self.seed = seed
+		self.opened = opened
+		self.frames = []
+		self.events = []
+
+	def add(self, mx, my, mods, events):
+		"""
+		Record one frame. Only the events the App reacts to are kept, mouse
+		motion is covered by the position of each frame.
+
+		Args:
+			mx: Mouse x-coordinate on screen
+			my: Mouse y-coordinate on screen
+			mods: Modifier keys held, from pygame.key.get_mods()
+			events: Events handled in the frame
+		"""
+		events = [event for event in events if event.type in RECORDED]
+		self.frames.append((mx, my, mods, len(events)))
+		self.events += [(event.type, getattr(event, 'key', 0), getattr(event, 'mod', 0),
+						getattr(event, 'button', 0), getattr(event, 'y', 0)) for event in events]
+
+	def save(self, scene):
+		"""
+		Write the recording.
+
+		Args:
+			scene: Scene as the session left it, for the digest the replay is checked against
+		"""
+		header = json.dumps({
+			'version': VERSION,
+			'seed': self.seed,
+			'open': self.opened,
+			'frames': len(self.frames),
+			'digest': scene_digest(scene),
+		}).encode()
+		with open(self.path, 'wb') as f:
+			np.savez_compressed(f, header=np.frombuffer(header, dtype=np.uint8),
+								frames=np.array(self.frames, dtype=FRAME), events=np.array(self.events, dtype=EVENT))
+		print(f'Recorded {len(self.frames)} frames to {self.path}', file=sys.stderr)
+
+
+def load_recording(path):
+	"""
+	Read a recording.
+
+	Args:
+		path: File written by Recorder.save()
+
+	Returns:
+		Tuple: (header dict, frames array, events array)
+
+	Raises:
+		ValueError: If the recording has an unknown version
+	"""
+	with np.load(path) as archive:
+		header = json.loads(archive['header'].tobytes())
+		frames, events = archive['frames'], archive['events']
+	if header['version'] != VERSION:
+		raise ValueError(f'Unsupported recording version {header["version"]}')
+	return header, frames, events
+
+def replay(path, wait=True):
+	"""
+	Replay a recording as fast as possible.
+
+	Args:
+		path: File written by Recorder.save()
+		wait: Wait for the background jobs before every frame, so the replay
+			is deterministic
+
+	Returns:
+		Tuple: (App after the last frame, FrameProfiler with every frame, header)
+	"""
+	from color_gen import gen_color
+	from duality import App
+	from engine import Scene
+	from profiler import FrameProfiler
+
+	header, frames, events = load_recording(path)
+	# Headless unless a video driver was asked for
+	os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+	pygame.init()
+	screen = pygame.display.set_mode((1000, 500))
+	app = App(screen, Scene(gen_color(header['seed'])))
+	app.profiler = app.renderer.profiler = FrameProfiler(max(1, len(frames)))
+	if header['open']:
+		app.open(header['open'])
+
+	start = 0
+	for mx, my, mods, count in frames.tolist():
+		batch = events[start:start + count].tolist()
+		start += count
+		app.profiler.begin_frame()
+		with app.profiler.phase('wait'):
+			while wait and app.workers.busy():
+				app.step_jobs()
+				time.sleep(0.001)
+		pygame.key.set_mods(mods)
+		batch = [pygame.event.Event(kind, key=key, mod=mod, button=button, x=0, y=y, pos=(mx, my), unicode='')
+				for kind, key, mod, button, y in batch]
+		# The session ended with a quit or Escape, on which App.quit() would exit
+		done = [event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE)
+				for event in batch]
+		app.frame([event for event, end in zip(batch, done) if not end], mx, my)
+		app.profiler.end_frame()
+		if any(done):
+			break
+	while app.workers.busy():
+		app.step_jobs()
+		time.sleep(0.001)
+	return app, app.profiler, header
+
+def summarize(profiler):
+	"""
+	Summarize the frame times of a replay.
+
+	The time of a frame is the sum of its phases, without the time spent
+	waiting for background jobs.
+
+	Args:
+		profiler: FrameProfiler holding every frame
+
+	Returns:
+		dict: Phase name -> {'mean', 'p50', 'p95', 'p99', 'max'} in
+		milliseconds, with the whole frame under 'frame'
+	"""
+	frames = list(profiler.frames)
+	names = sorted({name for frame in frames for name in frame['phases'] if name != 'wait'})
+	times = {name: np.array([frame['phases'].get(name, 0.0) for frame in frames])*1000 for name in names}
+	top = [name for name in names if '.' not in name]
+	times['frame'] = sum((times[name] for name in top), np.zeros(len(frames)))
+	summary = {}
+	for name, ms in times.items():
+		if not len(ms):
+			continue
+		p50, p95, p99 = np.percentile(ms, (50, 95, 99)).tolist()
+		summary[name] = {'mean': float(ms.mean()), 'p50': p50, 'p95': p95, 'p99': p99, 'max': float(ms.max())}
+	return summary
+
+def compare(old, new):
+	"""Print the ratio new/old of the mean and p95 of every phase found in both runs."""
+	for name, stats in new['phases'].items():
+		before = old['phases'].get(name)
+		if before and before['mean'] > 0 and before['p95'] > 0:
+			print(f"{name:>20} mean {stats['mean']/before['mean']:6.2f}x  p95 {stats['p95']/before['p95']:6.2f}x")
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument('recording', help='file recorded with duality.py --record')
+	parser.add_argument('-o', '--output', help='write the summary to this JSON file instead of stdout')
+	parser.add_argument('--frames', metavar='PATH', help='export every frame (JSON, or CSV if the name ends in .csv)')
+	parser.add_argument('--compare', metavar='JSON', help='print the ratio to an earlier run')
+	parser.add_argument('--no-wait', action='store_true',
+						help='do not wait for background jobs between frames (not deterministic)')
+	args = parser.parse_args(argv)
+
+	start = time.perf_counter()
+	app, profiler, header = replay(args.recording, wait=not args.no_wait)
+	elapsed = time.perf_counter() - start
+	digest = scene_digest(app.scene)
+	if digest != header['digest']:
+		print('replay: the final scene differs from the recorded one', file=sys.stderr)
+
+	report = {
+		'recording': args.recording,
+		'frames': len(profiler.frames),
+		'seconds': elapsed,
+		'matches': digest == header['digest'],
+		'scene': {kind: len(getattr(app.scene, kind)) for kind in ('points', 'segments', 'rays')},
+		'phases': summarize(profiler),
+	}
+	frame = report['phases'].get('frame', {})
+	print(f"{report['frames']} frames in {elapsed:.2f} s, frame mean {frame.get('mean', 0):.2f} ms, "
+		f"p95 {frame.get('p95', 0):.2f} ms, max {frame.get('max', 0):.2f} ms", file=sys.stderr)
+	if args.frames:
+		profiler.export(args.frames)
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1)
+	else:
+		json.dump(report, sys.stdout, indent=1)
+		print()
+	if args.compare:
+		with open(args.compare) as f:
+			compare(json.load(f), report)
+	pygame.quit()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,115 @@
+"""
+Compact binary scene files.
+
+A scene file is an 8-byte magic, the length of a JSON header as a
+little-endian uint64, the header itself, and then the raw contents of every
+Pool field back to back, each aligned to 64 bytes:
+
+	DUALSCN1 | header length | {"version": 1, "arrays": {...}, ...} | data
+
+The header gives the dtype, shape and offset of each array. Arrays are stored
+up to the pool's high-water mark together with its alive mask, so ids are the
+same after a round trip. Saving writes a temporary file next to the target
+and renames it over the target, so a scene memory-mapped from the file it is
+saved to keeps reading the old contents. Loading memory-maps the arrays copy-on-write instead
+of parsing them, and rebuilds the hit-test indexes with bulk NumPy operations,
+so even scenes with millions of primitives open in well under a second.
+"""
+import json, os, struct, tempfile
+
+import numpy as np
+
+from engine import Scene
+
+MAGIC = b'DUALSCN1'
+VERSION = 1
+ALIGN = 64			# Alignment of every array in the file
+POOLS = ('points', 'segments', 'rays')
+
+
+def _align(n):
+	return -(-n // ALIGN) * ALIGN
+
+def save_scene(scene, path):
+	"""
+	Write a scene to a file.
+
+	Args:
+		scene: Scene to save
+		path: Output file path
+	"""
+	arrays = {}
+	for kind in POOLS:
+		pool = getattr(scene, kind)
+		arrays[f'{kind}.alive'] = pool.alive[:pool.size]
+		for name in pool.fields:
+			arrays[f'{kind}.{name}'] = getattr(pool, name)[:pool.size]
+
+	layout, offset = {}, 0
+	for key, array in arrays.items():
+		layout[key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+		offset = _align(offset + array.nbytes)
+	header = json.dumps({
+		'version': VERSION,
+		'color_pallete': [list(color) for color in scene.color_pallete],
+		'color_pt': scene.color_pt,
+		'arrays': layout,
+	}).encode()
+	start = _align(len(MAGIC) + 8 + len(header))
+
+	# The arrays may be memory-mapped from path itself, which must not be truncated under them
+	fd, temp = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp',
+								dir=os.path.dirname(os.path.abspath(path)))
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(MAGIC)
+			f.write(struct.pack('<Q', len(header)))
+			f.write(header)
+			for key, array in arrays.items():
+				f.seek(start + layout[key]['offset'])
+				f.write(np.ascontiguousarray(array).tobytes())
+			f.truncate(start + offset)
+		os.replace(temp, path)
+	except BaseException:
+		os.unlink(temp)
+		raise
+
+def load_scene(path, mmap=True):
+	"""
+	Read a scene from a file.
+
+	Args:
+		path: Scene file path
+		mmap: Memory-map the arrays copy-on-write instead of reading them in.
+			Edits never touch the file either way.
+
+	Returns:
+		Scene: The loaded scene
+
+	Raises:
+		ValueError: If the file is not a scene file or has an unknown version
+	"""
+	with open(path, 'rb') as f:
+		if f.read(len(MAGIC)) != MAGIC:
+			raise ValueError(f'{path} is not a scene file')
+		size, = struct.unpack('<Q', f.read(8))
+		header = json.loads(f.read(size))
+	if header['version'] != VERSION:
+		raise ValueError(f'Unsupported scene file version {header["version"]}')
+	start = _align(len(MAGIC) + 8 + size)
+
+	def read(key):
+		spec = header['arrays'][key]
+		dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+		if not mmap or not shape[0]:
+			count = int(np.prod(shape))
+			return np.fromfile(path, dtype, count, offset=start + spec['offset']).reshape(shape)
+		return np.memmap(path, dtype, 'c', start + spec['offset'], shape)
+
+	scene = Scene([tuple(color) for color in header['color_pallete']])
+	scene.color_pt = header['color_pt']
+	for kind in POOLS:
+		pool = getattr(scene, kind)
+		pool.load(read(f'{kind}.alive'), **{name: read(f'{kind}.{name}') for name in pool.fields})
+	scene.rebuild_indexes()
+	return scene
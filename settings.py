@@ -0,0 +1,47 @@
+"""
+Tunable settings for the duality program.
+
+Plain module-level constants; edit them here or override them on the module
+before starting the App.
+"""
+
+# Frame rates
+IDLE_FPS = 15			# Cap on redraws triggered by hover/clicks while nothing is being edited
+ACTIVE_FPS = 60			# Frame rate while a point is dragged or a ray is being placed
+IDLE_TIMEOUT_MS = 0		# Longest time to block waiting for input when idle, 0 waits forever
+
+# View
+ZOOM_STEP = 1.25		# Zoom factor per mouse wheel notch
+LOD_THRESHOLD = 5000	# Duals visible in a half-plane past which they are drawn as a density heatmap
+HEATMAP_CELL = 2		# Screen pixels per heatmap cell
+
+# Profiler
+PROFILE_HISTORY = 600			# Frames kept in the profiler ring buffer
+PROFILE_EXPORT = 'profile.json'	# File the history is dumped to ('.csv' for CSV)
+
+# Scene files
+SCENE_PATH = 'scene.dual'		# File the S and L keys save to and load from
+
+# Undo
+HISTORY_LIMIT = 1000			# Edits that can be undone, the oldest are dropped first
+HISTORY_SNAPSHOT_EVERY = 50		# Edits between compact copies of the scene, the most replayed by a jump through the history
+
+# Import
+IMPORT_PATH = 'import.csv'	# File the I key streams into the scene (CSV, or NDJSON if .ndjson/.jsonl)
+IMPORT_CHUNK = 2000		# Records parsed and added to the scene at a time while importing
+
+# Live feed
+FEED_MAX_POINTS = 5000	# Points of a live feed kept in the scene, the oldest are evicted first (0 for no limit)
+FEED_SECONDS = 10		# Seconds a point of a live feed stays in the scene (0 for no limit)
+FEED_BATCH_MS = 50		# Lines of a live feed that come in during this time are added together
+
+# Dual transform server (dualserve.py)
+SERVER_PORT = 8765			# Port on 127.0.0.1 the server listens on without --unix
+SERVER_BATCH_MAX = 50000	# Most records converted together; requests are not split, so a batch can go over
+SERVER_HISTORY = 10000		# Requests and batches the latency and batch size metrics are taken over
+SERVER_LINE_MAX = 1 << 26	# Longest request line in bytes
+
+# Background jobs
+WORKERS = 2				# Worker threads for imports, loading and analyses
+WORKER_QUEUE = 8		# Results waiting to be applied before the workers pause
+WORKER_BUDGET_MS = 8	# Time per frame spent applying results to the scene
@@ -0,0 +1,499 @@
+"""
+Uniform grid index used for hit-testing points and dual points.
+
+Items are bucketed by the cell their coordinates fall in. A hit-test only
+looks at the few cells that overlap the hit square around the cursor, so it
+costs O(1) on average whatever the size of the scene.
+
+Bulk inserts go into a static layer: runs of arrays sorted by cell that are
+built with NumPy and searched with searchsorted. Like a log-structured merge
+tree, a new run is merged with the last one while that is not much bigger, so
+streaming in batches costs O(n log n) overall and queries only look at a few
+runs. Single inserts and moves go into a dynamic layer of per-cell sets.
+Removing an item from the static layer only clears its entry in an array,
+and the runs are compacted once most of their rows were removed.
+
+PairTable holds the result of a sweep over pairs of ids, such as the
+vertices of the dual line arrangement, with the pairs of moved ids swapped
+in without going over the others.
+"""
+import math
+
+import numpy as np
+
+BULK_MIN = 256			# Bulk inserts smaller than this go into the dynamic layer
+MERGE_MAX = 1 << 18		# Runs are not merged past this size, which bounds the cost of one insert
+
+
+class GridIndex:
+	"""
+	Uniform grid over non-negative integer ids with (x, y) positions.
+
+	Attributes:
+		radius (int): Half the side of the hit square around each item
+		cell (int): Side of a grid cell in pixels
+		cells (dict): Dynamic layer, (cx, cy) -> set of ids in that cell
+		pos (dict): Dynamic layer, id -> (x, y) position the id was indexed at
+		runs (list): Static layer, (serial, keys, ids, xy) per run with the
+			packed cell keys sorted and the ids and positions in the same order
+		static_run (ndarray): Serial of the run holding each id, -1 if the id
+			is not live in the static layer
+		static_count (int): Number of live ids in the static layer
+		serial (int): Serial of the newest run
+	"""
+	def __init__(self, radius=5, cell=None):
+		self.radius = radius
+		self.cell = cell if cell is not None else 2*radius
+		self.clear()
+
+	def __len__(self):
+		return len(self.pos) + self.static_count
+
+	def __contains__(self, i):
+		return i in self.pos or self._in_static(i)
+
+	def _in_static(self, i):
+		return i < len(self.static_run) and self.static_run[i] >= 0
+
+	def _key(self, x, y):
+		return (x // self.cell, y // self.cell)
+
+	def _static_key(self, cx, cy):
+		"""Pack cells into int64 keys that sort like (cx, cy)."""
+		return (np.int64(cx) << 32) + (np.int64(cy) + (1 << 31))
+
+	def insert(self, i, x, y):
+		"""
+		Add an id at the given position.
+
+		Args:
+			i: Id to index
+			x: X-coordinate
+			y: Y-coordinate
+		"""
+		x, y = int(x), int(y)
+		self.pos[i] = (x, y)
+		self.cells.setdefault(self._key(x, y), set()).add(i)
+
+	def insert_many(self, ids, xy):
+		"""
+		Add many ids at once.
+
+		Args:
+			ids: (n,) array of ids not already in the index
+			xy: (n, 2) array of positions
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+		if len(ids) < BULK_MIN:
+			for i, (x, y) in zip(ids.tolist(), xy.tolist()):
+				self.insert(i, x, y)
+			return
+
+		if int(ids.max()) >= len(self.static_run):
+			run = np.full(max(int(ids.max()) + 1, 2*len(self.static_run)), -1, dtype=np.int64)
+			run[:len(self.static_run)] = self.static_run
+			self.static_run = run
+		added = len(ids)
+		cells = xy // self.cell
+		keys = self._static_key(cells[:, 0], cells[:, 1])
+		order = np.argsort(keys)
+		keys, ids, xy = keys[order], ids[order], xy[order]
+
+		# Merge with the newest runs while they are not much bigger, dropping
+		# rows that were removed since
+		while self.runs and len(self.runs[-1][1]) <= 2*len(keys) and len(self.runs[-1][1]) + len(keys) <= MERGE_MAX:
+			serial, old_keys, old_ids, old_xy = self.runs.pop()
+			live = self.static_run[old_ids] == serial
+			keys = np.concatenate([old_keys[live], keys])
+			order = np.argsort(keys, kind='stable')  # Two sorted runs, merged in linear time
+			keys = keys[order]
+			ids = np.concatenate([old_ids[live], ids])[order]
+			xy = np.concatenate([old_xy[live], xy])[order]
+
+		self.serial += 1
+		self.static_count += added
+		self.static_run[ids] = self.serial
+		self.runs.append((self.serial, keys, ids, xy))
+
+	def remove(self, i):
+		"""
+		Drop an id from the index if it is present.
+
+		Args:
+			i: Id to remove
+		"""
+		if self._in_static(i):
+			self.static_run[i] = -1
+			self.static_count -= 1
+			return
+		xy = self.pos.pop(i, None)
+		if xy is None:
+			return
+		key = self._key(*xy)
+		bucket = self.cells[key]
+		bucket.discard(i)
+		if not bucket:
+			del self.cells[key]
+
+	def remove_many(self, ids):
+		"""
+		Drop many ids at once, clearing the static ones in one pass. The
+		static runs are compacted once most of their rows are dead, so a
+		stream of inserts and removals does not slow queries down.
+
+		Args:
+			ids: (n,) array of distinct ids
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		static = np.zeros(len(ids), dtype=bool)
+		inside = ids < len(self.static_run)
+		static[inside] = self.static_run[ids[inside]] >= 0
+		self.static_run[ids[static]] = -1
+		self.static_count -= int(static.sum())
+		for i in ids[~static].tolist():
+			self.remove(i)
+
+		rows = sum(len(run[2]) for run in self.runs)
+		if rows > 2*self.static_count + BULK_MIN:
+			self._compact()
+
+	def _compact(self):
+		"""Merge every static run into one without the rows that were removed."""
+		keys, ids, xy = [], [], []
+		for serial, run_keys, run_ids, run_xy in self.runs:
+			live = self.static_run[run_ids] == serial
+			keys.append(run_keys[live])
+			ids.append(run_ids[live])
+			xy.append(run_xy[live])
+		self.runs = []
+		if not self.static_count:
+			return
+		keys = np.concatenate(keys)
+		order = np.argsort(keys, kind='stable')
+		ids = np.concatenate(ids)[order]
+		self.serial += 1
+		self.static_run[ids] = self.serial
+		self.runs.append((self.serial, keys[order], ids, np.concatenate(xy)[order]))
+
+	def move(self, i, x, y):
+		"""
+		Update the position of an id, only touching buckets when it changes cell.
+		An id moved out of the static layer continues in the dynamic one.
+
+		Args:
+			i: Id to move
+			x: New x-coordinate
+			y: New y-coordinate
+		"""
+		x, y = int(x), int(y)
+		old = self.pos.get(i)
+		if old is not None and self._key(*old) == self._key(x, y):
+			self.pos[i] = (x, y)
+			return
+		self.remove(i)
+		self.insert(i, x, y)
+
+	def query(self, mx, my, radius=None):
+		"""
+		Find every id whose hit square contains (mx, my).
+
+		Args:
+			mx: X-coordinate to test
+			my: Y-coordinate to test
+			radius: Half the side of the hit square, self.radius if None
+
+		Returns:
+			list: Matching ids in increasing order
+		"""
+		# An item at x is hit when mx - r < x <= mx + r, same for y
+		r = self.radius if radius is None else radius
+		x0, y0 = self._key(math.floor(mx - r) + 1, math.floor(my - r) + 1)
+		x1, y1 = self._key(math.floor(mx + r), math.floor(my + r))
+		hits = []
+		for cx in range(x0, x1 + 1):
+			for cy in range(y0, y1 + 1):
+				for i in self.cells.get((cx, cy), ()):
+					x, y = self.pos[i]
+					if x - r <= mx < x + r and y - r <= my < y + r:
+						hits.append(i)
+
+				if not self.static_count:
+					continue
+				key = self._static_key(cx, cy)
+				for serial, keys, ids, xy in self.runs:
+					lo = np.searchsorted(keys, key, 'left')
+					hi = np.searchsorted(keys, key, 'right')
+					for i, (x, y) in zip(ids[lo:hi].tolist(), xy[lo:hi].tolist()):
+						if self.static_run[i] == serial and x - r <= mx < x + r and y - r <= my < y + r:
+							hits.append(i)
+		hits.sort()
+		return hits
+
+	def query_rect(self, x0, y0, x1, y1):
+		"""
+		Find every id positioned inside a rectangle, edges included.
+
+		Args:
+			x0: Left edge
+			y0: Top edge
+			x1: Right edge
+			y1: Bottom edge
+
+		Returns:
+			ndarray: Matching ids, in no particular order
+		"""
+		return self.query_rects([(x0, y0, x1, y1)])
+
+	def query_rects(self, rects):
+		"""
+		Find every id positioned inside any of many rectangles, edges
+		included. The static layer is searched for all of them at once.
+
+		Args:
+			rects: (m, 4) array-like of [x0, y0, x1, y1] rectangles
+
+		Returns:
+			ndarray: Matching ids, each once, in no particular order
+		"""
+		rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+		cells = np.floor(rects).astype(np.int64)//self.cell
+		hits = []
+
+		# Dynamic layer: walk the cells of each rectangle, or every cell if there are fewer
+		if self.cells:
+			for (x0, y0, x1, y1), (cx0, cy0, cx1, cy1) in zip(rects.tolist(), cells.tolist()):
+				if (cx1 - cx0 + 1)*(cy1 - cy0 + 1) <= len(self.cells):
+					buckets = (self.cells.get((cx, cy), ()) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+				else:
+					buckets = (bucket for (cx, cy), bucket in self.cells.items() if cx0 <= cx <= cx1 and cy0 <= cy <= cy1)
+				for bucket in buckets:
+					for i in bucket:
+						x, y = self.pos[i]
+						if x0 <= x <= x1 and y0 <= y <= y1:
+							hits.append(i)
+		hits = [np.array(hits, dtype=np.int64)]
+
+		# Static layer: one key range per grid column of every rectangle in every run
+		if self.static_count:
+			count = np.maximum(cells[:, 2] - cells[:, 0] + 1, 0)
+			owner = np.repeat(np.arange(len(rects)), count)
+			columns = cells[owner, 0] + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+			lo_keys = self._static_key(columns, cells[owner, 1])
+			hi_keys = self._static_key(columns, cells[owner, 3])
+			for serial, keys, ids, xy in self.runs:
+				lo = np.searchsorted(keys, lo_keys, 'left')
+				hi = np.searchsorted(keys, hi_keys, 'right')
+				lengths = np.maximum(hi - lo, 0)
+				rows = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+				x0, y0, x1, y1 = rects[np.repeat(owner, lengths)].T
+				ids, xy = ids[rows], xy[rows]
+				inside = ((self.static_run[ids] == serial) & (xy[:, 0] >= x0) & (xy[:, 0] <= x1)
+						& (xy[:, 1] >= y0) & (xy[:, 1] <= y1))
+				hits.append(ids[inside])
+		hits = np.concatenate(hits)
+		if len(rects) > 1 and len(hits):
+			# Rectangles may overlap, keep every id once
+			seen = np.zeros(int(hits.max()) + 1, dtype=bool)
+			seen[hits] = True
+			hits = np.flatnonzero(seen)
+		return hits
+
+	def clear(self):
+		"""Remove every id."""
+		self.cells = {}
+		self.pos = {}
+		self.runs = []
+		self.serial = 0
+		self.static_run = np.zeros(0, dtype=np.int64)
+		self.static_count = 0
+
+
+def index_rows(xy, radius=5):
+	"""
+	Index the rows of an array of float positions, such as the result of a
+	sweep, each at its position rounded down.
+
+	Args:
+		xy: (k, 2) positions
+		radius: Radius of the GridIndex
+
+	Returns:
+		GridIndex: Ids 0..k-1 at the rows of xy
+	"""
+	index = GridIndex(radius)
+	index.insert_many(np.arange(len(xy)), np.floor(xy))
+	return index
+
+def pair_rows(pairs):
+	"""
+	Index the rows of an array of id pairs by the ids in them.
+
+	Args:
+		pairs: (k, 2) int ids
+
+	Returns:
+		Tuple: (ids, rows) (2k,) arrays, the ids sorted and the row each came from
+	"""
+	flat = np.asarray(pairs, dtype=np.int64).ravel()
+	order = np.argsort(flat, kind='stable')
+	return flat[order], order//2
+
+
+class PairTable:
+	"""
+	Positions of pairs of ids, such as the vertices of the dual line
+	arrangement or the crossings of segments, that can be looked up by
+	position and by the ids in them.
+
+	The table is made in bulk from the result of a sweep. After that,
+	replace() swaps in the pairs of some ids without touching the others:
+	their rows from the sweep are masked out through pair_rows(), and their
+	new pairs are kept in a group per id. Every replace() has a stamp, and a
+	pair in a group only counts while its other id was not replaced since,
+	because then the group of that id holds the pair. Replacing the pairs of
+	m ids costs O(m + their pairs) whatever the size of the table.
+
+	Attributes:
+		pairs (ndarray): (k, 2) pairs from the sweep, smaller id first
+		xy (ndarray): (k, 2) float64 positions of those pairs
+		live (ndarray): (k,) False for the rows of ids replaced since
+		index (GridIndex): Rows of the sweep by position, from index_rows()
+		ids (ndarray): (2k,) ids in the pairs, sorted
+		rows (ndarray): (2k,) row each of ids comes from
+		groups (dict): Replaced id -> (stamp, other ids, positions), oldest stamp first
+		stamps (ndarray): Stamp of the last replace() of each id, -1 for none
+		stamp (int): Stamp of the next replace()
+	"""
+	def __init__(self, pairs=None, xy=None):
+		self.pairs = np.empty((0, 2), dtype=np.int64) if pairs is None else pairs
+		self.xy = np.empty((0, 2), dtype=np.float64) if xy is None else xy
+		self.live = np.ones(len(self.pairs), dtype=bool)
+		self.index = index_rows(self.xy)
+		self.ids, self.rows = pair_rows(self.pairs)
+		self.groups = {}
+		self.stamps = np.full(0, -1, dtype=np.int64)
+		self.stamp = 0
+
+	def __len__(self):
+		return int(self.live.sum()) + sum(int(self._fresh(*group[:2]).sum()) for group in self.groups.values())
+
+	def _stamps_of(self, ids):
+		ids = np.asarray(ids, dtype=np.int64)
+		stamps = np.full(len(ids), -1, dtype=np.int64)
+		known = ids < len(self.stamps)
+		stamps[known] = self.stamps[ids[known]]
+		return stamps
+
+	def _fresh(self, stamp, others):
+		"""Mask of the pairs of a group whose other id was not replaced since."""
+		return self._stamps_of(others) <= stamp
+
+	def _group(self, i, stamp, others, xy):
+		"""(pairs, xy) of the pairs of a group that still count, smaller id first."""
+		fresh = self._fresh(stamp, others)
+		others = others[fresh]
+		return np.stack([np.minimum(others, i), np.maximum(others, i)], axis=1), xy[fresh]
+
+	def _rows_of(self, ids):
+		"""Rows of the sweep with any of the ids in them, live or not."""
+		lo = np.searchsorted(self.ids, ids, 'left')
+		hi = np.searchsorted(self.ids, ids, 'right')
+		counts = hi - lo
+		starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+		return self.rows[starts + np.arange(counts.sum())]
+
+	def replace(self, ids, groups):
+		"""
+		Replace the pairs of some ids, all found at once.
+
+		Args:
+			ids: Ids whose pairs are replaced, including ids that no longer have any
+			groups: (id, other ids, (m, 2) positions) per id of ids with pairs;
+				a pair of two of the ids may be in both their groups
+		"""
+		ids = np.unique(np.asarray(list(ids), dtype=np.int64))
+		if not len(ids):
+			return
+		stamp = self.stamp
+		self.stamp += 1
+		if ids[-1] >= len(self.stamps):
+			grown = np.full(max(int(ids[-1]) + 1, 2*len(self.stamps)), -1, dtype=np.int64)
+			grown[:len(self.stamps)] = self.stamps
+			self.stamps = grown
+		self.stamps[ids] = stamp
+		self.live[self._rows_of(ids)] = False
+		for i in ids.tolist():
+			self.groups.pop(i, None)
+		for i, others, xy in groups:
+			# A pair of two ids replaced together is kept by the smaller one
+			keep = (others > i) | (self._stamps_of(others) != stamp)
+			if keep.any():
+				self.groups[i] = (stamp, others[keep], xy[keep])
+
+	def get(self, ids=None, exclude=()):
+		"""
+		Args:
+			ids: Only the pairs with any of these ids in them, or None for all
+			exclude: Leave out the pairs with any of these ids in them
+
+		Returns:
+			Tuple: (pairs, xy) (k, 2) arrays, smaller id first
+		"""
+		if ids is None:
+			rows = np.flatnonzero(self.live)
+			groups = [(i, *group) for i, group in self.groups.items()]
+		else:
+			ids = np.unique(np.asarray(list(ids), dtype=np.int64))
+			rows = np.unique(self._rows_of(ids))
+			rows = rows[self.live[rows]]
+			# Only groups stamped since the oldest of the ids can hold them
+			oldest = int(self._stamps_of(ids).min()) if len(ids) else 0
+			groups = []
+			for i, group in reversed(self.groups.items()):
+				if group[0] < oldest:
+					break
+				if i in ids:
+					groups.append((i, *group))
+				else:
+					found = np.isin(group[1], ids)
+					groups.append((i, group[0], group[1][found], group[2][found]))
+		pairs, positions = zip((self.pairs[rows], self.xy[rows]), *(self._group(*group) for group in groups))
+		pairs, positions = np.concatenate(pairs), np.concatenate(positions)
+		if len(exclude):
+			keep = ~np.isin(pairs, list(exclude)).any(axis=1)
+			pairs, positions = pairs[keep], positions[keep]
+		return pairs, positions
+
+	def nearest(self, x, y, radius, keep=None):
+		"""
+		Find the pair closest to a position within a square hit area. The
+		pairs from the sweep are looked up in the index, the replaced ones
+		are tested one by one.
+
+		Args:
+			x: X-coordinate
+			y: Y-coordinate
+			radius: Half the side of the hit square
+			keep: Function from (m, 2) pairs to a mask of the ones that may be
+				found, or None for all
+
+		Returns:
+			Tuple: ((i, j), (x, y)) of the closest pair, or None
+		"""
+		# Positions were rounded down, which the extra unit makes up for
+		rows = np.sort(self.index.query_rect(x - radius - 1, y - radius - 1, x + radius + 1, y + radius + 1))
+		rows = rows[self.live[rows]]
+		pairs, positions = zip((self.pairs[rows], self.xy[rows]),
+			*(self._group(i, *group) for i, group in self.groups.items()))
+		pairs, positions = np.concatenate(pairs), np.concatenate(positions)
+		if keep is not None:
+			found = keep(pairs)
+			pairs, positions = pairs[found], positions[found]
+		if not len(pairs):
+			return None
+		d = np.abs(positions - (x, y)).max(axis=1)
+		i = int(d.argmin())
+		if d[i] > radius:
+			return None
+		return tuple(pairs[i].tolist()), tuple(positions[i].tolist())
@@ -0,0 +1,319 @@
+"""
+Wedge stabbing queries: which primitives the wedge of a segment or ray dual holds.
+
+A point q across the divider from a segment lies in the segment's wedge
+exactly when the dual line of q crosses the segment, and so does the dual
+point of a segment or ray on the segment's own side when its supporting line
+crosses it. With q relative to the origin of its half-plane at (u, v), the
+dual line of q passes above or below a point (a, b) of the segment's
+half-plane by the sign of
+
+	f(q) = a*u + SCALE*v + SCALE*b
+
+which is linear in q with integer coefficients. The wedge of a segment is
+where the f of its two endpoints differ in sign, and the wedge of a ray is
+where the f of its origin differs in sign from the slope of the ray measured
+against q, or is 0.
+
+QuadIndex keeps positions in Morton order, so every quadtree cell is a run of
+that order found with searchsorted. A query walks the quadtree one level at a
+time: cells entirely inside a wedge are reported whole, cells entirely outside
+are dropped, and only the cells crossed by one of the two boundary lines are
+split further or tested item by item. That visits O(sqrt(n)) cells for evenly
+spread positions, plus the items reported.
+"""
+import numpy as np
+
+from arrangement import SCALE
+from engine import CENTER_Y, DIVIDER, LEFT_ORIGIN, RIGHT_ORIGIN
+
+LEAF = 32		# Cells with at most this many items are tested item by item
+
+
+def _spread(v):
+	"""Spread the low 32 bits of each value to the even bits of a uint64."""
+	v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+	for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+						(2, 0x3333333333333333), (1, 0x5555555555555555)):
+		v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+	return v
+
+def morton(x, y):
+	"""
+	Interleave the bits of non-negative integer coordinates.
+
+	Args:
+		x: Array of x-coordinates below 2**32
+		y: Array of y-coordinates below 2**32
+
+	Returns:
+		ndarray: uint64 Morton codes, x in the even bits
+	"""
+	return _spread(x) | (_spread(y) << np.uint64(1))
+
+def dual_form(xy, half):
+	"""
+	Linear forms f(q) = A*x + B*y + C of the dual lines of points, taking
+	world coordinates of q in the other half-plane.
+
+	Args:
+		xy: (n, 2) positions of points, all in the given half-plane
+		half: Half-plane of the points
+
+	Returns:
+		ndarray: (n, 3) int64 coefficients [A, B, C]
+	"""
+	xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+	a = xy[:, 0] - (RIGHT_ORIGIN if half else LEFT_ORIGIN)
+	b = xy[:, 1] - CENTER_Y
+	origin = LEFT_ORIGIN if half else RIGHT_ORIGIN
+	return np.stack([a, np.full(len(a), SCALE), SCALE*b - a*origin - SCALE*CENTER_Y], axis=1)
+
+
+class Wedge:
+	"""
+	Double wedge where two linear forms differ in sign.
+
+	Attributes:
+		f1 (ndarray): [A, B, C] of the first form; positions where it is 0 are inside
+		f2 (ndarray): [A, B, C] of the second form
+		closed (bool): Whether positions where the second form is 0 are inside
+	"""
+	def __init__(self, f1, f2, closed):
+		self.f1 = np.asarray(f1, dtype=np.int64)
+		self.f2 = np.asarray(f2, dtype=np.int64)
+		self.closed = closed
+
+	@classmethod
+	def of_segment(cls, xy):
+		"""
+		Args:
+			xy: (2, 2) positions of the endpoints of a segment
+
+		Returns:
+			Wedge: Positions across the divider whose dual line crosses the segment
+		"""
+		f = dual_form(xy, int(xy[0][0] > DIVIDER))
+		return cls(f[0], f[1], True)
+
+	@classmethod
+	def of_ray(cls, coords):
+		"""
+		Args:
+			coords: [ox, oy, x, y] origin of a ray and a point further along it
+
+		Returns:
+			Wedge: Positions across the divider whose dual line crosses the ray
+		"""
+		ox, oy, x, y = (int(c) for c in coords)
+		half = int(ox > DIVIDER)
+		dx, dy = x - ox, y - oy
+		# Slope of the ray against the dual line of q, in the same units as the dual form
+		origin = LEFT_ORIGIN if half else RIGHT_ORIGIN
+		return cls(dual_form([(ox, oy)], half)[0], (dx, 0, SCALE*dy - dx*origin), False)
+
+	def _values(self, f, x, y):
+		return f[0]*x + f[1]*y + f[2]
+
+	def contains(self, xy):
+		"""
+		Args:
+			xy: (n, 2) integer positions
+
+		Returns:
+			ndarray: (n,) bool mask of the positions inside
+		"""
+		xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+		v1 = self._values(self.f1, xy[:, 0], xy[:, 1])
+		v2 = self._values(self.f2, xy[:, 0], xy[:, 1])
+		inside = (np.sign(v1)*np.sign(v2) < 0) | (v1 == 0)
+		if self.closed:
+			inside |= v2 == 0
+		return inside
+
+	def classify(self, boxes):
+		"""
+		Sort boxes into those entirely inside, entirely outside and the rest.
+		Linear forms are extreme at the corners of a box, so the corners decide.
+
+		Args:
+			boxes: (m, 4) integer [x0, y0, x1, y1] boxes, edges included
+
+		Returns:
+			Tuple: ((m,) inside mask, (m,) outside mask)
+		"""
+		boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+		x = boxes[:, [0, 2, 0, 2]]
+		y = boxes[:, [1, 1, 3, 3]]
+		v1 = self._values(self.f1, x, y)
+		v2 = self._values(self.f2, x, y)
+		lo1, hi1, lo2, hi2 = v1.min(axis=1), v1.max(axis=1), v2.min(axis=1), v2.max(axis=1)
+		inside = ((lo1 > 0) & (hi2 < 0)) | ((hi1 < 0) & (lo2 > 0))
+		outside = ((lo1 > 0) & (lo2 > 0)) | ((hi1 < 0) & (hi2 < 0))
+		return inside, outside
+
+
+class QuadIndex:
+	"""
+	Static quadtree over integer positions, stored as the ids sorted in Morton order.
+
+	Attributes:
+		ids (ndarray): Ids in Morton order
+		xy (ndarray): Positions in the same order
+		codes (ndarray): Sorted Morton codes of the positions relative to origin
+		origin (tuple): Smallest x and y of the positions
+		depth (int): Bits per coordinate, the quadtree has depth + 1 levels
+	"""
+	def __init__(self, ids, xy):
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+		self.origin = tuple(xy.min(axis=0).tolist()) if len(xy) else (0, 0)
+		local = xy - self.origin
+		self.depth = max(int(local.max(initial=0)).bit_length(), 1)
+		codes = morton(local[:, 0], local[:, 1])
+		order = np.argsort(codes, kind='stable')
+		self.ids, self.xy, self.codes = ids[order], xy[order], codes[order]
+
+	def __len__(self):
+		return len(self.ids)
+
+	def query(self, wedge):
+		"""
+		Find every id positioned inside a wedge.
+
+		Args:
+			wedge: Wedge to test against
+
+		Returns:
+			ndarray: Matching ids, in no particular order
+		"""
+		hits = []
+		cells = np.zeros((1, 2), dtype=np.int64)
+		for level in range(self.depth + 1):
+			if not len(cells):
+				break
+			shift = self.depth - level
+			prefix = morton(cells[:, 0], cells[:, 1])
+			lo = np.searchsorted(self.codes, prefix << np.uint64(2*shift), 'left')
+			hi = np.searchsorted(self.codes, (prefix + np.uint64(1)) << np.uint64(2*shift), 'left')
+			filled = hi > lo
+			cells, lo, hi = cells[filled], lo[filled], hi[filled]
+
+			corner = cells << shift
+			boxes = np.concatenate([corner, corner + (1 << shift) - 1], axis=1) + (self.origin*2)
+			inside, outside = wedge.classify(boxes)
+			test = ~inside & ~outside & ((hi - lo <= LEAF) | (shift == 0))
+			split = ~inside & ~outside & ~test
+
+			hits.append(self.ids[self._rows(lo[inside], hi[inside])])
+			rows = self._rows(lo[test], hi[test])
+			hits.append(self.ids[rows[wedge.contains(self.xy[rows])]])
+
+			# Children of the cells crossed by the edges of the wedge
+			cells = (2*cells[split])[:, None] + np.array([(0, 0), (1, 0), (0, 1), (1, 1)])
+			cells = cells.reshape(-1, 2)
+		return np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+
+	def _rows(self, lo, hi):
+		"""Concatenate the index ranges [lo, hi)."""
+		lengths = hi - lo
+		return np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class Stabbing:
+	"""
+	Wedge queries over a scene, indexed by the half-plane of each primitive.
+
+	Indexes are rebuilt on the first query after the scene version changes.
+	Primitives that were active since then (move_point keeps the version, and
+	so does putting a drag down) are left out of the index results and tested
+	where they are now.
+
+	Attributes:
+		version (int): Scene version the indexes were built for, None before the first build
+		points (list): QuadIndex of the point positions in each half-plane
+		segments (list): QuadIndex of the dual points of the segments in each half-plane
+		rays (list): QuadIndex of the dual points of the rays in each half-plane
+		moved (list): Sets of the points, segments and rays that were active since the rebuild
+	"""
+	def __init__(self):
+		self.version = None
+		self.points = self.segments = self.rays = None
+		self.moved = [set(), set(), set()]
+
+	def update(self, scene):
+		"""Rebuild the indexes if the scene was edited since they were built."""
+		if scene.version == self.version:
+			return
+		self.version = scene.version
+		self.moved = [set(), set(), set()]
+		ids = scene.points.ids()
+		xy = scene.points.xy[ids]
+		self.points = self._split(ids, xy, xy[:, 0])
+		ids = scene.segments.ids()
+		self.segments = self._split(ids, scene.segments.dual[ids], scene.segments.coords[ids, 0])
+		ids = scene.rays.ids()
+		self.rays = self._split(ids, scene.rays.dual[ids], scene.rays.coords[ids, 0])
+
+	def mark_moved(self, active):
+		"""
+		Record primitives that may move without the scene version changing,
+		so queries test them where they are until the next rebuild.
+
+		Args:
+			active: (point ids, segment ids, ray ids)
+		"""
+		for moved, ids in zip(self.moved, active):
+			moved.update(ids)
+
+	def _split(self, ids, xy, x):
+		right = x > DIVIDER
+		return [QuadIndex(ids[~right], xy[~right]), QuadIndex(ids[right], xy[right])]
+
+	def stabbed(self, scene, segment=None, ray=None, active=((), (), ())):
+		"""
+		Find the primitives in the wedge of a segment or ray dual: the points
+		whose dual lines cross it, and the segments and rays whose supporting
+		lines cross it.
+
+		Args:
+			scene: Scene the primitive is in
+			segment: Id of the segment to query
+			ray: Id of the ray to query, if no segment is given
+			active: (point ids, segment ids, ray ids) that may move now; they
+				are tested where they are until the next rebuild
+
+		Returns:
+			Tuple: (point ids, segment ids, ray ids) sorted arrays, without
+			the queried primitive itself
+		"""
+		self.update(scene)
+		self.mark_moved(active)
+		if segment is not None:
+			coords = scene.segments.coords[segment]
+			wedge = Wedge.of_segment(coords.reshape(2, 2))
+		else:
+			coords = scene.rays.coords[ray]
+			wedge = Wedge.of_ray(coords)
+		half = int(coords[0] > DIVIDER)
+
+		found = []
+		sources = ((self.points[1 - half], scene.points, 'xy'), (self.segments[half], scene.segments, 'dual'),
+				(self.rays[half], scene.rays, 'dual'))
+		for (index, pool, field), moved, own in zip(sources, self.moved, (None, segment, ray)):
+			ids = index.query(wedge)
+			moved = np.array(sorted(moved), dtype=np.int64)
+			if len(moved):
+				ids = ids[~np.isin(ids, moved)]
+				moved = moved[pool.alive[moved]]
+				if field == 'xy':
+					sides = pool.xy[moved, 0]
+				else:
+					sides = pool.coords[moved, 0]
+				moved = moved[(sides > DIVIDER) == bool(half if field == 'dual' else 1 - half)]
+				ids = np.concatenate([ids, moved[wedge.contains(getattr(pool, field)[moved])]])
+			ids = np.unique(ids)
+			if own is not None:
+				ids = ids[ids != own]
+			found.append(ids)
+		return tuple(found)
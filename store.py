@@ -0,0 +1,331 @@
+"""
+Struct-of-arrays storage for scene primitives.
+
+Each kind of primitive lives in one Pool: a set of contiguous NumPy buffers
+indexed by a stable integer id. Deleted ids go on a free-list and are reused,
+so adding and removing are O(1) and never shift the ids of other primitives.
+"""
+import numpy as np
+
+
+class Pool:
+	"""
+	Array-backed storage for one kind of primitive.
+
+	Every field given to the constructor becomes an attribute holding a
+	(capacity, *shape) array; row i belongs to id i. Arrays are reallocated
+	when the pool grows, so always go through the attribute rather than
+	keeping a reference to an old buffer.
+
+	Attributes:
+		fields (dict): Field name -> (dtype, shape) of one row
+		capacity (int): Number of rows currently allocated
+		size (int): High-water mark, ids are always below it
+		alive (ndarray): Bool mask of ids in use
+		free (list): Ids below size that can be reused
+	"""
+	def __init__(self, fields, capacity=64):
+		self.fields = fields
+		self.capacity = capacity
+		self.alive = np.zeros(capacity, dtype=bool)
+		for name, (dtype, shape) in fields.items():
+			setattr(self, name, np.zeros((capacity, *shape), dtype=dtype))
+		self.size = 0
+		self.free = []
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def __contains__(self, i):
+		return 0 <= i < self.size and bool(self.alive[i])
+
+	def _grow(self, needed):
+		"""Reallocate every buffer so that at least `needed` rows fit."""
+		capacity = max(self.capacity, 64)
+		while capacity < needed:
+			capacity *= 2
+		alive = np.zeros(capacity, dtype=bool)
+		alive[:self.capacity] = self.alive
+		self.alive = alive
+		for name in self.fields:
+			old = getattr(self, name)
+			new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+			new[:self.capacity] = old
+			setattr(self, name, new)
+		self.capacity = capacity
+
+	def add(self, **values):
+		"""
+		Store one primitive.
+
+		Args:
+			**values: Row contents keyed by field name; missing fields are zeroed
+
+		Returns:
+			int: Id of the new primitive
+		"""
+		if self.free:
+			i = self.free.pop()
+		else:
+			if self.size == self.capacity:
+				self._grow(self.size + 1)
+			i = self.size
+			self.size += 1
+		for name in self.fields:
+			getattr(self, name)[i] = values.get(name, 0)
+		self.alive[i] = True
+		self.count += 1
+		return i
+
+	def add_many(self, n, **values):
+		"""
+		Store n primitives at once, reusing free ids first and appending the
+		rest after the high-water mark.
+
+		Args:
+			n: Number of primitives
+			**values: Arrays of n rows keyed by field name
+
+		Returns:
+			ndarray: Ids of the new primitives
+		"""
+		reused = min(n, len(self.free))
+		fresh = n - reused
+		if self.size + fresh > self.capacity:
+			self._grow(self.size + fresh)
+		ids = np.arange(self.size - reused, self.size + fresh)
+		if reused:
+			ids[:reused] = self.free[len(self.free) - reused:]
+			del self.free[len(self.free) - reused:]
+		for name in self.fields:
+			getattr(self, name)[ids] = values.get(name, 0)
+		self.alive[ids] = True
+		self.size += fresh
+		self.count += n
+		return ids
+
+	def put_many(self, ids, **values):
+		"""
+		Store primitives under given ids that are not in use, e.g. to bring
+		deleted ones back with the ids they had.
+
+		Args:
+			ids: (n,) array of distinct ids not in use
+			**values: Arrays of n rows keyed by field name
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		if not len(ids):
+			return
+		end = int(ids.max()) + 1
+		if end > self.capacity:
+			self._grow(end)
+		taken = set(ids[ids < self.size].tolist())
+		if taken:
+			# Ids are usually put back in the reverse order they were freed,
+			# so they are found at the end of the free-list
+			k = len(self.free)
+			while k and self.free[k - 1] in taken:
+				k -= 1
+			if len(self.free) - k == len(taken):
+				del self.free[k:]
+			else:
+				self.free = [i for i in self.free if i not in taken]
+		if end > self.size:
+			# Ids skipped past the high-water mark become free
+			skipped = np.ones(end - self.size, dtype=bool)
+			skipped[ids[ids >= self.size] - self.size] = False
+			self.free.extend((np.flatnonzero(skipped) + self.size).tolist())
+			self.size = end
+		for name in self.fields:
+			getattr(self, name)[ids] = values.get(name, 0)
+		self.alive[ids] = True
+		self.count += len(ids)
+
+	def load(self, alive, **arrays):
+		"""
+		Replace the contents of the pool with existing buffers, e.g. memory-mapped
+		ones. The buffers are used as they are until the pool has to grow.
+
+		Args:
+			alive: (size,) bool array of ids in use
+			**arrays: (size, *shape) array for every field
+		"""
+		self.alive = alive
+		for name in self.fields:
+			setattr(self, name, arrays[name])
+		self.capacity = self.size = len(alive)
+		self.free = np.flatnonzero(~np.asarray(alive)).tolist()
+		self.count = self.size - len(self.free)
+
+	def remove(self, i):
+		"""
+		Release an id so it can be reused.
+
+		Args:
+			i: Id of the primitive
+		"""
+		self.alive[i] = False
+		self.free.append(i)
+		self.count -= 1
+
+	def remove_many(self, ids):
+		"""
+		Release many ids at once.
+
+		Args:
+			ids: (n,) array of distinct live ids
+		"""
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		self.alive[ids] = False
+		self.free.extend(ids.tolist())
+		self.count -= len(ids)
+
+	def ids(self):
+		"""
+		List the ids in use, in increasing order.
+
+		Returns:
+			ndarray: Live ids
+		"""
+		return np.flatnonzero(self.alive[:self.size])
+
+	def clear(self):
+		"""Remove every primitive, keeping the allocated buffers."""
+		self.alive[:] = False
+		self.size = 0
+		self.free = []
+		self.count = 0
+
+
+class Adjacency:
+	"""
+	Maps point ids to the ids of the primitives attached to them.
+
+	Bulk additions go into a static CSR layout: ids grouped by owning point
+	with an offsets array, into which each batch is spliced after one sort of
+	the new ids. The first single edit of a point copies its static entries
+	into a Python set, which takes precedence from then on, so every edit
+	costs O(degree).
+
+	Attributes:
+		offsets (ndarray): Static ids of point p are static_ids[offsets[p]:offsets[p+1]]
+		static_ids (ndarray): Static ids grouped by point
+		sets (dict): Point id -> set of ids, for points edited one at a time
+	"""
+	def __init__(self):
+		self.clear()
+
+	def _static(self, p):
+		if p + 1 < len(self.offsets):
+			return self.static_ids[self.offsets[p]:self.offsets[p + 1]]
+		return self.static_ids[:0]
+
+	def _own(self, p):
+		"""Get the editable set of a point, copying its static entries on first use."""
+		ids = self.sets.get(p)
+		if ids is None:
+			ids = self.sets[p] = set(self._static(p).tolist())
+		return ids
+
+	def get(self, p):
+		"""
+		Get the ids attached to a point.
+
+		Args:
+			p: Point id
+
+		Returns:
+			set: Attached ids; do not modify it, use add() and discard()
+		"""
+		ids = self.sets.get(p)
+		return ids if ids is not None else set(self._static(p).tolist())
+
+	def degree(self, points):
+		"""
+		Count the ids attached to many points.
+
+		Args:
+			points: (n,) array of point ids
+
+		Returns:
+			ndarray: (n,) number of ids attached to each point
+		"""
+		points = np.asarray(points, dtype=np.int64).ravel()
+		n = len(self.offsets) - 1
+		inside = points < n
+		degree = np.zeros(len(points), dtype=np.int64)
+		degree[inside] = self.offsets[points[inside] + 1] - self.offsets[points[inside]]
+		if self.sets:
+			for k, p in enumerate(points.tolist()):
+				ids = self.sets.get(p)
+				if ids is not None:
+					degree[k] = len(ids)
+		return degree
+
+	def add(self, p, i):
+		"""Attach id i to point p."""
+		self._own(p).add(i)
+
+	def discard(self, p, i):
+		"""Detach id i from point p if it is attached."""
+		self._own(p).discard(i)
+
+	def pop(self, p):
+		"""
+		Detach everything from a point.
+
+		Args:
+			p: Point id
+
+		Returns:
+			set: Ids that were attached
+		"""
+		ids = self._own(p)
+		self.sets[p] = set()
+		return ids
+
+	def add_many(self, owners, ids):
+		"""
+		Attach many ids at once.
+
+		Args:
+			owners: (n,) array of point ids
+			ids: (n,) array of ids attached to the matching owner
+		"""
+		owners = np.asarray(owners, dtype=np.int64).ravel()
+		ids = np.asarray(ids, dtype=np.int64).ravel()
+		if not len(owners):
+			return
+
+		# Points already edited one at a time keep their sets
+		edited = np.isin(owners, np.fromiter(self.sets, dtype=np.int64, count=len(self.sets)))
+		for p, i in zip(owners[edited].tolist(), ids[edited].tolist()):
+			self.sets[p].add(i)
+		owners, ids = owners[~edited], ids[~edited]
+		if not len(owners):
+			return
+
+		order = np.argsort(owners)
+		owners, ids = owners[order], ids[order]
+		n = len(self.offsets) - 1
+
+		# New points only: append to the end of the layout
+		if owners[0] >= n:
+			counts = np.bincount(owners - n)
+			self.static_ids = np.concatenate([self.static_ids, ids])
+			self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(counts)])
+			return
+
+		# Otherwise splice the new ids in after the existing ones of their point
+		at = self.offsets[np.minimum(owners + 1, n)]
+		self.static_ids = np.insert(self.static_ids, at, ids)
+		counts = np.bincount(owners, minlength=n)
+		counts[:n] += np.diff(self.offsets)
+		self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+	def clear(self):
+		"""Detach everything from every point."""
+		self.offsets = np.zeros(1, dtype=np.int64)
+		self.static_ids = np.zeros(0, dtype=np.int64)
+		self.sets = {}
@@ -0,0 +1,4 @@
+"""The modules of the project are top-level, import them from the repository root."""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,94 @@
+"""The arrangement sweep against checking every pair of dual lines."""
+import numpy as np
+import pytest
+
+from arrangement import HALF, SCALE, Arrangement, build, dual_params, to_world
+from engine import Scene
+from spatial import PairTable
+
+
+def brute_force(ids, xy):
+	"""Every pair of dual lines of the same half-plane that cross in it, O(n²)."""
+	a, b, left = dual_params(xy)
+	pairs, positions = [], []
+	for i in range(len(ids)):
+		for j in range(i + 1, len(ids)):
+			if left[i] != left[j] or a[i] == a[j]:
+				continue
+			u = SCALE*(b[i] - b[j])/(a[j] - a[i])
+			if -HALF <= u <= HALF:
+				pairs.append(sorted((int(ids[i]), int(ids[j]))))
+				positions.append(to_world(np.array([u]), a[i], b[i], left[i])[0])
+	return np.array(pairs, dtype=np.int64).reshape(-1, 2), np.array(positions).reshape(-1, 2)
+
+def by_pair(pairs, positions):
+	order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+	return pairs[order], positions[order]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_build_matches_brute_force(seed):
+	rng = np.random.default_rng(seed)
+	n = int(rng.integers(2, 80))
+	# A coarse grid gives duplicate points, parallel lines and several lines through one vertex
+	step = int(rng.choice([1, 25, 50]))
+	xy = np.stack([rng.integers(0, 1000//step, n)*step, rng.integers(0, 500//step, n)*step], axis=1)
+	ids = rng.permutation(4*n)[:n]
+
+	pairs, positions = by_pair(*build(ids, xy))
+	expected, expected_positions = by_pair(*brute_force(ids, xy))
+	np.testing.assert_array_equal(pairs, expected)
+	np.testing.assert_allclose(positions, expected_positions, atol=1e-9)
+
+def test_build_without_points():
+	pairs, positions = build(np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=np.int64))
+	assert pairs.shape == (0, 2) and positions.shape == (0, 2)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_move_matches_build(seed):
+	rng = np.random.default_rng(seed)
+	scene = Scene()
+	scene.add_points(np.stack([rng.integers(0, 1000, 60), rng.integers(0, 500, 60)], axis=1))
+	arrangement = Arrangement()
+	ids = scene.points.ids()
+	arrangement.set(PairTable(*build(ids, scene.points.xy[ids])), scene.version)
+	for _ in range(30):
+		# Drags of one point and of several, deletes and adds that reuse their ids
+		ids = scene.points.ids()
+		kind = rng.integers(4)
+		if kind == 0:
+			p = int(rng.choice(ids))
+			scene.move_point(p, int(rng.integers(0, 1000)), int(rng.integers(0, 500)))
+			moved = [p]
+		elif kind == 1:
+			moved = rng.choice(ids, 5, replace=False)
+			scene.move_points(moved, int(rng.integers(-20, 21)), int(rng.integers(-20, 21)))
+			moved = moved.tolist()
+		elif kind == 2:
+			moved = rng.choice(ids, 3, replace=False).tolist()
+			scene.delete_points(moved)
+		else:
+			moved = scene.add_points(np.stack([rng.integers(0, 1000, 3), rng.integers(0, 500, 3)], axis=1)).tolist()
+		arrangement.move(scene, moved)
+
+		ids = scene.points.ids()
+		expected, expected_positions = by_pair(*build(ids, scene.points.xy[ids]))
+		pairs, positions = by_pair(*arrangement.vertices())
+		np.testing.assert_array_equal(pairs, expected)
+		np.testing.assert_allclose(positions, expected_positions, atol=1e-9)
+		assert len(arrangement) == len(expected)
+
+		# The vertices on some lines, and on all others
+		some = rng.choice(ids, 4, replace=False).tolist()
+		on = np.isin(expected, some).any(axis=1)
+		pairs, positions = by_pair(*arrangement.vertices(some))
+		np.testing.assert_array_equal(pairs, expected[on])
+		np.testing.assert_allclose(positions, expected_positions[on], atol=1e-9)
+		pairs, positions = by_pair(*arrangement.vertices(exclude=some))
+		np.testing.assert_array_equal(pairs, expected[~on])
+
+		if len(expected):
+			i = int(rng.integers(len(expected)))
+			hit = arrangement.vertex_at(*expected_positions[i], 0.5)
+			assert hit is not None and np.allclose(hit[1], expected_positions[i])
@@ -0,0 +1,149 @@
+"""The segment crossing sweep against testing every pair of segments."""
+import numpy as np
+import pytest
+
+from crossings import Crossings, build
+from engine import DIVIDER, Scene
+from spatial import PairTable
+
+
+def orient(p, q, r):
+	return np.sign((q[0] - p[0])*(r[1] - p[1]) - (q[1] - p[1])*(r[0] - p[0]))
+
+def on_segment(p, q, r):
+	"""Whether r, collinear with p and q, lies between them."""
+	return min(p[0], q[0]) <= r[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= r[1] <= max(p[1], q[1])
+
+def intersect(s, t):
+	p, q, r, u = s[:2], s[2:], t[:2], t[2:]
+	o1, o2, o3, o4 = orient(p, q, r), orient(p, q, u), orient(r, u, p), orient(r, u, q)
+	if o1 != o2 and o3 != o4:
+		return True
+	return ((o1 == 0 and on_segment(p, q, r)) or (o2 == 0 and on_segment(p, q, u))
+			or (o3 == 0 and on_segment(r, u, p)) or (o4 == 0 and on_segment(r, u, q)))
+
+def brute_force(ids, coords, eps):
+	"""Every pair of segments of the same half-plane that meet away from a shared endpoint, O(n²)."""
+	pairs = []
+	for i in range(len(ids)):
+		for j in range(i + 1, len(ids)):
+			s, t = coords[i].tolist(), coords[j].tolist()
+			if (s[0] > DIVIDER) != (t[0] > DIVIDER) or s[:2] == s[2:] or t[:2] == t[2:]:
+				continue
+			if set(eps[i].tolist()) & set(eps[j].tolist()):
+				continue
+			if intersect(s, t):
+				pairs.append(sorted((int(ids[i]), int(ids[j]))))
+	pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+	return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+def random_segments(rng):
+	"""Segments between random points of a small grid in either half-plane, so many touch or overlap."""
+	n = int(rng.integers(2, 60))
+	step = int(rng.choice([1, 10, 50]))
+	points = np.stack([rng.integers(0, 500//step, 2*n)*step, rng.integers(0, 500//step, 2*n)*step], axis=1)
+	points[n:, 0] += 501
+	eps = rng.integers(0, n, (n, 2)) + np.where(rng.random(n) < 0.5, 0, n)[:, None]
+	coords = np.concatenate([points[eps[:, 0]], points[eps[:, 1]]], axis=1)
+	return rng.permutation(4*n)[:n], coords, eps
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_build_matches_brute_force(seed):
+	ids, coords, eps = random_segments(np.random.default_rng(seed))
+	pairs, positions = build(ids, coords, eps)
+	order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+	np.testing.assert_array_equal(pairs[order], brute_force(ids, coords, eps))
+
+	# Each crossing is reported at a point of both segments
+	row = {i: k for k, i in enumerate(ids.tolist())}
+	for pair, (x, y) in zip(pairs.tolist(), positions.tolist()):
+		for s in pair:
+			x0, y0, x1, y1 = coords[row[s]].tolist()
+			assert abs((x1 - x0)*(y - y0) - (y1 - y0)*(x - x0)) < 1e-6*max(1, abs(x1 - x0) + abs(y1 - y0))
+			assert min(x0, x1) - 1e-9 <= x <= max(x0, x1) + 1e-9
+			assert min(y0, y1) - 1e-9 <= y <= max(y0, y1) + 1e-9
+
+
+def segment_scene(rng, n=40, m=40):
+	scene = Scene()
+	ids = scene.add_points(np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1))
+	for p1, p2 in rng.choice(ids, (m, 2)).tolist():
+		if p1 != p2:
+			scene.connect(p1, p2)
+	return scene
+
+def swept(scene):
+	ids = scene.segments.ids()
+	coords = scene.segments.coords[ids]
+	pairs, positions = build(ids, coords, scene.segments.eps[ids])
+	return PairTable(pairs, positions), ids, coords
+
+def rebuild(crossings, scene):
+	table, ids, coords = swept(scene)
+	crossings.set(table, scene.version, ids, coords)
+
+def by_pair(pairs, positions):
+	order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+	return pairs[order], positions[order]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_move_matches_build(seed):
+	rng = np.random.default_rng(seed)
+	scene = segment_scene(rng)
+	crossings = Crossings()
+	rebuild(crossings, scene)
+	for _ in range(30):
+		ids = scene.points.ids()
+		if rng.random() < 0.5:
+			p = int(rng.choice(ids))
+			seg_changed, ray_changed = scene.incident(p)
+			scene.move_point(p, int(rng.integers(0, 1000)), int(rng.integers(0, 500)), seg_changed, ray_changed)
+			moved = [s for s, slot in seg_changed]
+		else:
+			selection = rng.choice(ids, 5, replace=False)
+			segments, rays = scene.incident_many(selection)
+			scene.move_points(selection, int(rng.integers(-30, 31)), int(rng.integers(-30, 31)), segments, rays)
+			moved = segments.tolist()
+		crossings.move(scene, moved)
+
+		table, ids, coords = swept(scene)
+		expected, expected_positions = by_pair(*table.get())
+		pairs, positions = by_pair(*crossings.crossings(scene))
+		np.testing.assert_array_equal(pairs, expected)
+		np.testing.assert_allclose(positions, expected_positions, atol=1e-9)
+
+		some = rng.choice(ids, 4, replace=False).tolist()
+		on = np.isin(expected, some).any(axis=1)
+		np.testing.assert_array_equal(by_pair(*crossings.crossings(scene, some))[0], expected[on])
+		np.testing.assert_array_equal(by_pair(*crossings.crossings(scene, exclude=some))[0], expected[~on])
+
+@pytest.mark.parametrize('seed', range(10))
+def test_stale_crossings_are_skipped(seed):
+	rng = np.random.default_rng(seed)
+	scene = segment_scene(rng)
+	crossings = Crossings()
+	table, ids, coords = swept(scene)
+	crossings.set(table, scene.version, ids, coords)
+	before, before_positions = crossings.crossings(scene)
+
+	# Deleted segments, and new ones that reuse their ids, until the next build
+	points = scene.points.ids()
+	scene.delete_points(rng.choice(points, 4, replace=False))
+	points = scene.points.ids()
+	for p1, p2 in rng.choice(points, (10, 2)).tolist():
+		if p1 != p2:
+			scene.connect(p1, p2)
+	changed = [s for s in ids.tolist() if s not in scene.segments or
+		(scene.segments.coords[s] != coords[np.searchsorted(ids, s)]).any()]
+	stale = np.isin(before, changed).any(axis=1)
+
+	pairs, positions = crossings.crossings(scene)
+	np.testing.assert_array_equal(by_pair(pairs, positions)[0], by_pair(before[~stale], before_positions[~stale])[0])
+	for x, y in before_positions[stale].tolist():
+		hit = crossings.crossing_at(scene, x, y, 0.5)
+		assert hit is None or not np.isin(hit[0], changed).any()
+
+	rebuild(crossings, scene)
+	np.testing.assert_array_equal(by_pair(*crossings.crossings(scene))[0], by_pair(*swept(scene)[0].get())[0])
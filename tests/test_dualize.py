@@ -0,0 +1,65 @@
+"""The dualize.py command line, chunked and in worker processes, against one dualize() call."""
+import io, json, sys
+
+import numpy as np
+import pytest
+
+from dualize import dualize, main
+from importer import csv_columns, parse_rows, split_lines
+
+
+def random_records(rng, n):
+	kinds = rng.choice(['point', 'segment', 'ray'], n)
+	coords = np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n),
+					rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1)
+	return [{'kind': str(kind), 'x': x, 'y': y, **({'x2': x2, 'y2': y2} if kind != 'point' else {})}
+			for kind, (x, y, x2, y2) in zip(kinds, coords.tolist())]
+
+def write_input(path, records, fmt):
+	with open(path, 'w') as f:
+		if fmt == 'csv':
+			f.write('kind,x,y,x2,y2\n')
+			for record in records:
+				f.write(','.join(str(record.get(key, '')) for key in ('kind', 'x', 'y', 'x2', 'y2')) + '\n')
+				# Blank lines are skipped
+				f.write('\n' if record['x'] % 7 == 0 else '')
+		else:
+			for record in records:
+				f.write(json.dumps(record) + '\n')
+
+def expected(records):
+	lines = [','.join(str(record.get(key, '')) for key in ('kind', 'x', 'y', 'x2', 'y2')) for record in records]
+	return dualize(*parse_rows(split_lines(lines, csv_columns('kind,x,y,x2,y2'))))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+@pytest.mark.parametrize('chunk, workers', [(10000, 1), (7, 1), (7, 2), (50, 3)])
+def test_output_matches_dualize(tmp_path, capsys, fmt, chunk, workers):
+	records = random_records(np.random.default_rng(chunk + workers), 300)
+	source, output = tmp_path/f'in.{fmt}', tmp_path/'out.ndjson'
+	write_input(source, records, fmt)
+	main([str(source), '-o', str(output), '--chunk', str(chunk), '--workers', str(workers)])
+
+	with open(output) as f:
+		got = [json.loads(line) for line in f]
+	# Records come back in input order whatever chunk finished first
+	assert got == json.loads(json.dumps(expected(records)))
+	assert capsys.readouterr().err.strip() == 'dualize: 300 records'
+
+def test_stdin_to_stdout(tmp_path, capsys, monkeypatch):
+	records = random_records(np.random.default_rng(0), 40)
+	write_input(tmp_path/'in.csv', records, 'csv')
+	with open(tmp_path/'in.csv') as f:
+		monkeypatch.setattr(sys, 'stdin', io.StringIO(f.read()))
+	main(['-', '--chunk', '9'])
+	out = capsys.readouterr().out
+	assert [json.loads(line) for line in out.splitlines()] == json.loads(json.dumps(expected(records)))
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_bad_record_is_numbered_across_chunks(tmp_path, capsys, workers):
+	records = random_records(np.random.default_rng(1), 30)
+	records[22] = {'kind': 'segment', 'x': 1, 'y': 2}
+	source = tmp_path/'in.ndjson'
+	write_input(source, records, 'ndjson')
+	with pytest.raises(SystemExit, match='record 23: segment needs x, y, x2, y2'):
+		main([str(source), '-o', str(tmp_path/'out.ndjson'), '--chunk', '5', '--workers', str(workers)])
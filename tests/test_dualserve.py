@@ -0,0 +1,52 @@
+"""The dual transform server, through its client."""
+import asyncio, threading
+
+import pytest
+
+from dualize import dualize
+from dualserve import Client, Server, parse_records
+
+
+@pytest.fixture
+def client(tmp_path):
+	path = str(tmp_path / 'dual.sock')
+	running = {}
+	started = threading.Event()
+
+	async def serve():
+		running['loop'], running['task'] = asyncio.get_running_loop(), asyncio.current_task()
+		await Server().serve(unix=path, ready=lambda server: started.set())
+
+	def run():
+		try:
+			asyncio.run(serve())
+		except asyncio.CancelledError:
+			pass
+
+	thread = threading.Thread(target=run, daemon=True)
+	thread.start()
+	assert started.wait(5)
+	client = Client(unix=path)
+	yield client
+	client.close()
+	running['loop'].call_soon_threadsafe(running['task'].cancel)
+	thread.join(5)
+
+def test_results_match_dualize(client):
+	records = [{'x': 120, 'y': 80}, {'kind': 'segment', 'x': 600, 'y': 100, 'x2': 700, 'y2': 300},
+			{'kind': 'ray', 'x': 100, 'y': 200, 'x2': 150, 'y2': 100}]
+	assert client.dualize(records) == dualize(*parse_records(records))
+
+@pytest.mark.parametrize('record, message', [
+	({'x': 1e30, 'y': 1}, 'record 2: invalid coordinate'),
+	({'x': float('nan'), 'y': 1}, 'record 2: invalid coordinate'),
+	({'x': [1], 'y': 1}, 'record 2: x must be a string or a number'),
+	({'x': 1, 'y': {'v': 1}}, 'record 2: y must be a string or a number'),
+	(5, 'record 2: must be an object'),
+])
+def test_bad_records_get_an_error(client, record, message):
+	response = client.request(records=[{'x': 1, 'y': 1}, record])
+	assert 'results' not in response
+	assert response['error'].startswith(message)
+	# The connection keeps working
+	assert len(client.dualize([{'x': 1, 'y': 1}])) == 1
@@ -0,0 +1,73 @@
+"""The batch dual transforms against the scalar ones, row by row."""
+import numpy as np
+import pytest
+
+from engine import (DIVIDER, HEIGHT, WIDTH, batch_point_duals, batch_ray_duals, batch_ray_wedges, batch_rays,
+					batch_segment_duals, batch_segment_wedges, get_point_dual, get_ray, get_ray_wedge,
+					get_segment_dual, get_segment_wedge)
+
+
+def random_points(rng, n):
+	"""Points anywhere on the screen, some of them on the divider."""
+	xy = np.stack([rng.integers(0, WIDTH, n), rng.integers(0, HEIGHT, n)], axis=1)
+	xy[rng.random(n) < 0.1, 0] = DIVIDER
+	return xy
+
+def random_pairs(rng, n):
+	"""Pairs of points in the same half-plane, some of them vertical or equal."""
+	e1 = random_points(rng, n)
+	right = e1[:, 0] > DIVIDER
+	e2 = np.stack([rng.integers(0, DIVIDER + 1, n) + right*(DIVIDER + 1), rng.integers(0, HEIGHT, n)], axis=1)
+	e2 = np.minimum(e2, WIDTH - 1)
+	vertical = rng.random(n) < 0.1
+	e2[vertical, 0] = e1[vertical, 0]
+	return e1, e2
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_point_duals(seed):
+	xy = random_points(np.random.default_rng(seed), 500)
+	lines = batch_point_duals(xy)
+	for (x, y), line in zip(xy.tolist(), lines.tolist()):
+		dual = get_point_dual(x, y)
+		assert line == [dual.startx, dual.starty, dual.endx, dual.endy]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_segment_duals(seed):
+	e1, e2 = random_pairs(np.random.default_rng(seed), 500)
+	duals = batch_segment_duals(e1, e2)
+	for p, q, dual in zip(e1.tolist(), e2.tolist(), duals.tolist()):
+		point = get_segment_dual(p, q)
+		assert dual == [point.x, point.y]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_rays(seed):
+	origins, directions = random_pairs(np.random.default_rng(seed), 500)
+	rays = batch_rays(origins, directions)
+	for o, d, ray in zip(origins.tolist(), directions.tolist(), rays.tolist()):
+		assert ray == get_ray(o + d)
+
+	coords, duals = batch_ray_duals(origins, directions)
+	np.testing.assert_array_equal(coords, rays)
+	for ray, dual in zip(rays.tolist(), duals.tolist()):
+		point = get_segment_dual(ray[:2], ray[2:])
+		assert dual == [point.x, point.y]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_wedges(seed):
+	rng = np.random.default_rng(seed)
+	e1, e2 = random_pairs(rng, 200)
+	line_1, line_2 = batch_point_duals(e1), batch_point_duals(e2)
+	duals = batch_segment_duals(e1, e2)
+	wedges = batch_segment_wedges(line_1, line_2, duals)
+	for l1, l2, dual, wedge in zip(line_1.tolist(), line_2.tolist(), duals.tolist(), wedges.tolist()):
+		assert [[list(v) for v in triangle] for triangle in get_segment_wedge(l1, l2, dual)] == wedge
+
+	rays, duals = batch_ray_duals(e1, e2)
+	lines = batch_point_duals(rays[:, :2])
+	top, bottom = rng.integers(-100, 100, 200), rng.integers(400, 600, 200)
+	wedges = batch_ray_wedges(duals, lines, rays[:, 0], e2[:, 0], top, bottom)
+	for i, wedge in enumerate(wedges.tolist()):
+		expected = get_ray_wedge(duals[i].tolist(), lines[i].tolist(), int(rays[i, 0]), int(e2[i, 0]),
+			int(top[i]), int(bottom[i]))
+		assert [[list(v) for v in polygon] for polygon in expected] == wedge
@@ -0,0 +1,50 @@
+"""The rolling window of a live feed."""
+import numpy as np
+
+from engine import Scene
+from feed import Feed, parse_lines
+
+
+def points(n, x=100):
+	return np.stack([np.full(n, x), np.arange(n)], axis=1)
+
+
+def test_evicts_the_oldest_first():
+	scene = Scene()
+	feed = Feed(scene, max_points=5, seconds=0)
+	first, _ = feed.add(points(3), now=0)
+	second, evicted = feed.add(points(4), now=1)
+	np.testing.assert_array_equal(evicted, first[:2])
+	assert len(feed) == len(scene.points) == 5
+	np.testing.assert_array_equal(np.sort(scene.points.ids()), np.sort(np.concatenate([first[2:], second])))
+
+def test_evicts_by_age():
+	scene = Scene()
+	feed = Feed(scene, max_points=0, seconds=10)
+	old, _ = feed.add(points(3), now=0)
+	assert feed.expires(now=4) == 6
+	new, evicted = feed.add(points(2), now=11)
+	np.testing.assert_array_equal(evicted, old)
+	np.testing.assert_array_equal(np.sort(scene.points.ids()), np.sort(new))
+
+def test_reused_id_is_not_evicted_with_its_old_batch():
+	scene = Scene()
+	feed = Feed(scene, max_points=0, seconds=10)
+	old, _ = feed.add(points(3), now=0)
+	# The user deletes a point of the old batch, and the next batch takes its id
+	p = int(old[1])
+	scene.delete_point(p)
+	feed.discard(p)
+	new, _ = feed.add(points(1, x=200), now=5)
+	assert new.tolist() == [p]
+	_, evicted = feed.add(points(0), now=11)
+	assert sorted(evicted.tolist()) == sorted([int(old[0]), int(old[2])])
+	assert p in scene.points and scene.points.xy[p, 0] == 200
+	assert len(feed) == 1
+	_, evicted = feed.add(points(0), now=16)
+	assert evicted.tolist() == [p] and not len(scene.points)
+
+def test_parse_lines_takes_csv_and_ndjson():
+	# The CSV lines of a batch come first
+	xy = parse_lines(['120,80', '{"x": 5, "y": 6}', '7,8'])
+	np.testing.assert_array_equal(xy, [[120, 80], [7, 8], [5, 6]])
@@ -0,0 +1,94 @@
+"""Undo, redo and jumps through the history, checked with scene digests."""
+import numpy as np
+import pytest
+
+from engine import DIVIDER, Scene
+from history import History
+from replay import scene_digest
+
+
+def same_side(rng, scene, p):
+	"""A random position on the side of the divider point p is on."""
+	half = int(scene.points.xy[p, 0] > DIVIDER)
+	return int(rng.integers(10, 490)) + 500*half, int(rng.integers(10, 490))
+
+def edit(rng, scene, history):
+	"""
+	Make one random edit the way the window records it.
+
+	Returns:
+		bool: True if the edit was added to the history
+	"""
+	ids = scene.points.ids()
+	action = int(rng.integers(7)) if len(ids) > 2 else 0
+	if action == 0:
+		history.begin(scene)
+		return history.commit(scene, [scene.add_point(int(rng.integers(10, 990)), int(rng.integers(10, 490)))])
+	elif action == 1:
+		p1, p2 = rng.choice(ids, 2, replace=False).tolist()
+		history.begin(scene, [p1, p2])
+		s = scene.connect(p1, p2)
+		return history.commit(scene, segments=[] if s is None else [s])
+	elif action == 2:
+		p = int(rng.choice(ids))
+		seg_changed, ray_changed = scene.incident(p)
+		history.begin(scene, [p], [s for s, slot in seg_changed], ray_changed)
+		for _ in range(3):
+			scene.move_point(p, *same_side(rng, scene, p), seg_changed, ray_changed)
+		return history.commit(scene)
+	elif action == 3:
+		p = int(rng.choice(ids))
+		history.begin(scene, [p])
+		r = scene.add_ray(p, *same_side(rng, scene, p))
+		scene.finish_ray(r)
+		return history.commit(scene, rays=[r])
+	elif action == 4:
+		p = int(rng.choice(ids))
+		seg_changed, ray_changed = scene.incident(p)
+		history.begin(scene, [p], [s for s, slot in seg_changed], ray_changed)
+		scene.delete_point(p)
+		return history.commit(scene)
+	elif action == 5:
+		selection = rng.choice(ids, min(3, len(ids)), replace=False)
+		segments, rays = scene.incident_many(selection)
+		history.begin(scene, selection, segments, rays)
+		scene.move_points(selection, int(rng.integers(-20, 20)), int(rng.integers(-20, 20)), segments, rays)
+		return history.commit(scene)
+	else:
+		selection = rng.choice(ids, min(2, len(ids)), replace=False)
+		history.begin(scene, selection, *scene.incident_many(selection))
+		scene.delete_points(selection)
+		return history.commit(scene)
+
+def check(scene, states, at):
+	assert scene_digest(scene) == states[at]
+	# The point index follows the restored rows
+	found = scene.points_in_rect(-10**6, -10**6, 10**6, 10**6)
+	np.testing.assert_array_equal(np.sort(found), scene.points.ids())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_round_trips(seed):
+	rng = np.random.default_rng(seed)
+	scene, history = Scene(), History(every=4, limit=24)
+	# states[k] is the digest with k of the edits kept in effect
+	states = [scene_digest(scene)]
+	for _ in range(80):
+		if history.at and rng.random() < 0.2:
+			assert history.undo(scene)
+			check(scene, states, history.at)
+			continue
+		at = history.at
+		if edit(rng, scene, history):
+			# Undone edits are dropped, and the oldest ones past the limit
+			states = states[:at + 1] + [scene_digest(scene)]
+			states = states[len(states) - len(history.edits) - 1:]
+		check(scene, states, history.at)
+
+	while history.undo(scene):
+		check(scene, states, history.at)
+	while history.redo(scene):
+		check(scene, states, history.at)
+	for at in rng.integers(0, len(history.edits) + 1, 20).tolist() + [0, len(history.edits)]:
+		assert history.goto(scene, at) == at
+		check(scene, states, at)
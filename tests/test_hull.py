@@ -0,0 +1,54 @@
+"""The incremental hulls against hulls computed from scratch."""
+import numpy as np
+import pytest
+
+import hull
+from engine import DIVIDER, Scene
+from hull import Hulls, convex_hull
+
+
+def scratch(scene, half):
+	"""Positions of the hull vertices of a half-plane, computed from every live point."""
+	ids = scene.points.ids()
+	xy = scene.points.xy[ids].astype(np.int64)
+	xy = xy[(xy[:, 0] > DIVIDER) == bool(half)]
+	return sorted(map(tuple, xy[convex_hull(xy)].tolist()))
+
+def check(hulls, scene):
+	for half in range(2):
+		assert sorted(map(tuple, hulls.xy[hulls.hulls[half]].tolist())) == scratch(scene, half)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_sync_matches_scratch(seed):
+	rng = np.random.default_rng(seed)
+	scene, hulls = Scene(), Hulls()
+	scene.add_points(np.stack([rng.integers(0, 1000, 50), rng.integers(0, 500, 50)], axis=1))
+	hulls.sync(scene)
+	check(hulls, scene)
+	for _ in range(60):
+		ids = scene.points.ids()
+		action = rng.integers(4)
+		if action == 0:
+			scene.add_points(np.stack([rng.integers(0, 1000, 5), rng.integers(0, 500, 5)], axis=1))
+			hulls.sync(scene)
+		elif action == 1 and len(ids) > 5:
+			# Hull vertices most of the time, as those are the ones that need a repair
+			pick = np.concatenate(hulls.hulls) if rng.random() < 0.7 else ids
+			scene.delete_points(rng.choice(pick, min(3, len(pick)), replace=False))
+			hulls.sync(scene)
+		elif len(ids):
+			# Dragging leaves the scene version alone, only the dragged points are compared
+			p = int(rng.choice(np.concatenate(hulls.hulls) if action == 2 else ids))
+			half = int(scene.points.xy[p, 0] > DIVIDER)
+			scene.move_point(p, int(rng.integers(0, 500)) + 501*half, int(rng.integers(-100, 600)))
+			hulls.sync(scene, [p])
+		check(hulls, scene)
+
+def test_convex_hull_prefilter(monkeypatch):
+	# Thinning out big inputs first must not change the hull of the monotone chain
+	rng = np.random.default_rng(0)
+	inputs = [rng.integers(0, 50, (n, 2)) for n in (64, 200, 1000)]
+	filtered = [xy[convex_hull(xy)].tolist() for xy in inputs]
+	monkeypatch.setattr(hull, 'PREFILTER_MIN', len(inputs[-1]) + 1)
+	assert filtered == [xy[convex_hull(xy)].tolist() for xy in inputs]
@@ -0,0 +1,36 @@
+"""Parsing imported records."""
+import numpy as np
+import pytest
+
+from importer import COORD_LIMIT, csv_columns, split_lines, to_arrays
+
+COLUMNS = csv_columns('kind,x,y,x2,y2')
+
+
+def parse(*lines):
+	return to_arrays(split_lines(list(lines), COLUMNS))
+
+
+def test_kinds_and_defaults():
+	arrays = parse('point,120,80,,', ',5,6,,', 'segment,600,100,700,300', 'ray,100,200,150,100')
+	np.testing.assert_array_equal(arrays['point'], [[120, 80, 0, 0], [5, 6, 0, 0]])
+	np.testing.assert_array_equal(arrays['segment'], [[600, 100, 700, 300]])
+	np.testing.assert_array_equal(arrays['ray'], [[100, 200, 150, 100]])
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', '1e30', str(COORD_LIMIT + 1)])
+def test_rejects_non_finite_and_huge(value):
+	with pytest.raises(ValueError, match='record 2: invalid coordinate'):
+		parse('point,1,1,,', f'segment,1,1,{value},2')
+
+def test_clamps_positions_to_the_screen():
+	arrays = parse('point,-5,-7,,', 'segment,10,20,2000,30', 'ray,1200,5,5000,7')
+	np.testing.assert_array_equal(arrays['point'], [[0, -7, 0, 0]])
+	np.testing.assert_array_equal(arrays['segment'], [[10, 20, 999, 30]])
+	# The second point of a ray only gives its direction
+	np.testing.assert_array_equal(arrays['ray'], [[999, 5, 5000, 7]])
+
+def test_reports_bad_kinds_and_missing_fields():
+	with pytest.raises(ValueError, match="record 1: unknown kind 'circle'"):
+		parse('circle,1,1,,')
+	with pytest.raises(ValueError, match='record 2: segment needs x, y, x2, y2'):
+		parse('point,1,1,,', 'segment,1,1,,')
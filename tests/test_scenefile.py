@@ -0,0 +1,40 @@
+"""Scene files: round trips, and saving over the file a scene was loaded from."""
+import numpy as np
+
+from engine import Scene
+from replay import scene_digest
+from scenefile import load_scene, save_scene
+
+
+def make_scene():
+	scene = Scene()
+	rng = np.random.default_rng(0)
+	ids = scene.add_points(np.stack([rng.integers(0, 1000, 200), rng.integers(0, 500, 200)], axis=1))
+	left = ids[scene.points.xy[ids, 0] <= 495]
+	for p1, p2 in zip(left[:20:2].tolist(), left[1:20:2].tolist()):
+		scene.connect(p1, p2)
+	r = scene.add_ray(int(left[-1]), 100, 100)
+	scene.finish_ray(r)
+	scene.delete_points(ids[100:120])
+	return scene
+
+def test_round_trip(tmp_path):
+	scene = make_scene()
+	path = str(tmp_path / 'scene.dual')
+	save_scene(scene, path)
+	for mmap in (True, False):
+		loaded = load_scene(path, mmap=mmap)
+		assert scene_digest(loaded) == scene_digest(scene)
+		np.testing.assert_array_equal(np.sort(loaded.points_in_rect(0, 0, 1000, 500)), scene.points.ids())
+
+def test_save_over_loaded_file(tmp_path):
+	path = str(tmp_path / 'scene.dual')
+	save_scene(make_scene(), path)
+	scene = load_scene(path)
+	# The pools are memory-mapped from path, saving over it must not pull the file from under them
+	scene.add_point(10, 10)
+	digest = scene_digest(scene)
+	save_scene(scene, path)
+	assert scene_digest(scene) == digest
+	assert scene_digest(load_scene(path)) == digest
+	assert [entry.name for entry in tmp_path.iterdir()] == ['scene.dual']
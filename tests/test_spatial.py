@@ -0,0 +1,83 @@
+"""GridIndex, static runs and dynamic layer, against a dict of positions."""
+import math
+
+import numpy as np
+import pytest
+
+from spatial import BULK_MIN, GridIndex
+
+
+def in_rect(model, x0, y0, x1, y1):
+	return sorted(i for i, (x, y) in model.items() if x0 <= x <= x1 and y0 <= y <= y1)
+
+def check(index, model, rng):
+	assert len(index) == len(model)
+	assert all(i in index for i in model)
+	# Rows of removed ids are dropped once they are most of the static layer
+	rows = sum(len(run[2]) for run in index.runs)
+	assert rows <= 2*index.static_count + BULK_MIN
+	assert len(index.runs) <= 2*math.log2(max(rows, 2)) + 1
+
+	rects = []
+	for _ in range(5):
+		x0, y0 = rng.integers(-20, 1000), rng.integers(-20, 500)
+		rects.append((x0, y0, x0 + rng.integers(0, 300), y0 + rng.integers(0, 300)))
+		assert sorted(index.query_rect(*rects[-1]).tolist()) == in_rect(model, *rects[-1])
+	expected = sorted(set().union(*(in_rect(model, *rect) for rect in rects)))
+	assert sorted(index.query_rects(rects).tolist()) == expected
+
+	r = index.radius
+	for mx, my in zip(rng.integers(0, 1000, 5).tolist(), rng.integers(0, 500, 5).tolist()):
+		expected = sorted(i for i, (x, y) in model.items() if x - r <= mx < x + r and y - r <= my < y + r)
+		assert index.query(mx, my) == expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_grid_index_matches_dict(seed):
+	rng = np.random.default_rng(seed)
+	index = GridIndex()
+	model = {}
+	free = list(range(20000))
+	for _ in range(60):
+		kind = rng.integers(5)
+		if kind in (0, 1):
+			# Batches below BULK_MIN go into the dynamic layer, bigger ones make a static run
+			n = int(rng.integers(1, BULK_MIN)) if kind == 0 else int(rng.integers(BULK_MIN, 4*BULK_MIN))
+			ids = np.array([free.pop(int(rng.integers(len(free)))) for _ in range(n)])
+			xy = np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1)
+			index.insert_many(ids, xy)
+			model.update(zip(ids.tolist(), map(tuple, xy.tolist())))
+		elif kind == 2 and model:
+			ids = rng.choice(sorted(model), int(rng.integers(1, len(model) + 1)), replace=False)
+			index.remove_many(ids)
+			for i in ids.tolist():
+				del model[i]
+				free.append(i)
+		elif kind == 3 and model:
+			for i in rng.choice(sorted(model), min(len(model), 20), replace=False).tolist():
+				index.remove(i)
+				del model[i]
+				free.append(i)
+		elif kind == 4 and model:
+			# Moved ids leave the static layer for the dynamic one
+			for i in rng.choice(sorted(model), min(len(model), 50), replace=False).tolist():
+				x, y = model[i]
+				x, y = (x + int(rng.integers(-15, 16))) % 1000, (y + int(rng.integers(-15, 16))) % 500
+				index.move(i, x, y)
+				model[i] = (x, y)
+		check(index, model, rng)
+
+def test_removed_ids_can_come_back():
+	rng = np.random.default_rng(0)
+	index = GridIndex()
+	ids = np.arange(4*BULK_MIN)
+	xy = np.stack([rng.integers(0, 1000, len(ids)), rng.integers(0, 500, len(ids))], axis=1)
+	index.insert_many(ids, xy)
+	index.remove_many(ids[::2])
+	# The same ids in a new run at new positions; their rows in the old run must stay dead
+	index.insert_many(ids[::2], 999 - xy[::2])
+	model = dict(zip(ids[1::2].tolist(), map(tuple, xy[1::2].tolist())))
+	model.update(zip(ids[::2].tolist(), map(tuple, (999 - xy[::2]).tolist())))
+	check(index, model, rng)
+	index.clear()
+	check(index, {}, rng)
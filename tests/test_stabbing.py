@@ -0,0 +1,73 @@
+"""Wedge queries through the quadtrees against testing every primitive."""
+import numpy as np
+import pytest
+
+from engine import DIVIDER, Scene
+from stabbing import Stabbing, Wedge
+
+
+def brute_force(scene, segment=None, ray=None):
+	"""Every live primitive whose point or dual point the wedge holds, O(n)."""
+	if segment is not None:
+		coords = scene.segments.coords[segment]
+		wedge = Wedge.of_segment(coords.reshape(2, 2))
+	else:
+		coords = scene.rays.coords[ray]
+		wedge = Wedge.of_ray(coords)
+	half = coords[0] > DIVIDER
+	found = []
+	for pool, field, side, own in ((scene.points, 'xy', not half, None), (scene.segments, 'dual', half, segment),
+									(scene.rays, 'dual', half, ray)):
+		ids = pool.ids()
+		x = pool.xy[ids, 0] if field == 'xy' else pool.coords[ids, 0]
+		ids = ids[(x > DIVIDER) == side]
+		ids = ids[wedge.contains(getattr(pool, field)[ids])]
+		found.append(ids[ids != own] if own is not None else ids)
+	return tuple(found)
+
+def check(stabbing, scene):
+	for s in scene.segments.ids().tolist():
+		for got, expected in zip(stabbing.stabbed(scene, segment=s), brute_force(scene, segment=s)):
+			np.testing.assert_array_equal(got, expected)
+	for r in scene.rays.ids().tolist():
+		for got, expected in zip(stabbing.stabbed(scene, ray=r), brute_force(scene, ray=r)):
+			np.testing.assert_array_equal(got, expected)
+
+def make_scene(rng, n=50):
+	scene = Scene()
+	ids = scene.add_points(np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1))
+	for half in range(2):
+		side = ids[(scene.points.xy[ids, 0] > DIVIDER) == bool(half)]
+		for p1, p2 in rng.choice(side, (5, 2), replace=False).tolist():
+			scene.connect(p1, p2)
+		for p in rng.choice(side, 3, replace=False).tolist():
+			scene.finish_ray(scene.add_ray(p, int(rng.integers(0, 500)) + 500*half, int(rng.integers(0, 500))))
+	return scene
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_stabbed_after_moves(seed):
+	rng = np.random.default_rng(seed)
+	scene, stabbing = make_scene(rng), Stabbing()
+	check(stabbing, scene)
+	for _ in range(10):
+		# A drag: active while it lasts, then put down, all without a new scene version
+		p = int(rng.choice(scene.points.ids()))
+		seg_changed, ray_changed = scene.incident(p)
+		stabbing.mark_moved(([p], [s for s, slot in seg_changed], ray_changed))
+		half = int(scene.points.xy[p, 0] > DIVIDER)
+		for _ in range(3):
+			scene.move_point(p, int(rng.integers(0, 495)) + 505*half, int(rng.integers(0, 500)), seg_changed, ray_changed)
+		check(stabbing, scene)
+
+		# A selection dragged as a whole
+		selection = rng.choice(scene.points.ids(), 5, replace=False)
+		segments, rays = scene.incident_many(selection)
+		stabbing.mark_moved((selection.tolist(), segments.tolist(), rays.tolist()))
+		scene.move_points(selection, int(rng.integers(-30, 30)), int(rng.integers(-30, 30)), segments, rays)
+		check(stabbing, scene)
+
+	# A new version rebuilds the indexes from where everything is now
+	scene.delete_points(scene.points.ids()[:3])
+	check(stabbing, scene)
+	assert not any(stabbing.moved)
@@ -0,0 +1,114 @@
+"""Pool and Adjacency against plain Python dicts under random edits."""
+import numpy as np
+import pytest
+
+from store import Adjacency, Pool
+
+
+def check_pool(pool, model):
+	"""The pool holds exactly the model, and every id below size is either live or free."""
+	assert len(pool) == len(model)
+	assert pool.ids().tolist() == sorted(model)
+	assert sorted(pool.free) == sorted(set(range(pool.size)) - set(model))
+	for i, value in model.items():
+		assert i in pool and pool.xy[i].tolist() == value
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pool_matches_dict(seed):
+	rng = np.random.default_rng(seed)
+	pool = Pool({'xy': (np.int64, (2,))}, capacity=4)
+	model = {}
+	removed = []
+	for _ in range(200):
+		kind = rng.integers(5)
+		if kind == 0:
+			value = rng.integers(0, 1000, 2).tolist()
+			free = set(pool.free)
+			i = pool.add(xy=value)
+			# A free id is reused before the pool grows
+			assert i in free if free else i == pool.size - 1
+			model[i] = value
+		elif kind == 1:
+			n = int(rng.integers(0, 20))
+			values = rng.integers(0, 1000, (n, 2))
+			free, size = set(pool.free), pool.size
+			ids = pool.add_many(n, xy=values)
+			assert len(set(ids.tolist())) == n
+			assert set(ids.tolist()) <= free | set(range(size, size + n))
+			assert pool.size == size + max(0, n - len(free))
+			model.update(zip(ids.tolist(), values.tolist()))
+		elif kind in (2, 3) and model:
+			ids = rng.choice(sorted(model), int(rng.integers(1, min(len(model), 10) + 1)), replace=False)
+			if kind == 2:
+				pool.remove_many(ids)
+			else:
+				for i in ids.tolist():
+					pool.remove(i)
+			removed.append({i: model.pop(i) for i in ids.tolist()})
+		elif kind == 4 and removed:
+			# Undo puts removed primitives back under their ids, usually the last ones
+			back = removed.pop(-1 if rng.random() < 0.5 else int(rng.integers(len(removed))))
+			back = {i: v for i, v in back.items() if i not in model}
+			ids = np.array(sorted(back), dtype=np.int64)
+			pool.put_many(ids, xy=np.array([back[i] for i in ids.tolist()]).reshape(-1, 2))
+			model.update(back)
+		check_pool(pool, model)
+
+def test_pool_put_past_size():
+	pool = Pool({'xy': (np.int64, (2,))}, capacity=2)
+	pool.put_many([5, 2], xy=[[1, 2], [3, 4]])
+	check_pool(pool, {5: [1, 2], 2: [3, 4]})
+	assert pool.size == 6
+	# The skipped ids are handed out before new ones
+	assert sorted(pool.add_many(4).tolist()) == [0, 1, 3, 4]
+	assert pool.add() == 6
+
+def test_pool_load():
+	alive = np.array([True, False, True, False])
+	xy = np.arange(8, dtype=np.int64).reshape(4, 2)
+	pool = Pool({'xy': (np.int64, (2,))})
+	pool.load(alive, xy=xy)
+	check_pool(pool, {0: [0, 1], 2: [4, 5]})
+	ids = pool.add_many(3, xy=np.full((3, 2), 9))
+	assert sorted(ids.tolist()) == [1, 3, 4]
+	assert pool.xy[[0, 2]].tolist() == [[0, 1], [4, 5]]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_adjacency_matches_dict(seed):
+	rng = np.random.default_rng(seed)
+	adjacency = Adjacency()
+	model = {}
+	serial = 0
+	for _ in range(200):
+		kind = rng.integers(4)
+		if kind == 0:
+			# A batch spliced into the layout, sometimes only past its last point
+			n = int(rng.integers(0, 30))
+			low = len(adjacency.offsets) - 1 if rng.random() < 0.3 else 0
+			owners = rng.integers(low, low + 40, n)
+			ids = np.arange(serial, serial + n)
+			serial += n
+			adjacency.add_many(owners, ids)
+			for p, i in zip(owners.tolist(), ids.tolist()):
+				model.setdefault(p, set()).add(i)
+		elif kind == 1:
+			p = int(rng.integers(0, 60))
+			adjacency.add(p, serial)
+			model.setdefault(p, set()).add(serial)
+			serial += 1
+		elif kind == 2 and model:
+			p = int(rng.choice(sorted(model)))
+			if model[p]:
+				i = int(rng.choice(sorted(model[p])))
+				adjacency.discard(p, i)
+				model[p].discard(i)
+		elif kind == 3:
+			p = int(rng.integers(0, 60))
+			assert adjacency.pop(p) == model.pop(p, set())
+
+		points = np.arange(80)
+		assert adjacency.degree(points).tolist() == [len(model.get(p, ())) for p in points.tolist()]
+		for p in points.tolist():
+			assert adjacency.get(p) == model.get(p, set())
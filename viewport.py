@@ -0,0 +1,463 @@
+"""
+World-to-screen transforms for the two half-planes, and view culling.
+
+Scene coordinates are world coordinates. At the default view they are the
+same as screen pixels; each half-plane can then be zoomed in and panned on
+its own. The x-extent of a half-plane is fixed by the duality (everything
+left of the divider belongs to the left plane), so a view never shows more
+than its half in x: it zooms in from 1x and pans within its half. It can pan
+freely in y.
+
+Nothing in here imports pygame, screen rects are plain (x, y, w, h) tuples.
+"""
+import numpy as np
+
+from arrangement import SCALE
+from engine import DIVIDER, HEIGHT, LEFT_ORIGIN, RIGHT_ORIGIN, CENTER_Y, WIDTH
+from spatial import BULK_MIN, GridIndex
+from stabbing import dual_form
+
+MAX_ZOOM = 64
+BOX_CELL = 8		# Side of the smallest boxes in the segment index, each level doubles it
+WEDGE_SLACK = 2		# World units wedges are grown by, for the rounding of their dual points
+
+
+class Viewport:
+	"""
+	Pan and zoom of one half-plane.
+
+	Attributes:
+		half (int): 0 for the left half-plane, 1 for the right one
+		zoom (float): Screen pixels per world unit, at least 1
+		cx (float): World x-coordinate shown at the center of the half
+		cy (float): World y-coordinate shown at the center of the half
+	"""
+	def __init__(self, half):
+		self.half = half
+		self.reset()
+
+	def reset(self):
+		"""Go back to the default view, where world and screen coordinates match."""
+		self.zoom = 1.0
+		self.cx = float(RIGHT_ORIGIN if self.half else LEFT_ORIGIN)
+		self.cy = float(CENTER_Y)
+
+	def key(self):
+		"""
+		Returns:
+			tuple: Changes whenever the transform changes
+		"""
+		return (self.zoom, self.cx, self.cy)
+
+	def screen_rect(self):
+		"""
+		Returns:
+			tuple: (x, y, w, h) area of the screen the half-plane is drawn in
+		"""
+		return (DIVIDER*self.half, 0, DIVIDER, HEIGHT)
+
+	def domain(self):
+		"""
+		Returns:
+			Tuple: (x0, x1) world x-extent of the half-plane
+		"""
+		return (DIVIDER, WIDTH) if self.half else (0, DIVIDER)
+
+	def to_screen(self, xy):
+		"""
+		Transform world coordinates to screen coordinates.
+
+		Args:
+			xy: (..., 2) array-like of world coordinates
+
+		Returns:
+			ndarray: (..., 2) int64 array of screen coordinates
+		"""
+		xy = np.asarray(xy, dtype=np.float64)
+		out = np.empty(xy.shape, dtype=np.int64)
+		out[..., 0] = np.round(DIVIDER*self.half + DIVIDER/2 + (xy[..., 0] - self.cx)*self.zoom)
+		out[..., 1] = np.round(HEIGHT/2 + (xy[..., 1] - self.cy)*self.zoom)
+		return out
+
+	def to_world(self, sx, sy):
+		"""
+		Transform a screen position to world coordinates.
+
+		Args:
+			sx: Screen x-coordinate
+			sy: Screen y-coordinate
+
+		Returns:
+			Tuple: (x, y) world coordinates as floats
+		"""
+		return (self.cx + (sx - DIVIDER*self.half - DIVIDER/2)/self.zoom,
+				self.cy + (sy - HEIGHT/2)/self.zoom)
+
+	def bounds(self):
+		"""
+		Returns:
+			Tuple: (x0, y0, x1, y1) world rectangle that is visible
+		"""
+		x0, y0 = self.to_world(DIVIDER*self.half, 0)
+		x1, y1 = self.to_world(DIVIDER*(self.half + 1), HEIGHT)
+		return x0, y0, x1, y1
+
+	def zoom_at(self, sx, sy, factor):
+		"""
+		Zoom by a factor, keeping the world point under a screen position in place.
+
+		Args:
+			sx: Screen x-coordinate
+			sy: Screen y-coordinate
+			factor: Zoom multiplier, > 1 zooms in
+		"""
+		x, y = self.to_world(sx, sy)
+		self.zoom = min(max(self.zoom*factor, 1.0), MAX_ZOOM)
+		self.cx = x - (sx - DIVIDER*self.half - DIVIDER/2)/self.zoom
+		self.cy = y - (sy - HEIGHT/2)/self.zoom
+		self.clamp()
+
+	def pan_to(self, cx, cy):
+		"""
+		Center the view on a world position, as far as the half-plane allows.
+
+		Args:
+			cx: World x-coordinate
+			cy: World y-coordinate
+		"""
+		self.cx, self.cy = cx, cy
+		self.clamp()
+
+	def clamp(self):
+		"""Keep the visible x-extent inside the half-plane."""
+		x0, x1 = self.domain()
+		margin = DIVIDER/2/self.zoom
+		self.cx = min(max(self.cx, x0 + margin), x1 - margin)
+
+
+class View:
+	"""
+	The viewports of both half-planes.
+
+	Attributes:
+		halves (list): Left and right Viewport
+	"""
+	def __init__(self):
+		self.halves = [Viewport(0), Viewport(1)]
+
+	def key(self):
+		"""
+		Returns:
+			tuple: Changes whenever either transform changes
+		"""
+		return tuple(viewport.key() for viewport in self.halves)
+
+	def to_screen(self, xy, half):
+		"""
+		Transform world coordinates to screen coordinates, each with the
+		viewport of its own half-plane.
+
+		Args:
+			xy: (..., 2) array-like of world coordinates
+			half: Half-plane of each position, an int or an array that
+				broadcasts against xy[..., 0]
+
+		Returns:
+			ndarray: (..., 2) int64 array of screen coordinates
+		"""
+		xy = np.asarray(xy, dtype=np.float64)
+		half = np.asarray(half)
+		zoom = np.array([viewport.zoom for viewport in self.halves])[half]
+		cx = np.array([viewport.cx for viewport in self.halves])[half]
+		cy = np.array([viewport.cy for viewport in self.halves])[half]
+		out = np.empty(xy.shape, dtype=np.int64)
+		out[..., 0] = np.round(DIVIDER*half + DIVIDER/2 + (xy[..., 0] - cx)*zoom)
+		out[..., 1] = np.round(HEIGHT/2 + (xy[..., 1] - cy)*zoom)
+		return out
+
+	def half_at(self, sx):
+		"""
+		Returns:
+			int: Half-plane under a screen x-coordinate
+		"""
+		return 0 if sx <= DIVIDER else 1
+
+	def to_world(self, sx, sy):
+		"""
+		Transform a screen position to integer world coordinates with the
+		viewport of the half-plane under it.
+
+		Args:
+			sx: Screen x-coordinate
+			sy: Screen y-coordinate
+
+		Returns:
+			Tuple: (x, y) world coordinates
+		"""
+		x, y = self.halves[self.half_at(sx)].to_world(sx, sy)
+		return int(round(x)), int(round(y))
+
+	def reset(self):
+		"""Reset both viewports."""
+		for viewport in self.halves:
+			viewport.reset()
+
+
+def _overlaps(lo, hi, bounds):
+	"""Check (n, 2) bounding boxes [lo, hi] against an (x0, y0, x1, y1) rectangle."""
+	x0, y0, x1, y1 = bounds
+	return (lo[:, 0] <= x1) & (hi[:, 0] >= x0) & (lo[:, 1] <= y1) & (hi[:, 1] >= y0)
+
+def _line_overlaps(lines, bounds):
+	"""Check (n, 4) lines [startx, starty, endx, endy] with startx < endx against a rectangle."""
+	x0, y0, x1, y1 = bounds
+	sx, sy, ex, ey = (lines[:, k].astype(np.float64) for k in range(4))
+	slope = (ey - sy)/(ex - sx)
+	ya = sy + slope*(np.maximum(x0, sx) - sx)
+	yb = sy + slope*(np.minimum(x1, ex) - sx)
+	return (np.minimum(ya, yb) <= y1) & (np.maximum(ya, yb) >= y0)
+
+def _distinct(ids, size):
+	"""Sort ids below size and drop the repeated ones with a mask, which is faster than np.unique."""
+	seen = np.zeros(size, dtype=bool)
+	seen[ids] = True
+	return np.flatnonzero(seen)
+
+def _form_range(f, bounds):
+	"""Find the smallest and largest values of (n, 3) linear forms [A, B, C] over a rectangle."""
+	x0, y0, x1, y1 = bounds
+	ax0, ax1, by0, by1 = f[:, 0]*x0, f[:, 0]*x1, f[:, 1]*y0, f[:, 1]*y1
+	return (np.minimum(ax0, ax1) + np.minimum(by0, by1) + f[:, 2],
+			np.maximum(ax0, ax1) + np.maximum(by0, by1) + f[:, 2])
+
+def _wedge_overlaps(f1, f2, bounds, closed=True):
+	"""
+	Check double wedges, given by the (n, 3) linear forms of stabbing.Wedge,
+	against a rectangle. A wedge misses it only when all four corners lie on
+	the same side of both edges, and as a rectangle is convex that decides.
+	A linear form is extreme at the corners, so only its range is needed.
+	"""
+	lo1, hi1 = _form_range(f1, bounds)
+	lo2, hi2 = _form_range(f2, bounds)
+	if closed:
+		return ~(((lo1 > 0) & (lo2 > 0)) | ((hi1 < 0) & (hi2 < 0)))
+	return ~(((lo1 > 0) & (lo2 >= 0)) | ((hi1 < 0) & (hi2 <= 0)))
+
+def _straight(dual_x, x):
+	"""Check whether dual points are across the divider from their primitive at x, rather than moved out of the half-plane."""
+	return np.where(x > DIVIDER, dual_x <= DIVIDER, dual_x >= DIVIDER) & (dual_x >= 0) & (dual_x <= WIDTH)
+
+def _dual_band(bounds, half, width):
+	"""
+	Cover the part of a half-plane whose dual lines cross a rectangle of the
+	other half-plane with one rectangle per column of the given width.
+
+	A position (x, y) at a from the origin of its half-plane in x has a dual
+	line at height 2*CENTER_Y - y + a*k, where k falls from 5 to -5 across
+	the other half-plane. Over a column the products a*k are extreme at the
+	ends of the column and of the k the rectangle spans, which bounds the
+	y-coordinates of the positions whose dual line can cross it.
+
+	Args:
+		bounds: (x0, y0, x1, y1) rectangle in the other half-plane
+		half: Half-plane to cover
+		width: Width of a column
+
+	Returns:
+		ndarray: (m, 4) [x0, y0, x1, y1] rectangles
+	"""
+	x0, y0, x1, y1 = bounds
+	start = 0 if half else DIVIDER
+	ua, ub = max(x0, start) - start, min(x1, start + DIVIDER) - start
+	if ua > ub:
+		return np.empty((0, 4))
+	k = np.array([(DIVIDER/2 - ub)/SCALE, (DIVIDER/2 - ua)/SCALE])
+	left = np.arange(DIVIDER*half, DIVIDER*(half + 1), width, dtype=np.float64)
+	right = np.minimum(left + width, DIVIDER*(half + 1))
+	origin = RIGHT_ORIGIN if half else LEFT_ORIGIN
+	a = np.stack([left - origin, right - origin], axis=1)
+	products = (a[:, :, None]*k).reshape(-1, 4)
+	# One unit of slack keeps the rounding of the float products on the safe side
+	return np.stack([left, 2*CENTER_Y + products.min(axis=1) - y1 - 1,
+					right, 2*CENTER_Y + products.max(axis=1) - y0 + 1], axis=1)
+
+def _wedge_boxes(scene, ids):
+	"""Bounding boxes (lo, hi) of the wedge polygons of segments, as they are drawn."""
+	eps = scene.segments.eps[ids]
+	corners = np.stack([scene.segments.dual[ids], *(scene.points.dual[eps[:, k]][:, c:c + 2]
+						for k in range(2) for c in (0, 2))], axis=1)
+	return corners.min(axis=1), corners.max(axis=1)
+
+def _segments_shown(scene, ids, own, other, half):
+	"""
+	Test segments of one half-plane against the views.
+
+	Args:
+		scene: Scene the segments are in
+		ids: (n,) segment ids
+		own: (x0, y0, x1, y1) view of their half-plane
+		other: View of the other half-plane, grown by WEDGE_SLACK
+		half: Half-plane of the segments
+
+	Returns:
+		ndarray: (n,) bool mask of the segments that show up
+	"""
+	coords, duals = scene.segments.coords[ids], scene.segments.dual[ids]
+	shown = _overlaps(np.minimum(coords[:, :2], coords[:, 2:]), np.maximum(coords[:, :2], coords[:, 2:]), own)
+	straight = _straight(duals[:, 0], coords[:, 0])
+	shown[straight] |= _wedge_overlaps(dual_form(coords[straight, :2], half), dual_form(coords[straight, 2:], half), other)
+	shown[~straight] |= _overlaps(*_wedge_boxes(scene, ids[~straight]), other)
+	return shown
+
+def _ray_table(scene, ids):
+	"""
+	Gather what culling needs to know about rays.
+
+	Args:
+		scene: Scene the rays are in
+		ids: (n,) ray ids
+
+	Returns:
+		Tuple: ids, (n,) right half-plane mask, (n, 2) lo and hi corners of
+		the rays, (n, 3) linear forms f1 and f2 of their wedges, and
+		(n,) mask of the rays whose dual point is straight
+	"""
+	coords, duals = scene.rays.coords[ids], scene.rays.dual[ids]
+	right = coords[:, 0] > DIVIDER
+	f1 = np.empty((len(ids), 3), dtype=np.int64)
+	for half in range(2):
+		mine = right == bool(half)
+		f1[mine] = dual_form(coords[mine, :2], half)
+	# Slope of each ray against the dual lines, as in stabbing.Wedge.of_ray
+	dx, dy = coords[:, 2] - coords[:, 0], coords[:, 3] - coords[:, 1]
+	f2 = np.stack([dx, np.zeros(len(ids), dtype=dx.dtype), SCALE*dy - dx*np.where(right, LEFT_ORIGIN, RIGHT_ORIGIN)], axis=1)
+	return (ids, right, np.minimum(coords[:, :2], coords[:, 2:]), np.maximum(coords[:, :2], coords[:, 2:]),
+			f1, f2, _straight(duals[:, 0], coords[:, 0]))
+
+def _rays_shown(table, bounds):
+	"""Test rays gathered with _ray_table() against the views of both half-planes, as a bool mask."""
+	ids, right, lo, hi, f1, f2, straight = table
+	shown = ~straight
+	for half in range(2):
+		mine = right == bool(half)
+		x0, y0, x1, y1 = bounds[1 - half]
+		grown = (x0 - WEDGE_SLACK, y0 - WEDGE_SLACK, x1 + WEDGE_SLACK, y1 + WEDGE_SLACK)
+		shown[mine] |= _overlaps(lo[mine], hi[mine], bounds[half]) | _wedge_overlaps(f1[mine], f2[mine], grown, closed=False)
+	return shown
+
+
+class Culler:
+	"""
+	Finds the primitives that show up in a view.
+
+	Points are looked up in the point grid of the scene, both where they are
+	and, for their dual lines, in the band of positions whose dual line can
+	cross the view of the other half-plane. A wedge is where the dual lines
+	of the points of its primitive go, so segments are looked up the same
+	way, in a static index of their bounding boxes: boxes are sorted into
+	levels by size, each level a GridIndex over the top-left corners whose
+	cells are as big as its boxes, so a box overlapping a rectangle has its
+	corner in the rectangle grown by one cell up and left. The candidates are
+	then tested exactly, so culling costs about as much as what shows up
+	rather than as the whole scene.
+
+	Dual points are rounded, and those of steep segments and rays are moved
+	to a fixed x-coordinate out of the half-plane, which bends their wedges.
+	Wedges are tested with WEDGE_SLACK to spare for the rounding, and the
+	bent ones against the bounding box of their polygons, as they are drawn.
+	Rays reach the edge of their half-plane and cannot be indexed by their
+	boxes, so what the tests need of them is gathered once and they are
+	tested all at once.
+
+	Everything is rebuilt on the first query after the scene version
+	changes. Segments and rays moved since then (move_point and aim_ray
+	keep the version) are tested where they are now.
+
+	Attributes:
+		version (int): Scene version the indexes were built for, None before the first build
+		levels (list): (box size, GridIndex over the top-left corners) per level
+		few (tuple): Segments that are not indexed, with the bounding boxes
+			(lo, hi) of the segments and of their wedges: those of the levels
+			with few boxes, and the bent ones
+		rays (tuple): _ray_table() of every ray
+		moved (list): Sets of the segments and of the rays that were active since the rebuild
+	"""
+	def __init__(self):
+		self.version = None
+
+	def update(self, scene):
+		"""Rebuild the indexes if the scene was edited since they were built."""
+		if scene.version == self.version:
+			return
+		self.version = scene.version
+		self.moved = [set(), set()]
+		ids = scene.segments.ids()
+		coords = scene.segments.coords[ids]
+		lo, hi = np.minimum(coords[:, :2], coords[:, 2:]), np.maximum(coords[:, :2], coords[:, 2:])
+		level = np.ceil(np.log2(np.maximum((hi - lo).max(axis=1, initial=0), 1)/BOX_CELL)).clip(0).astype(np.int64)
+		self.levels = []
+		# Levels too small for the static layer of a GridIndex are tested one by one
+		few = ~_straight(scene.segments.dual[ids, 0], coords[:, 0])
+		for k in np.unique(level).tolist():
+			if (level == k).sum() < BULK_MIN:
+				few |= level == k
+				continue
+			index = GridIndex(cell=BOX_CELL << k)
+			index.insert_many(ids[level == k], lo[level == k])
+			self.levels.append((BOX_CELL << k, index))
+		self.few = (ids[few], lo[few], hi[few], *_wedge_boxes(scene, ids[few]))
+		self.rays = _ray_table(scene, scene.rays.ids())
+
+	def _segments(self, scene, own, other, half):
+		"""Find the live segments of a half-plane that may show up: indexed, not indexed or moved."""
+		ids, lo, hi, wedge_lo, wedge_hi = self.few
+		found = [ids[_overlaps(lo, hi, own) | _overlaps(wedge_lo, wedge_hi, other)],
+				np.array(sorted(self.moved[0]), dtype=np.int64)]
+		for size, index in self.levels:
+			rects = np.concatenate([[own], _dual_band(other, half, size)])
+			found.append(index.query_rects(rects - (size, size, 0, 0)))
+		ids = _distinct(np.concatenate(found), scene.segments.size)
+		ids = ids[scene.segments.alive[ids]]
+		return ids[(scene.segments.coords[ids, 0] > DIVIDER) == bool(half)]
+
+	def visible(self, scene, view, active=((), (), ())):
+		"""
+		Find the primitives that show up in the current view: the point or
+		segment itself in its half-plane, or its dual and wedge in the other one.
+
+		Args:
+			scene: Scene to cull
+			view: View to cull against
+			active: (point ids, segment ids, ray ids) that may have moved
+				since the scene version last changed
+
+		Returns:
+			Tuple: (points, segments, rays) sorted arrays of visible ids
+		"""
+		self.update(scene)
+		self.moved[0].update(active[1])
+		self.moved[1].update(active[2])
+		bounds = [viewport.bounds() for viewport in view.halves]
+		index = scene.point_index
+		points, segments = [], []
+		for half in range(2):
+			own, other = bounds[half], bounds[1 - half]
+
+			# Points are visible themselves or through their dual line
+			points.append(index.query_rect(*own))
+			ids = index.query_rects(_dual_band(other, half, index.cell))
+			ids = ids[(scene.points.xy[ids, 0] > DIVIDER) == bool(half)]
+			points.append(ids[_line_overlaps(scene.points.dual[ids], other)])
+
+			x0, y0, x1, y1 = other
+			grown = (x0 - WEDGE_SLACK, y0 - WEDGE_SLACK, x1 + WEDGE_SLACK, y1 + WEDGE_SLACK)
+			ids = self._segments(scene, own, grown, half)
+			segments.append(ids[_segments_shown(scene, ids, own, grown, half)])
+
+		rays = self.rays[0][_rays_shown(self.rays, bounds)]
+		if self.moved[1]:
+			moved = np.array(sorted(self.moved[1]), dtype=np.int64)
+			moved = moved[scene.rays.alive[moved]]
+			rays = np.concatenate([rays[~np.isin(rays, moved)], moved[_rays_shown(_ray_table(scene, moved), bounds)]])
+		return (_distinct(np.concatenate(points), scene.points.size),
+				_distinct(np.concatenate(segments), scene.segments.size), _distinct(rays, scene.rays.size))
@@ -0,0 +1,197 @@
+"""
+Background jobs that keep the main loop responsive.
+
+Long work (reading and parsing files, batch computations, analyses) runs on
+a pool of worker threads. Jobs that last as long as the program, like a live
+feed, get a daemon thread of their own instead, so they never hold a worker
+the other jobs wait for. A job never touches the scene: it yields results
+that are put on a bounded queue, and the main loop applies them to the scene
+with step(), spending at most a time budget per frame. The bounded queue
+also keeps memory in check when the workers are faster than the main loop.
+
+	pool = WorkerPool()
+	job = pool.submit('Import', lambda job: parse_file(path, progress=job.report),
+					lambda arrays: add_chunk(scene, arrays))
+	...
+	pool.step(0.008)	# once per frame
+"""
+import queue, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+
+
+class Job:
+	"""
+	Handle on a background job, shared by the worker and the main loop.
+
+	Attributes:
+		name (str): Shown in progress reports
+		done (int): Work done so far, in units of the job's choosing
+		total (int): Total work, or None if unknown
+		running (bool): True until the work function returns
+		finished (bool): Set once the worker is done and every result was applied or dropped
+		error (Exception): Raised by the work function, or None
+		cancelled (Event): Set to ask the worker to stop
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.done = 0
+		self.total = None
+		self.running = True
+		self.finished = False
+		self.error = None
+		self.cancelled = threading.Event()
+
+	def cancel(self):
+		"""Ask the job to stop; results not applied yet are dropped."""
+		self.cancelled.set()
+
+	def report(self, done, total=None):
+		"""
+		Report progress, called from the work function.
+
+		Args:
+			done: Work done so far
+			total: Total work, or None to keep the previous value
+		"""
+		self.done = done
+		if total is not None:
+			self.total = total
+
+	def fraction(self):
+		"""
+		Get the progress of the job.
+
+		Returns:
+			float: Fraction of the work done, or None if the total is unknown
+		"""
+		return min(1.0, self.done/self.total) if self.total else None
+
+
+class WorkerPool:
+	"""
+	Runs jobs on worker threads and hands their results to the main loop.
+
+	Attributes:
+		executor (ThreadPoolExecutor): Worker threads
+		results (Queue): (job, apply, result) triples waiting to be applied;
+			apply is None for the marker a job puts when its worker is done.
+			Results of cancelled jobs are dropped when they come out.
+		jobs (list): Jobs that are not finished, oldest first
+	"""
+	def __init__(self, workers=None, queue_size=None):
+		self.executor = ThreadPoolExecutor(workers or settings.WORKERS, thread_name_prefix='duality-worker')
+		self.results = queue.Queue(queue_size or settings.WORKER_QUEUE)
+		self.jobs = []
+
+	def submit(self, name, work, apply, dedicated=False):
+		"""
+		Start a job.
+
+		Args:
+			name: Name of the job
+			work: Called as work(job) on a worker thread, returns an iterable of
+				results. It must not modify the scene; it can call job.report()
+				and should stop early when job.cancelled is set.
+			apply: Called as apply(result) on the main loop for every result
+			dedicated: Run the job on a daemon thread of its own rather than on
+				a worker, for jobs that may never end
+
+		Returns:
+			Job: Handle on the job
+		"""
+		job = Job(name)
+		self.jobs.append(job)
+		if dedicated:
+			threading.Thread(target=self._run, args=(job, work, apply), name=f'duality-{name}', daemon=True).start()
+		else:
+			self.executor.submit(self._run, job, work, apply)
+		return job
+
+	def _run(self, job, work, apply):
+		"""Worker thread body: push every result of a job onto the queue."""
+		try:
+			for result in work(job):
+				if not self._put(job, (job, apply, result)):
+					break
+		except Exception as e:
+			job.error = e
+		finally:
+			job.running = False
+			self._put(job, (job, None, None))
+
+	def _put(self, job, item):
+		"""Wait for room in the queue unless the job is cancelled meanwhile."""
+		while not job.cancelled.is_set():
+			try:
+				self.results.put(item, timeout=0.05)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def busy(self):
+		"""
+		Check whether any job is still running or has results to apply.
+
+		Returns:
+			bool: True until every job is finished
+		"""
+		return bool(self.jobs)
+
+	def step(self, budget=None):
+		"""
+		Apply queued results on the calling thread until the time budget is
+		spent. At least one result is applied if there is any, so every job
+		makes progress however small the budget.
+
+		Args:
+			budget: Seconds to spend, settings.WORKER_BUDGET_MS if None
+
+		Returns:
+			list: Jobs that finished during this step
+		"""
+		if budget is None:
+			budget = settings.WORKER_BUDGET_MS/1000
+		finished = []
+		deadline = time.perf_counter() + budget
+		while True:
+			try:
+				job, apply, result = self.results.get_nowait()
+			except queue.Empty:
+				break
+			if apply is None:
+				self._finish(job, finished)
+			elif not job.cancelled.is_set():
+				try:
+					apply(result)
+				except Exception as e:
+					job.error = e
+					job.cancel()
+			if time.perf_counter() >= deadline:
+				break
+
+		# A cancelled job may never get its end marker through a full queue
+		for job in [job for job in self.jobs if job.cancelled.is_set() and not job.running]:
+			self._finish(job, finished)
+		return finished
+
+	def _finish(self, job, finished):
+		if not job.finished:
+			job.finished = True
+			self.jobs.remove(job)
+			finished.append(job)
+
+	def cancel_all(self):
+		"""Cancel every job; they are finished on the next steps."""
+		for job in self.jobs:
+			job.cancel()
+
+	def shutdown(self):
+		"""Cancel every job and wait for the worker threads to exit."""
+		self.cancel_all()
+		while self.jobs:
+			if not self.step(0.01):
+				time.sleep(0.01)
+		self.executor.shutdown()